@@ -1,6 +1,155 @@
-import lime.lime_tabular as lt
+import json
+import os
 import tensorflow as tf
 import numpy as np
+from importance import lime_importances, occlusion_importances, sort_coordinates
+
+def build_layers(input_shape, outputs, filters = (32, 64), dense = 100, dropout = 0.5):
+    """
+    Layers of the completion CNN: two Conv2D/BatchNorm/MaxPool blocks followed by a dense regression head.
+
+    Parameters
+    ----------
+    input_shape : tuple
+        The shape of the input matrices extended by a 1-valued position (e.g (N, M, 1) for N x M matrices).
+    outputs : int
+        Number of values predicted by the head.
+    filters : tuple
+        Number of filters of the two convolution blocks.
+    dense : int
+        Number of units of the hidden dense layer.
+    dropout : float
+        Dropout rate of the hidden dense layer.
+
+    Returns
+    -------
+    list
+        list of Keras layers, starting with the flat input.
+    """
+    inter_act = 'relu'
+    return [
+        tf.keras.Input(shape=(input_shape[0]*input_shape[1],)),
+        tf.keras.layers.Reshape(input_shape),
+        tf.keras.layers.Conv2D(filters[0], (2,2), kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2(), padding='same', input_shape=(12,12,1)),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Activation(inter_act),
+        tf.keras.layers.MaxPooling2D(2,2),
+        tf.keras.layers.Conv2D(filters[1], (2,2), kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2(), padding='same'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.Activation(inter_act),
+        tf.keras.layers.MaxPooling2D(2,2),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(dense, activation=inter_act, kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2()), 
+        tf.keras.layers.Dropout(dropout),
+        tf.keras.layers.Dense(outputs, activation='linear')
+    ]
+
+def export_model(model, path, dtype = np.float32):
+    """
+    Export a Keras completion model to the .npz inference format read by lite_model.LiteModel,
+    folding batch normalization into the preceding convolution or dense layer.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        trained Sequential model built from build_layers.
+    path : str
+        destination .npz file.
+    dtype : numpy.dtype
+        data type of the stored weights (e.g. np.float16 to halve the artifact size).
+    """
+    ops = []
+    weights = {}
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.Reshape):
+            ops.append({'op': 'reshape', 'shape': list(layer.target_shape)})
+        elif isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)):
+            kernel, bias = [w.numpy() if hasattr(w, 'numpy') else np.asarray(w) for w in (layer.kernel, layer.bias)]
+            name = f'w{len(weights) // 2}'
+            weights[name + '_kernel'], weights[name + '_bias'] = kernel, bias
+            activation = layer.activation.__name__
+            if activation not in ('relu', 'linear'):
+                raise ValueError(f'Unsupported activation {activation} in layer {layer.name}')
+            op = {'op': 'conv2d' if isinstance(layer, tf.keras.layers.Conv2D) else 'dense', 'kernel': name + '_kernel', 'bias': name + '_bias', 'activation': activation}
+            if op['op'] == 'conv2d':
+                if tuple(layer.strides) != (1, 1) or tuple(layer.dilation_rate) != (1, 1):
+                    raise ValueError(f'Unsupported strides or dilation in layer {layer.name}')
+                op['padding'] = layer.padding
+            ops.append(op)
+        elif isinstance(layer, tf.keras.layers.BatchNormalization):
+            previous = ops[-1]
+            if previous['op'] not in ('conv2d', 'dense') or previous['activation'] != 'linear':
+                raise ValueError(f'Batch normalization {layer.name} does not follow a linear convolution or dense layer')
+            gamma, beta, mean, variance = [w.numpy() for w in (layer.gamma, layer.beta, layer.moving_mean, layer.moving_variance)]
+            factor = gamma / np.sqrt(variance + layer.epsilon)
+            weights[previous['kernel']] = weights[previous['kernel']] * factor
+            weights[previous['bias']] = (weights[previous['bias']] - mean) * factor + beta
+        elif isinstance(layer, tf.keras.layers.Activation):
+            ops.append({'op': 'activation', 'activation': layer.activation.__name__})
+        elif isinstance(layer, tf.keras.layers.MaxPooling2D):
+            if tuple(layer.strides) != tuple(layer.pool_size) or layer.padding != 'valid':
+                raise ValueError(f'Unsupported pooling configuration in layer {layer.name}')
+            ops.append({'op': 'maxpool', 'pool_size': list(layer.pool_size)})
+        elif isinstance(layer, tf.keras.layers.Flatten):
+            ops.append({'op': 'flatten'})
+        elif not isinstance(layer, tf.keras.layers.Dropout):
+            raise ValueError(f'Unsupported layer {layer.name} of type {type(layer).__name__}')
+    weights = {name: weight.astype(dtype) for name, weight in weights.items()}
+    np.savez(path, ops=json.dumps(ops), **weights)
+
+def quantize_model(model, path, mode = 'dynamic', representative_X = None, num_calibration = 200):
+    """
+    Post-training quantization of a Keras completion model to a .tflite file, keeping float32 inputs and outputs.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        trained model.
+    path : str
+        destination .tflite file.
+    mode : str
+        'dynamic' for int8 weights with dynamic-range activations, 'float16' for float16 weights,
+        'int8' for full-integer weights and activations calibrated on representative_X.
+    representative_X : NDArray
+        samples drawn from the training data, required by 'int8'.
+    num_calibration : int
+        maximum number of representative samples used for calibration.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if representative_X is None:
+            raise ValueError('Full-integer quantization requires representative samples.')
+        representative_X = np.asarray(representative_X, dtype=np.float32)
+        indices = np.random.choice(len(representative_X), min(num_calibration, len(representative_X)), replace=False)
+        converter.representative_dataset = lambda: ([representative_X[i:i + 1]] for i in indices)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'dynamic':
+        raise ValueError(f'Unsupported quantization mode {mode}, expected one of dynamic, float16, int8.')
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+def regression_metrics(y_true, y_pred):
+    """
+    MAE and MAPE of a batch of predictions, computed as the Keras metrics the models are compiled with.
+
+    Parameters
+    ----------
+    y_true : NDArray
+        truth values.
+    y_pred : NDArray
+        predictions, reshaped to the shape of y_true.
+
+    Returns
+    -------
+    dict
+        {'mae': ..., 'mape': ...}
+    """
+    y_true = np.asarray(y_true, dtype=np.float64)
+    errors = np.abs(np.reshape(y_pred, y_true.shape) - y_true)
+    return {'mae': float(errors.mean()), 'mape': float(100 * (errors / np.maximum(np.abs(y_true), 1e-7)).mean())}
 
 class CNN:
     """
@@ -22,62 +171,245 @@ class CNN:
         Make a prediction on a batch of traffic matrices.
     """
     
-    def __init__(self, input_shape, target_coordinate) -> None:
+    def __init__(self, input_shape, target_coordinate, learning_rate = 5e-5, filters = (32, 64), dense = 100, dropout = 0.5, summary = True) -> None:
         """
         Initialize the Traffic Matrix Completion model.
-        
+
         Parameters
         ----------
         input_shape : tuple
             The shape of the input matrices extended by a 1-valued position (e.g (N, M, 1) for N x M matrices).
         target_coordinate : tuple
             The coordinate of the missing value to predict (e.g. coordinate (i,j)) .
+        learning_rate : float
+            Learning rate of the Adam optimizer.
+        filters : tuple
+            Number of filters of the two convolution blocks.
+        dense : int
+            Number of units of the hidden dense layer.
+        dropout : float
+            Dropout rate of the hidden dense layer.
+        summary : bool
+            Whether to print the model summary.
         """
         self.input_shape = input_shape
         self.target_coordinate = target_coordinate
-        inter_act = 'relu'
-        dense = 100
-        self.model = tf.keras.models.Sequential([
-            tf.keras.Input(shape=(input_shape[0]*input_shape[1],)),
-            tf.keras.layers.Reshape(input_shape),
-            tf.keras.layers.Conv2D(32, (2,2), kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2(), padding='same', input_shape=(12,12,1)),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Activation(inter_act),
-            tf.keras.layers.MaxPooling2D(2,2),
-            tf.keras.layers.Conv2D(64, (2,2), kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2(), padding='same'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Activation(inter_act),
-            tf.keras.layers.MaxPooling2D(2,2),
-            tf.keras.layers.Flatten(),
-            tf.keras.layers.Dense(dense, activation=inter_act, kernel_initializer='random_uniform', bias_initializer='zeros', bias_regularizer=tf.keras.regularizers.l2(), kernel_regularizer=tf.keras.regularizers.l2()), 
-            tf.keras.layers.Dropout(0.5),
-            tf.keras.layers.Dense(1, activation='linear')
-        ])
-        self.model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=5e-5), loss='mse', metrics=['mae', 'mape'])
-        self.model.summary()
+        self.model_path = None
+        self.model = tf.keras.models.Sequential(build_layers(input_shape, 1, filters, dense, dropout))
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), loss='mse', metrics=['mae', 'mape'])
+        if summary:
+            self.model.summary()
 
-    def train(self, train_X, train_Y, test_X, test_Y, model_path):
+    @classmethod
+    def load(cls, model_path, target_coordinate):
+        """
+        Load a model previously trained and saved with train.
+
+        Parameters
+        ----------
+        model_path : str
+            Path the model was saved in.
+        target_coordinate : tuple
+            The coordinate of the missing value the model predicts.
+
+        Returns
+        -------
+        CNN
+            the loaded model.
+        """
+        cnn = cls.__new__(cls)
+        cnn.model = tf.keras.models.load_model(model_path)
+        shape = cnn.model.layers[0].target_shape if isinstance(cnn.model.layers[0], tf.keras.layers.Reshape) else None
+        cnn.input_shape = tuple(shape) if shape is not None else None
+        cnn.target_coordinate = target_coordinate
+        cnn.model_path = model_path
+        return cnn
+
+    def train(self, train_X, train_Y, test_X, test_Y, model_path, epochs = 300, batch_size = 64, patience = 10, verbose = 'auto'):
         """
         Train the model using matrix data and save it in the specified path.
+        Streaming sources are supported by passing tf.data datasets of (x, y) batches (see pipeline.split_datasets)
+        as train_X and test_X, in which case train_Y and test_Y are ignored.
         
         Parameters
         ----------
-        train_X : NDArray
-            A numpy array of training traffic matrices.
+        train_X : NDArray or tf.data.Dataset
+            A numpy array of training traffic matrices, or a dataset of (x, y) training batches.
         train_Y : NDArray
             A numpy array of training floating point truth values.
-        test_ : NDArray
-            A numpy array of test traffic matrices.
+        test_ : NDArray or tf.data.Dataset
+            A numpy array of test traffic matrices, or a dataset of (x, y) test batches.
         test_Y : NDArray
             A numpy array of test floating point truth values.
         model_path : str
             Path to save trained model in after training .
+        epochs : int
+            Maximum number of training epochs, training stops earlier once the validation loss stops improving.
+        batch_size : int
+            Number of samples per batch, ignored for datasets.
+        patience : int
+            Number of epochs without validation loss improvement before stopping.
+        verbose : str or int
+            Verbosity of Keras fit.
+
+        Returns
+        -------
+        tf.keras.callbacks.History
+            the training history, with the loss and metrics of every epoch.
         """
-        if train_X.shape[1] != self.input_shape[0]*self.input_shape[1] or test_X.shape[1] != self.input_shape[0]*self.input_shape[1]:
-            raise ValueError(f'Provided data does not match model input shape')
-        cb = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience = 10, mode = 'min', restore_best_weights = True, verbose = 1)
-        self.model.fit(train_X, train_Y, epochs=300, batch_size=64, validation_data=(test_X, test_Y), callbacks=[cb])
+        cb = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience = patience, mode = 'min', restore_best_weights = True, verbose = 1 if verbose else 0)
+        if isinstance(train_X, tf.data.Dataset):
+            if train_X.element_spec[0].shape[-1] != self.input_shape[0]*self.input_shape[1] or test_X.element_spec[0].shape[-1] != self.input_shape[0]*self.input_shape[1]:
+                raise ValueError(f'Provided data does not match model input shape')
+            history = self.model.fit(train_X, epochs=epochs, validation_data=test_X, callbacks=[cb], verbose=verbose)
+        else:
+            if train_X.shape[1] != self.input_shape[0]*self.input_shape[1] or test_X.shape[1] != self.input_shape[0]*self.input_shape[1]:
+                raise ValueError(f'Provided data does not match model input shape')
+            history = self.model.fit(train_X, train_Y, epochs=epochs, batch_size=batch_size, validation_data=(test_X, test_Y), callbacks=[cb], verbose=verbose)
         self.model.save(model_path)
+        self.model_path = model_path
+        return history
+
+    def fine_tune(self, train_X, train_Y, test_X, test_Y, model_path, replay_X = None, replay_Y = None, learning_rate = None, epochs = 30, batch_size = 64, patience = 5, verbose = 'auto'):
+        """
+        Continue training the current weights (e.g. of a model obtained with load) on a new window of data,
+        optionally mixed with a replay sample of older data so the model does not forget it, and save it in the specified path.
+
+        Parameters
+        ----------
+        train_X : NDArray
+            A numpy array of training traffic matrices of the new window.
+        train_Y : NDArray
+            A numpy array of training floating point truth values of the new window.
+        test_X : NDArray
+            A numpy array of test traffic matrices.
+        test_Y : NDArray
+            A numpy array of test floating point truth values.
+        model_path : str
+            Path to save the model in after training.
+        replay_X : NDArray
+            Optional numpy array of older training traffic matrices, shuffled with the new window.
+        replay_Y : NDArray
+            Truth values of replay_X.
+        learning_rate : float
+            Learning rate of the fine-tuning, None to keep the current one.
+        epochs : int
+            Maximum number of training epochs.
+        batch_size : int
+            Number of samples per batch.
+        patience : int
+            Number of epochs without validation loss improvement before stopping.
+        verbose : str or int
+            Verbosity of Keras fit.
+
+        Returns
+        -------
+        tf.keras.callbacks.History
+            the fine-tuning history.
+        """
+        if replay_X is not None and len(replay_X) > 0:
+            train_X = np.concatenate([train_X, replay_X])
+            train_Y = np.concatenate([train_Y, replay_Y])
+            permutation = np.random.permutation(len(train_X))
+            train_X, train_Y = train_X[permutation], train_Y[permutation]
+        if learning_rate is not None:
+            self.model.optimizer.learning_rate.assign(learning_rate)
+        return self.train(train_X, train_Y, test_X, test_Y, model_path, epochs, batch_size, patience, verbose)
+
+    def evaluate(self, test_X, test_Y):
+        """
+        Error metrics of the model on test data.
+
+        Parameters
+        ----------
+        test_X : NDArray
+            A numpy array of test traffic matrices.
+        test_Y : NDArray
+            A numpy array of test floating point truth values.
+
+        Returns
+        -------
+        dict
+            {'mae': ..., 'mape': ...}
+        """
+        return regression_metrics(test_Y, self.predict(test_X))
+
+    def export(self, path, dtype = np.float32):
+        """
+        Export the model to a compact .npz artifact that lite_model.LiteModel can run without TensorFlow.
+
+        Parameters
+        ----------
+        path : str
+            destination .npz file.
+        dtype : numpy.dtype
+            data type of the stored weights.
+        """
+        export_model(self.model, path, dtype)
+
+    def quantize(self, path, mode = 'dynamic', representative_X = None):
+        """
+        Post-training quantization of the model to a .tflite file, loadable with lite_model.TFLiteModel.
+
+        Parameters
+        ----------
+        path : str
+            destination .tflite file.
+        mode : str
+            'dynamic', 'float16' or 'int8' (full-integer, calibrated on representative_X).
+        representative_X : NDArray
+            training samples used to calibrate 'int8' quantization.
+        """
+        quantize_model(self.model, path, mode, representative_X)
+
+    def quantization_report(self, test_X, test_Y, dest_dir, representative_X = None, modes = ('dynamic', 'float16', 'int8'), batch_size = 64, repeat = 20):
+        """
+        Quantize the model in every mode and compare accuracy, size and per-batch latency with the float model.
+
+        Parameters
+        ----------
+        test_X : NDArray
+            A numpy array of test traffic matrices.
+        test_Y : NDArray
+            A numpy array of test floating point truth values.
+        dest_dir : str
+            directory to write the quantized models in, as model_<mode>.tflite.
+        representative_X : NDArray
+            training samples used to calibrate 'int8' quantization, required by that mode. Never test_X, whose
+            accuracy would then be measured on the calibration data.
+        modes : tuple
+            quantization modes to evaluate.
+        batch_size : int
+            batch size of the latency measurement.
+        repeat : int
+            number of timed batches per model.
+
+        Returns
+        -------
+        dict
+            {'mae', 'mape', 'bytes', 'batch_latency'} keyed by 'float' and by quantization mode.
+        """
+        import time
+        from lite_model import TFLiteModel
+        if 'int8' in modes and representative_X is None:
+            raise ValueError('Full-integer quantization requires representative samples.')
+        batch = np.asarray(test_X[:batch_size], dtype=np.float32)
+        def measure(predict, nbytes):
+            report = regression_metrics(test_Y, predict(test_X))
+            predict(batch)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                predict(batch)
+            report['batch_latency'] = (time.perf_counter() - start) / repeat
+            report['bytes'] = nbytes
+            return report
+        reports = {'float': measure(self.predict, sum(w.numpy().nbytes for w in self.model.weights))}
+        for mode in modes:
+            path = os.path.join(dest_dir, f'model_{mode}.tflite')
+            self.quantize(path, mode, representative_X)
+            model = TFLiteModel(path)
+            reports[mode] = measure(model.predict, model.nbytes)
+        return reports
 
     def predict(self, data_X):
         """
@@ -93,13 +425,16 @@ class CNN:
         list
             list of predictions.
         """
-        if len(data_X) == 1:
-            data_X = np.expand_dims(data_X, -1)
-        return self.model.predict(data_X)
+        if np.ndim(data_X) == 1:
+            data_X = np.expand_dims(data_X, 0)
+        if len(data_X) <= 1024:
+            # A direct call avoids the per-call setup of model.predict, which dominates small batches
+            return self.model(data_X, training=False).numpy()
+        return self.model.predict(data_X, verbose=0)
     
-    def lime(self, train_X, test_X, dest_dir = None):
+    def lime(self, train_X, test_X, dest_dir = None, num_instances = 500):
         """
-        Computes average feature (traffic flow) importance over 500 random samples of the test set with LIME XAI tool.
+        Computes average feature (traffic flow) importance over num_instances (500 by default) random samples of the test set with LIME XAI tool.
 
         Parameters
         ----------
@@ -109,19 +444,22 @@ class CNN:
             test dataset to sample for feature relevance computation.
         dest_dir: str
             directory to save average relevance matrix in, after computation. If None data will NOT be saved to disk.
+        num_instances : int
+            number of test samples to explain.
 
         Returns
         -------
         NDArray
             sorted array of most important coordinates, from least to most important. 
         """
+        import lime.lime_tabular as lt
         n = self.input_shape[0]
         m = self.input_shape[1]
         feature_names = [str((i, j)) for i in range(n) for j in range(m)]
         num_features = n * m
         explainer = lt.LimeTabularExplainer(training_data=np.array(train_X), verbose=True,  mode='regression', class_names=['flow'], feature_names=feature_names)
         test_X = np.array(test_X)
-        indices = np.random.choice(len(test_X), 500, replace=False)
+        indices = np.random.choice(len(test_X), min(num_instances, len(test_X)), replace=False)
         sample = test_X[indices]
         importance_sums = np.zeros((num_features))
         for i, test_instance in enumerate(sample):
@@ -130,9 +468,372 @@ class CNN:
             for record in imp:
                 importance_sums[record[0]] += abs(record[1])
         importance_averages = importance_sums/i
-        matrix_avg_imp = np.reshape(importance_averages, (n,m))
-        np.save(dest_dir, matrix_avg_imp)
-        i = np.absolute(importance_averages).argsort(axis=None, kind='mergesort')
-        j = np.unravel_index(i, matrix_avg_imp.shape) 
-        sorted = np.vstack(j).T
-        return sorted
\ No newline at end of file
+        return self._save_and_sort(importance_averages, dest_dir)
+
+    def _save_and_sort(self, importance_averages, dest_dir):
+        matrix_avg_imp = np.reshape(importance_averages, (self.input_shape[0], self.input_shape[1]))
+        if dest_dir is not None:
+            np.save(dest_dir, matrix_avg_imp)
+        return sort_coordinates(matrix_avg_imp)
+
+    def compiled_predict(self, batch_size = 8192):
+        """
+        Build a prediction function backed by a compiled (tf.function) model call, for repeated predictions on large batches.
+
+        Parameters
+        ----------
+        batch_size : int
+            maximum number of rows evaluated per model call.
+
+        Returns
+        -------
+        callable
+            function mapping a (k, N*M) array to a (k,) array of predictions.
+        """
+        call = tf.function(lambda x: self.model(x, training=False), reduce_retracing=True)
+        def predict_fn(data_X):
+            data_X = np.asarray(data_X, dtype=np.float32)
+            return np.concatenate([np.reshape(call(data_X[i:i + batch_size]).numpy(), -1) for i in range(0, len(data_X), batch_size)])
+        return predict_fn
+
+    def fast_lime(self, train_X, test_X, dest_dir = None, num_instances = 500, num_samples = 5000, block_size = 10, tolerance = 0.999, patience = 3, n_jobs = 1):
+        """
+        Batched equivalent of lime. Perturbations are shared by blocks of test instances and evaluated with a
+        compiled model call, local regressions are solved for a whole block at once, and computation stops early
+        once the importance ranking is stable.
+
+        Parameters
+        ----------
+        train : NDArray
+            training dataset, used to fit the perturbation sampler as LIME does.
+        test : NDArray
+            test dataset to sample for feature relevance computation.
+        dest_dir: str
+            directory to save average relevance matrix in, after computation. If None data will NOT be saved to disk.
+        num_instances : int
+            maximum number of test samples to explain.
+        num_samples : int
+            number of perturbations per block of samples.
+        block_size : int
+            number of test samples explained together.
+        tolerance : float
+            rank correlation between consecutive rankings above which the ranking is considered stable. Values above 1 disable early stopping.
+        patience : int
+            number of consecutive stable blocks required to stop.
+        n_jobs : int
+            number of worker processes. More than one requires the model to have been saved by train.
+
+        Returns
+        -------
+        NDArray
+            sorted array of most important coordinates, from least to most important.
+        """
+        importance_averages, _ = lime_importances(self.compiled_predict(), train_X, test_X, num_instances, num_samples, block_size, tolerance, patience, n_jobs, self.model_path)
+        return self._save_and_sort(importance_averages, dest_dir)
+
+    def _sample(self, test_X, num_instances):
+        test_X = np.asarray(test_X, dtype=np.float32)
+        if num_instances is not None and num_instances < len(test_X):
+            test_X = test_X[np.random.choice(len(test_X), num_instances, replace=False)]
+        return test_X
+
+    def saliency(self, test_X, dest_dir = None, num_instances = None, batch_size = 1024):
+        """
+        Computes average feature importance as the absolute gradient of the prediction with respect to each input,
+        over a batch of test samples.
+
+        Parameters
+        ----------
+        test : NDArray
+            test dataset to sample for feature relevance computation.
+        dest_dir: str
+            directory to save average relevance matrix in, after computation. If None data will NOT be saved to disk.
+        num_instances : int
+            number of random test samples to use. If None the whole test set is used.
+        batch_size : int
+            number of samples per gradient computation.
+
+        Returns
+        -------
+        NDArray
+            sorted array of most important coordinates, from least to most important.
+        """
+        test_X = self._sample(test_X, num_instances)
+        importance_sums = np.zeros(test_X.shape[1])
+        for i in range(0, len(test_X), batch_size):
+            batch = tf.convert_to_tensor(test_X[i:i + batch_size])
+            with tf.GradientTape() as tape:
+                tape.watch(batch)
+                predictions = self.model(batch, training=False)
+            importance_sums += np.abs(tape.gradient(predictions, batch).numpy()).sum(axis=0)
+        return self._save_and_sort(importance_sums / len(test_X), dest_dir)
+
+    def integrated_gradients(self, test_X, dest_dir = None, num_instances = None, baseline = -1., steps = 32, batch_size = 256):
+        """
+        Computes average feature importance with integrated gradients along the straight path from a baseline matrix
+        (by default every flow missing, i.e. -1 as in dig_holes) to each test sample.
+
+        Parameters
+        ----------
+        test : NDArray
+            test dataset to sample for feature relevance computation.
+        dest_dir: str
+            directory to save average relevance matrix in, after computation. If None data will NOT be saved to disk.
+        num_instances : int
+            number of random test samples to use. If None the whole test set is used.
+        baseline : float
+            value of every feature in the baseline matrix.
+        steps : int
+            number of interpolation steps of the path integral.
+        batch_size : int
+            number of samples per gradient computation, each expanded into steps interpolated inputs.
+
+        Returns
+        -------
+        NDArray
+            sorted array of most important coordinates, from least to most important.
+        """
+        test_X = self._sample(test_X, num_instances)
+        alphas = ((np.arange(steps, dtype=np.float32) + .5) / steps)[None, :, None]
+        importance_sums = np.zeros(test_X.shape[1])
+        for i in range(0, len(test_X), batch_size):
+            batch = test_X[i:i + batch_size]
+            difference = batch - baseline
+            path = tf.convert_to_tensor((baseline + alphas * difference[:, None, :]).reshape(-1, batch.shape[1]))
+            with tf.GradientTape() as tape:
+                tape.watch(path)
+                predictions = self.model(path, training=False)
+            gradients = tape.gradient(predictions, path).numpy().reshape(len(batch), steps, batch.shape[1])
+            importance_sums += np.abs(gradients.mean(axis=1) * difference).sum(axis=0)
+        return self._save_and_sort(importance_sums / len(test_X), dest_dir)
+
+    def occlusion(self, test_X, dest_dir = None, num_instances = None, fill = -1.):
+        """
+        Computes average feature importance as the absolute change of the prediction when each coordinate is masked
+        with fill (-1, as in dig_holes), for all test samples and coordinates at once.
+
+        Parameters
+        ----------
+        test : NDArray
+            test dataset to sample for feature relevance computation.
+        dest_dir: str
+            directory to save average relevance matrix in, after computation. If None data will NOT be saved to disk.
+        num_instances : int
+            number of random test samples to use. If None the whole test set is used.
+        fill : float
+            value replacing each masked coordinate.
+
+        Returns
+        -------
+        NDArray
+            sorted array of most important coordinates, from least to most important.
+        """
+        test_X = self._sample(test_X, num_instances)
+        importance_averages = occlusion_importances(self.compiled_predict(), test_X, fill)
+        return self._save_and_sort(importance_averages, dest_dir)
+
+def masked_mse(y_true, y_pred):
+    """
+    Mean squared error over the missing entries only. y_true packs the truth values followed by a 0/1 mask of the
+    missing entries, as built by MultiCNN.train.
+    """
+    outputs = tf.shape(y_pred)[-1]
+    values, mask = y_true[:, :outputs], y_true[:, outputs:]
+    return tf.reduce_sum(mask * tf.square(values - y_pred)) / tf.maximum(tf.reduce_sum(mask), 1.)
+
+def masked_mae(y_true, y_pred):
+    """
+    Mean absolute error over the missing entries only, see masked_mse.
+    """
+    outputs = tf.shape(y_pred)[-1]
+    values, mask = y_true[:, :outputs], y_true[:, outputs:]
+    return tf.reduce_sum(mask * tf.abs(values - y_pred)) / tf.maximum(tf.reduce_sum(mask), 1.)
+
+class MultiCNN:
+    """
+    CNN based Traffic Matrix Completion model estimating several coordinates in one forward pass.
+    Inputs are whole matrices (not recentered) with -1 at every missing position, as built by
+    preprocessing.process_data_masked, and the loss only accounts for the targets that are missing in each sample.
+
+    Attributes
+    ----------
+    input_shape : tuple
+        The shape of the input matrices extended by a 1-valued position (e.g (10, 10, 1) for 10 x 10 matrices).
+    target_coordinates : list
+        The coordinates predicted by the model.
+
+    Methods
+    -------
+    train(train_X, train_Y, test_X, test_Y, model_path)
+        Train the model using matrix data and save it in the specified path.
+
+    predict(data_X)
+        Predict every target coordinate for a batch of traffic matrices.
+
+    complete(data_X)
+        Replace the missing target values of a batch of traffic matrices with their estimation.
+
+    evaluate(test_X, test_Y)
+        Per-coordinate error metrics over the missing entries.
+    """
+
+    def __init__(self, input_shape, target_coordinates = None) -> None:
+        """
+        Initialize the multi-output Traffic Matrix Completion model.
+
+        Parameters
+        ----------
+        input_shape : tuple
+            The shape of the input matrices extended by a 1-valued position (e.g (N, M, 1) for N x M matrices).
+        target_coordinates : list
+            The coordinates to predict. If None every coordinate of the matrix is predicted.
+        """
+        if target_coordinates is None:
+            target_coordinates = [(i, j) for i in range(input_shape[0]) for j in range(input_shape[1])]
+        self.input_shape = input_shape
+        self.target_coordinates = [tuple(coordinate) for coordinate in target_coordinates]
+        self.model_path = None
+        self.model = tf.keras.models.Sequential(build_layers(input_shape, len(self.target_coordinates)))
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=5e-5), loss=masked_mse, metrics=[masked_mae])
+        self.model.summary()
+
+    @classmethod
+    def load(cls, model_path, input_shape, target_coordinates = None):
+        """
+        Load a model previously trained and saved with train.
+
+        Parameters
+        ----------
+        model_path : str
+            Path the model was saved in.
+        input_shape : tuple
+            The shape of the input matrices extended by a 1-valued position.
+        target_coordinates : list
+            The coordinates predicted by the model. If None every coordinate of the matrix.
+
+        Returns
+        -------
+        MultiCNN
+            the loaded model.
+        """
+        cnn = cls.__new__(cls)
+        if target_coordinates is None:
+            target_coordinates = [(i, j) for i in range(input_shape[0]) for j in range(input_shape[1])]
+        cnn.input_shape = input_shape
+        cnn.target_coordinates = [tuple(coordinate) for coordinate in target_coordinates]
+        cnn.model = tf.keras.models.load_model(model_path, compile=False)
+        cnn.model_path = model_path
+        return cnn
+
+    @property
+    def target_positions(self):
+        """Flat positions of the target coordinates in the input matrices."""
+        return np.array([i * self.input_shape[1] + j for (i, j) in self.target_coordinates])
+
+    def _pack(self, data_X, data_Y):
+        mask = (np.asarray(data_X)[:, self.target_positions] == -1).astype(np.float32)
+        return np.concatenate([np.asarray(data_Y, dtype=np.float32), mask], axis=1)
+
+    def train(self, train_X, train_Y, test_X, test_Y, model_path):
+        """
+        Train the model using matrix data and save it in the specified path.
+
+        Parameters
+        ----------
+        train_X : NDArray
+            A numpy array of training traffic matrices, with -1 at the missing positions.
+        train_Y : NDArray
+            A numpy array of training truth values, one column per target coordinate.
+        test_X : NDArray
+            A numpy array of test traffic matrices, with -1 at the missing positions.
+        test_Y : NDArray
+            A numpy array of test truth values, one column per target coordinate.
+        model_path : str
+            Path to save trained model in after training .
+        """
+        if train_X.shape[1] != self.input_shape[0]*self.input_shape[1] or test_X.shape[1] != self.input_shape[0]*self.input_shape[1]:
+            raise ValueError(f'Provided data does not match model input shape')
+        if train_Y.shape[1] != len(self.target_coordinates) or test_Y.shape[1] != len(self.target_coordinates):
+            raise ValueError(f'Provided truth values do not match the number of target coordinates')
+        cb = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience = 10, mode = 'min', restore_best_weights = True, verbose = 1)
+        self.model.fit(train_X, self._pack(train_X, train_Y), epochs=300, batch_size=64, validation_data=(test_X, self._pack(test_X, test_Y)), callbacks=[cb])
+        self.model.save(model_path)
+        self.model_path = model_path
+
+    def predict(self, data_X):
+        """
+        Predict every target coordinate for a batch of traffic matrices.
+
+        Parameters
+        ----------
+        data_X : NDArray
+            A numpy array of incomplete traffic matrices of shape (k, N*M).
+
+        Returns
+        -------
+        NDArray
+            array of shape (k, len(target_coordinates)).
+        """
+        if np.ndim(data_X) == 1:
+            data_X = np.expand_dims(data_X, 0)
+        if len(data_X) <= 1024:
+            return self.model(data_X, training=False).numpy()
+        return self.model.predict(data_X, verbose=0)
+
+    def export(self, path, dtype = np.float32):
+        """
+        Export the model to a compact .npz artifact that lite_model.LiteModel can run without TensorFlow.
+
+        Parameters
+        ----------
+        path : str
+            destination .npz file.
+        dtype : numpy.dtype
+            data type of the stored weights.
+        """
+        export_model(self.model, path, dtype)
+
+    def complete(self, data_X):
+        """
+        Replace the missing (-1) target values of a batch of traffic matrices with their estimation.
+
+        Parameters
+        ----------
+        data_X : NDArray
+            A numpy array of incomplete traffic matrices of shape (k, N*M).
+
+        Returns
+        -------
+        NDArray
+            completed copy of data_X.
+        """
+        completed = np.array(data_X, dtype=float, ndmin=2)
+        targets = completed[:, self.target_positions]
+        completed[:, self.target_positions] = np.where(targets == -1, self.predict(completed), targets)
+        return completed
+
+    def evaluate(self, test_X, test_Y):
+        """
+        Per-coordinate error metrics over the entries missing in test_X.
+
+        Parameters
+        ----------
+        test_X : NDArray
+            A numpy array of test traffic matrices, with -1 at the missing positions.
+        test_Y : NDArray
+            A numpy array of test truth values, one column per target coordinate.
+
+        Returns
+        -------
+        dict
+            {'mae': ..., 'mape': ..., 'count': ...} keyed by target coordinate, metrics are NaN for coordinates never missing.
+        """
+        predictions = self.predict(test_X)
+        mask = np.asarray(test_X)[:, self.target_positions] == -1
+        errors = np.abs(predictions - test_Y)
+        percentages = 100 * errors / np.maximum(np.abs(test_Y), 1e-7)
+        counts = mask.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mae = np.where(mask, errors, 0).sum(axis=0) / counts
+            mape = np.where(mask, percentages, 0).sum(axis=0) / counts
+        return {coordinate: {'mae': float(mae[k]), 'mape': float(mape[k]), 'count': int(counts[k])} for k, coordinate in enumerate(self.target_coordinates)}
@@ -0,0 +1,381 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+import numpy as np
+from preprocessing import *
+from synthetic import random_walk_tensor
+from flow_counters import FlowCounters, parse_flow_stats
+from host_index import host_mac
+
+def time_call(function, *args, repeat=3, **kwargs):
+    '''
+    Time a function call, keeping the best of several runs.
+
+    Parameters
+    ----------
+    function : callable
+        function to time.
+    repeat : int
+        number of runs.
+
+    Returns
+    -------
+    tuple
+        a tuple (best_seconds, result) with the best wall time and the result of the last run.
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def benchmark_preprocessing(num_matrices=10000, shape=(10, 10), repeat=3):
+    '''
+    Compare the loop based process_data/process_data_reduced with their vectorized versions.
+
+    Parameters
+    ----------
+    num_matrices : int
+        number of random traffic matrices in the benchmark tensor.
+    shape : tuple
+        shape (n, m) of each traffic matrix.
+    repeat : int
+        number of runs per function, the best one is reported.
+
+    Returns
+    -------
+    dict
+        wall times in seconds and speedups, keyed by function name.
+    '''
+    data = np.random.uniform(0, 9, (num_matrices,) + shape)
+    y_coordinate = (shape[0]//2 - 1, shape[1]//2 - 2)
+    missing = [y_coordinate, (0, 0), (shape[0]-1, shape[1]-1)]
+    subset = np.vstack(np.unravel_index(np.arange(shape[0]*shape[1])[::4], shape)).T
+    cases = {
+        'process_data': (process_data, process_data_vectorized, missing),
+        'process_data_reduced': (process_data_reduced, process_data_reduced_vectorized, subset),
+    }
+    results = {}
+    for name, (loop_function, vectorized_function, coordinates) in cases.items():
+        np.random.seed(0)
+        loop_time, expected = time_call(loop_function, data, y_coordinate, coordinates, repeat=repeat)
+        np.random.seed(0)
+        vectorized_time, actual = time_call(vectorized_function, data, y_coordinate, coordinates, repeat=repeat)
+        if not all(np.array_equal(a, b) for a, b in zip(expected, actual)):
+            raise AssertionError(f'{vectorized_function.__name__} output differs from {loop_function.__name__}')
+        results[name] = {'loop': loop_time, 'vectorized': vectorized_time, 'speedup': loop_time / vectorized_time}
+    return results
+
+def benchmark_attribution(num_matrices=2000, shape=(10, 10), epochs=20, num_instances=100):
+    '''
+    Compare wall time and ranking agreement of the attribution methods of CNN against CNN.lime,
+    on a model trained on random matrices whose target flow depends on a few other flows.
+
+    Parameters
+    ----------
+    num_matrices : int
+        number of random traffic matrices used to train the model.
+    shape : tuple
+        shape (n, m) of each traffic matrix.
+    epochs : int
+        number of training epochs.
+    num_instances : int
+        number of test samples explained by each method.
+
+    Returns
+    -------
+    dict
+        wall time in seconds and Spearman rank agreement with CNN.lime, keyed by method name.
+    '''
+    from CNN import CNN
+    from importance import rank_agreement
+    data = np.random.uniform(0, 9, (num_matrices,) + shape)
+    y_coordinate = (shape[0]//2 - 1, shape[1]//2 - 2)
+    data[:, y_coordinate[0], y_coordinate[1]] = data[:, 0, 1] + 2 * data[:, shape[0]-1, 2]
+    x, y, tx, ty = process_data_vectorized(scale_data(fit_scaler(data), data), y_coordinate, [y_coordinate])
+    cnn = CNN(shape + (1,), y_coordinate)
+    cnn.model.fit(x, y, epochs=epochs, batch_size=64, verbose=0)
+    methods = {
+        'lime': lambda path: cnn.lime(x, tx, path, num_instances=num_instances),
+        'fast_lime': lambda path: cnn.fast_lime(x, tx, path, num_instances=num_instances),
+        'saliency': lambda path: cnn.saliency(tx, path, num_instances=num_instances),
+        'integrated_gradients': lambda path: cnn.integrated_gradients(tx, path, num_instances=num_instances),
+        'occlusion': lambda path: cnn.occlusion(tx, path, num_instances=num_instances),
+    }
+    importances = {}
+    results = {}
+    directory = tempfile.mkdtemp()
+    for name, method in methods.items():
+        path = os.path.join(directory, f'{name}_imp.npy')
+        seconds, _ = time_call(method, path, repeat=1)
+        importances[name] = np.load(path)
+        results[name] = {'seconds': seconds, 'agreement': rank_agreement(importances['lime'], importances[name])}
+    return results
+
+def flow_stats_body(num_hosts, num_flows, seed=0):
+    '''
+    Synthetic flow statistics reply body, with the attributes of the OFPFlowStats entries of a Ryu reply.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts the flows are drawn between.
+    num_flows : int
+        number of priority-1 host flows, a table-miss flow is added.
+    seed : int
+        seed of the random generator.
+
+    Returns
+    -------
+    list
+        the reply body.
+    '''
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, num_hosts, (num_flows, 2))
+    body = [SimpleNamespace(priority=0, match={}, instructions=[SimpleNamespace(actions=[SimpleNamespace(port=0xfffffffd)])],
+                            byte_count=0, packet_count=0, duration_sec=100, duration_nsec=0)]
+    for k, (i, j) in enumerate(pairs):
+        body.append(SimpleNamespace(priority=1, match={'in_port': int(rng.integers(1, 48)), 'eth_src': host_mac(i), 'eth_dst': host_mac(j)},
+                                    instructions=[SimpleNamespace(actions=[SimpleNamespace(port=int(rng.integers(1, 48)))])],
+                                    byte_count=int(rng.integers(0, 2**32)), packet_count=int(rng.integers(0, 2**22)),
+                                    duration_sec=int(rng.integers(0, 300)), duration_nsec=int(rng.integers(0, 10**9))))
+    return body
+
+def benchmark_flow_stats(num_hosts=100, num_flows=5000, repeat=20):
+    '''
+    Compare the flow statistics reply handling of the monitor (columnar parsing and one vectorized update) with
+    the former per-flow handling (sorted flows, one formatted log line and one tuple per flow).
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts.
+    num_flows : int
+        number of host flows per reply.
+    repeat : int
+        number of runs per handler, the best one is reported.
+
+    Returns
+    -------
+    dict
+        wall times in seconds per reply and speedup.
+    '''
+    body = flow_stats_body(num_hosts, num_flows)
+    mac_to_index = {host_mac(i): i for i in range(num_hosts)}
+    # Log lines are formatted into memory, as a console handler would format them
+    logger = logging.getLogger('benchmark_flow_stats')
+    logger.propagate = False
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+    logger.setLevel(logging.INFO)
+
+    def per_flow(counters):
+        flows = []
+        for stat in sorted([flow for flow in body if flow.priority == 1], key=lambda flow: (flow.match['in_port'])):
+            logger.info('%016x %8x %17s %8x %8d %8d', 1, stat.match['in_port'], stat.match['eth_dst'],
+                        stat.instructions[0].actions[0].port, stat.packet_count, stat.byte_count)
+            src = stat.match.get('eth_src')
+            dst = stat.match.get('eth_dst')
+            if src in mac_to_index and dst in mac_to_index:
+                flows.append((mac_to_index[src], mac_to_index[dst], stat.byte_count, stat.packet_count,
+                              stat.duration_sec + stat.duration_nsec * 1e-9))
+        src, dst, byte_count, packet_count, duration = zip(*flows)
+        return counters.update(1, src, dst, byte_count, packet_count, duration, now=0)
+
+    def columnar(counters):
+        # Flow tables are only logged at debug level, disabled here as in production
+        return counters.update(1, *parse_flow_stats(body, mac_to_index), now=0)
+
+    results = {}
+    for name, handler in (('per_flow', per_flow), ('columnar', columnar)):
+        counters = FlowCounters(num_hosts, now=0)
+        results[name], _ = time_call(handler, counters, repeat=repeat)
+    expected = FlowCounters(num_hosts, now=0)
+    per_flow(expected)
+    actual = FlowCounters(num_hosts, now=0)
+    columnar(actual)
+    if not np.allclose(expected.epoch_bytes, actual.epoch_bytes):
+        raise AssertionError('columnar handling accounts different volumes')
+    results['speedup'] = results['per_flow'] / results['columnar']
+    return results
+
+def measure(function, *args, repeat=3, items=1, **kwargs):
+    '''
+    Run a function several times and collect its wall time, throughput, latency percentiles and peak memory.
+    Peak memory is the largest amount of memory allocated through Python and NumPy during a run (tracemalloc),
+    allocations made by TensorFlow kernels are not included. Since tracing slows Python code down, it is measured
+    on an extra first run, which also serves as warm-up and is excluded from the timings unless repeat is 0.
+
+    Parameters
+    ----------
+    function : callable
+        function to measure.
+    repeat : int
+        number of timed runs after the traced one.
+    items : int
+        number of items (matrices, samples...) processed by a run, used for the throughput.
+
+    Returns
+    -------
+    tuple
+        a tuple (metrics, result) with a dictionary of metrics and the result of the last run.
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    traced = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+    latencies = latencies or [traced]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    metrics = {
+        'runs': len(latencies),
+        'items': items,
+        'best': min(latencies),
+        'mean': float(np.mean(latencies)),
+        'p50': float(p50),
+        'p95': float(p95),
+        'p99': float(p99),
+        'throughput': items / min(latencies),
+        'peak_memory': peak,
+    }
+    return metrics, result
+
+def benchmark_suite(num_hosts=10, num_matrices=10000, stages=None, repeat=3, epochs=2, num_instances=20, latency_calls=200, loop_limit=20000, seed=0):
+    '''
+    Measure every stage of the completion workflow on a synthetic tensor generated with the random-walk demand model
+    of generateRandomTraffic.Generator: generation, scaling, sample building, training, inference and explanations.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts, the matrices are num_hosts x num_hosts.
+    num_matrices : int
+        number of matrices of the synthetic tensor.
+    stages : list
+        names of the stages to run, None for all of them. The loop based process_data/process_data_reduced
+        stages are only part of the default stages up to loop_limit matrices.
+    repeat : int
+        number of timed runs per stage, training and explanation stages run once.
+    epochs : int
+        number of training epochs of the train stage.
+    num_instances : int
+        number of test samples explained by the explanation stages.
+    latency_calls : int
+        number of single-matrix calls of the predict_single stage.
+    loop_limit : int
+        largest tensor the loop based stages run on by default.
+    seed : int
+        seed of the synthetic tensor and of the sample shuffling.
+
+    Returns
+    -------
+    dict
+        configuration and environment of the run, and metrics of every stage (see measure) keyed by stage name.
+    '''
+    shape = (num_hosts, num_hosts)
+    y_coordinate = (num_hosts//2 - 1, num_hosts//2 - 2)
+    subset = np.vstack(np.unravel_index(np.arange(num_hosts*num_hosts)[::4], shape)).T
+    all_stages = ['generate', 'fit_scaler', 'scale_data', 'process_data', 'process_data_vectorized', 'process_data_reduced',
+                  'process_data_reduced_vectorized', 'train', 'predict_batch', 'predict_single', 'lime', 'fast_lime']
+    if stages is None:
+        stages = [stage for stage in all_stages if num_matrices <= loop_limit or stage not in ('process_data', 'process_data_reduced')]
+    results = {
+        'config': {'num_hosts': num_hosts, 'num_matrices': num_matrices, 'repeat': repeat, 'epochs': epochs, 'num_instances': num_instances, 'seed': seed},
+        'environment': {'time': time.time(), 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'stages': {},
+    }
+    def run(name, function, *args, items=1, runs=repeat, **kwargs):
+        if name not in stages:
+            return None
+        np.random.seed(seed)
+        results['stages'][name], result = measure(function, *args, repeat=runs, items=items, **kwargs)
+        return result
+
+    data = run('generate', random_walk_tensor, num_hosts, num_matrices, seed=seed, items=num_matrices)
+    if data is None:
+        data = random_walk_tensor(num_hosts, num_matrices, seed=seed)
+    scaler = run('fit_scaler', fit_scaler, data, items=num_matrices) or fit_scaler(data)
+    run('scale_data', scale_data, scaler, data, items=num_matrices)
+    data = scale_data(scaler, data, inplace=True)
+    run('process_data', process_data, data, y_coordinate, [y_coordinate], items=num_matrices)
+    run('process_data_reduced', process_data_reduced, data, y_coordinate, subset, items=num_matrices)
+    run('process_data_reduced_vectorized', process_data_reduced_vectorized, data, y_coordinate, subset, items=num_matrices)
+    np.random.seed(seed)
+    samples = run('process_data_vectorized', process_data_vectorized, data, y_coordinate, [y_coordinate], items=num_matrices) or process_data_vectorized(data, y_coordinate, [y_coordinate])
+    x, y, tx, ty = samples
+    if not set(stages) & {'train', 'predict_batch', 'predict_single', 'lime', 'fast_lime'}:
+        return results
+    from CNN import CNN
+    directory = tempfile.mkdtemp()
+    cnn = CNN(shape + (1,), y_coordinate, summary=False)
+    if 'train' in stages:
+        run('train', cnn.train, x, y, tx, ty, os.path.join(directory, 'model.keras'), epochs=epochs, patience=epochs, verbose=0, items=len(x)*epochs, runs=0)
+    else:
+        cnn.model.save(os.path.join(directory, 'model.keras'))
+        cnn.model_path = os.path.join(directory, 'model.keras')
+    run('predict_batch', cnn.predict, tx, items=len(tx))
+    if run('predict_single', cnn.predict, tx[:1], runs=latency_calls) is not None:
+        # Sustained single-matrix throughput, rather than that of the fastest call
+        results['stages']['predict_single']['throughput'] = 1 / results['stages']['predict_single']['mean']
+    run('lime', cnn.lime, x, tx, os.path.join(directory, 'lime_imp.npy'), num_instances=num_instances, items=num_instances, runs=0)
+    run('fast_lime', cnn.fast_lime, x, tx, os.path.join(directory, 'fast_lime_imp.npy'), num_instances=num_instances, items=num_instances, runs=0)
+    return results
+
+def save_results(results, path):
+    '''
+    Save benchmark results as JSON, to compare them across versions.
+
+    Parameters
+    ----------
+    results : dict
+        results of benchmark_suite.
+    path : str
+        destination file.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+# Driver code
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the traffic matrix completion workflow on synthetic data.')
+    parser.add_argument('--hosts', type=int, nargs='+', default=[10, 22])
+    parser.add_argument('--matrices', type=int, nargs='+', default=[10000])
+    parser.add_argument('--stages', nargs='+', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--output', default='output/benchmarks')
+    parser.add_argument('--compare', action='store_true', help='also compare loop and vectorized preprocessing, the flow statistics handlers and the attribution methods')
+    args = parser.parse_args()
+    for num_hosts in args.hosts:
+        for num_matrices in args.matrices:
+            results = benchmark_suite(num_hosts, num_matrices, args.stages, args.repeat, args.epochs)
+            path = os.path.join(args.output, f'benchmark_{num_hosts}_{num_matrices}_{int(time.time())}.json')
+            save_results(results, path)
+            print(f'{num_hosts} hosts, {num_matrices} matrices -> {path}')
+            for name, metrics in results['stages'].items():
+                print(f"  {name:<32} best {metrics['best']:.4f}s  p95 {metrics['p95']:.4f}s  {metrics['throughput']:.1f} items/s  peak {metrics['peak_memory'] / 2**20:.1f}MiB")
+    if args.compare:
+        for shape in [(10, 10), (22, 22)]:
+            for name, result in benchmark_preprocessing(10000, shape).items():
+                print(f"{name:<22} {str(shape):<9} loop {result['loop']:.4f}s  vectorized {result['vectorized']:.4f}s  speedup x{result['speedup']:.1f}")
+        for num_flows in [1000, 5000, 20000]:
+            result = benchmark_flow_stats(100, num_flows)
+            print(f"flow_stats_reply       {num_flows:<9} per flow {result['per_flow']:.4f}s  columnar {result['columnar']:.4f}s  speedup x{result['speedup']:.1f}")
+        for name, result in benchmark_attribution().items():
+            print(f"{name:<22} {result['seconds']:.2f}s  rank agreement with lime {result['agreement']:.3f}")
@@ -0,0 +1,233 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from preprocessing import *
+from tensor_store import TensorStore
+
+def job_grid(coordinates, grid = None):
+    '''
+    Training jobs of every (target coordinate, hyperparameter combination) pair.
+
+    Parameters
+    ----------
+    coordinates : list
+        list of target coordinates (tuples).
+    grid : dict
+        lists of values keyed by CNN hyperparameter (learning_rate, filters, dense, dropout, batch_size, patience, epochs).
+        None trains every coordinate with the default hyperparameters.
+
+    Returns
+    -------
+    list
+        list of jobs, dictionaries with a unique 'id', the 'coordinate' and the 'params' of the job.
+    '''
+    grid = grid or {}
+    names = sorted(grid)
+    jobs = []
+    for coordinate in coordinates:
+        coordinate = tuple(int(v) for v in coordinate)
+        for values in itertools.product(*(grid[name] for name in names)):
+            params = dict(zip(names, values))
+            suffix = '_'.join(f'{name}={value}' for name, value in params.items()).replace(' ', '')
+            job_id = f'{coordinate[0]}_{coordinate[1]}' + ('_' + suffix if suffix else '')
+            jobs.append({'id': job_id, 'coordinate': list(coordinate), 'params': params})
+    return jobs
+
+_worker_data = None
+_worker_observed = None
+
+def _init_worker(data_path, scaler_path, intra_op_threads, inter_op_threads):
+    global _worker_data, _worker_observed
+    # Thread pools must be sized before TensorFlow creates them, i.e. before any op runs in this process
+    os.environ['OMP_NUM_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op_threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    data = np.array(load_tensor(data_path), dtype=np.float64)
+    missing = load_loss_mask(data_path)
+    _worker_observed = None if missing is None else ~missing
+    scaler = load_scaler(scaler_path) if scaler_path is not None else partial_fit_scaler(data, None, _worker_observed)
+    _worker_data = scale_data(scaler, data, inplace=True)
+
+def _train_worker(job, output_dir, train_test_split, seed):
+    from CNN import CNN
+    coordinate = tuple(job['coordinate'])
+    params = dict(job['params'])
+    fit_params = {name: params.pop(name) for name in ('epochs', 'batch_size', 'patience') if name in params}
+    if 'filters' in params:
+        params['filters'] = tuple(params['filters'])
+    # Every job of a coordinate shuffles the same way, so their validation metrics are computed on the same split
+    np.random.seed([seed, coordinate[0], coordinate[1]])
+    # Flows missing from the loss mask are never trained on
+    data = mask_unobserved(_worker_data, _worker_observed, coordinate)
+    x, y, tx, ty = process_data_vectorized(data, coordinate, [coordinate], train_test_split)
+    model_path = os.path.join(output_dir, f"model_{job['id']}.keras")
+    start = time.perf_counter()
+    cnn = CNN(_worker_data.shape[1:] + (1,), coordinate, summary=False, **params)
+    history = cnn.train(x, y, tx, ty, model_path, verbose=0, **fit_params).history
+    best = int(np.argmin(history['val_loss']))
+    return {
+        'status': 'done',
+        'model': model_path,
+        'seconds': time.perf_counter() - start,
+        'epochs': len(history['val_loss']),
+        'best_epoch': best + 1,
+        'metrics': {name: float(values[best]) for name, values in history.items()},
+    }
+
+class TrainingFarm:
+    """
+    Parallel training of one CNN per (target coordinate, hyperparameter combination) job on a process pool.
+
+    Each worker loads and scales the dataset once, and runs TensorFlow with a fixed number of intra-op and
+    inter-op threads, so that many single-coordinate trainings share a many-core machine without oversubscribing it.
+    The outcome of every finished job (model path and EarlyStopping metrics at the best epoch) is written to a JSON
+    journal as soon as the job completes: running the same jobs again after an interruption only trains
+    the unfinished ones.
+
+    Attributes
+    ----------
+    data_path : str
+        Path of the TensorStore or .npy file of raw traffic matrices.
+    output_dir : str
+        Directory of the trained models and of the journal.
+    scaler_path : str
+        Optional scaler saved with save_scaler, None to fit one on the dataset.
+    workers : int
+        Number of worker processes.
+    intra_op_threads : int
+        Number of TensorFlow intra-op threads per worker.
+    inter_op_threads : int
+        Number of TensorFlow inter-op threads per worker.
+    train_test_split : float
+        Portion of data dedicated to validation.
+    seed : int
+        Seed of the train/validation split, shared by every job of a coordinate. Jobs journaled with another
+        seed are trained again.
+    journal : dict
+        Results of the finished jobs keyed by job id.
+
+    Methods
+    -------
+    pending(jobs)
+        Jobs without a result in the journal.
+
+    run(jobs)
+        Train the pending jobs and return the results of all of them.
+
+    best(jobs, metric)
+        Best job of every target coordinate according to a validation metric.
+    """
+
+    def __init__(self, data_path, output_dir = 'farm', scaler_path = None, workers = None, intra_op_threads = 1, inter_op_threads = 1, train_test_split = 0.2, seed = 0) -> None:
+        self.data_path = data_path
+        self.output_dir = output_dir
+        self.scaler_path = scaler_path
+        self.workers = workers or max(1, (os.cpu_count() or 1) // intra_op_threads)
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.train_test_split = train_test_split
+        self.seed = seed
+        self.journal_path = os.path.join(output_dir, 'journal.json')
+        self.journal = {}
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                self.journal = json.load(f)
+
+    def _save_journal(self):
+        # Write then rename, so an interruption never leaves a truncated journal
+        with open(self.journal_path + '.tmp', 'w') as f:
+            json.dump(self.journal, f, indent=1)
+        os.replace(self.journal_path + '.tmp', self.journal_path)
+
+    def pending(self, jobs):
+        """
+        Jobs without a successful result in the journal.
+
+        Parameters
+        ----------
+        jobs : list
+            list of jobs, see job_grid.
+
+        Returns
+        -------
+        list
+            the jobs left to train.
+        """
+        return [job for job in jobs if not self._done(self.journal.get(job['id']))]
+
+    def _done(self, result):
+        # Results validated on another split cannot be compared with the others
+        return result is not None and result.get('status') == 'done' and result.get('seed') == self.seed
+
+    def run(self, jobs):
+        """
+        Train the pending jobs on the process pool, journaling every result as soon as it is available.
+        A failing job is journaled with its error and retried on the next run.
+
+        Parameters
+        ----------
+        jobs : list
+            list of jobs, see job_grid.
+
+        Returns
+        -------
+        dict
+            results of the given jobs keyed by job id.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = self.pending(jobs)
+        if pending:
+            # Spawned workers do not inherit the TensorFlow state of the parent process
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker, initargs=(self.data_path, self.scaler_path, self.intra_op_threads, self.inter_op_threads)) as executor:
+                futures = {executor.submit(_train_worker, job, self.output_dir, self.train_test_split, self.seed): job for job in pending}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        result = {'status': 'failed', 'error': repr(error)}
+                    self.journal[job['id']] = dict(result, coordinate=job['coordinate'], params=job['params'], seed=self.seed)
+                    self._save_journal()
+        return {job['id']: self.journal.get(job['id']) for job in jobs}
+
+    def best(self, jobs, metric = 'val_loss'):
+        """
+        Best finished job of every target coordinate according to a validation metric.
+
+        Parameters
+        ----------
+        jobs : list
+            list of jobs, see job_grid.
+        metric : str
+            metric to minimize (e.g. 'val_loss', 'val_mae', 'val_mape').
+
+        Returns
+        -------
+        dict
+            journal entries keyed by target coordinate (tuple).
+        """
+        best = {}
+        for job in jobs:
+            result = self.journal.get(job['id'])
+            if not self._done(result):
+                continue
+            coordinate = tuple(job['coordinate'])
+            if coordinate not in best or result['metrics'][metric] < best[coordinate]['metrics'][metric]:
+                best[coordinate] = result
+        return best
+
+# Driver code
+if __name__ == '__main__':
+    _, n, m = TensorStore('output/tensor', mode='r').shape
+    coordinates = [(i, j) for i in range(n) for j in range(m) if i != j]
+    farm = TrainingFarm('output/tensor', 'farm', intra_op_threads=2)
+    jobs = job_grid(coordinates, {'learning_rate': [5e-5, 5e-4], 'dense': [100]})
+    farm.run(jobs)
+    for coordinate, result in sorted(farm.best(jobs).items()):
+        print(f"{str(coordinate):<9} val_mae {result['metrics']['val_mae']:.4f}  epochs {result['epochs']}  {result['seconds']:.1f}s")
@@ -0,0 +1,260 @@
+import time
+from collections import Counter
+import numpy as np
+
+def learned_ingress(mac_to_port, mac_to_index, size):
+    '''
+    Ingress switch of every host guessed from the MAC learning tables of simple_switch_13: a host sits behind the
+    switch port on which the fewest MAC addresses were learned (only its own on an access port, every host behind
+    it on a trunk). Hosts whose best candidates tie are left unknown.
+
+    Parameters
+    ----------
+    mac_to_port : dict
+        learned port of every MAC address, keyed by datapath id.
+    mac_to_index : dict
+        matrix index of every host MAC address.
+    size : int
+        number of hosts.
+
+    Returns
+    -------
+    NDArray
+        datapath id of the ingress switch of every host, -1 if unknown.
+    '''
+    ingress = np.full(size, -1, dtype=np.int64)
+    best = np.full(size, np.inf)
+    tie = np.zeros(size, dtype=bool)
+    for dpid, table in mac_to_port.items():
+        macs_per_port = Counter(table.values())
+        for mac, port in table.items():
+            i = mac_to_index.get(mac)
+            if i is None:
+                continue
+            if macs_per_port[port] < best[i]:
+                best[i], ingress[i], tie[i] = macs_per_port[port], dpid, False
+            elif macs_per_port[port] == best[i]:
+                tie[i] = True
+    ingress[tie] = -1
+    return ingress
+
+def parse_flow_stats(body, mac_to_index, priority = 1):
+    '''
+    Columnar batch of the host flows of a flow statistics reply body, parsed in a single pass.
+
+    Parameters
+    ----------
+    body : list
+        OFPFlowStats entries of the reply.
+    mac_to_index : dict
+        matrix index of every host MAC address.
+    priority : int
+        priority of the host flows, other flows are skipped.
+
+    Returns
+    -------
+    tuple
+        a tuple (src, dst, byte_count, packet_count, duration) of arrays, one entry per flow between known hosts.
+    '''
+    unknown = -1
+    records = [(mac_to_index.get(stat.match.get('eth_src'), unknown), mac_to_index.get(stat.match.get('eth_dst'), unknown),
+                stat.byte_count, stat.packet_count, stat.duration_sec + stat.duration_nsec * 1e-9)
+               for stat in body if stat.priority == priority]
+    if not records:
+        return tuple(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.float64, np.float64))
+    columns = np.array(records, dtype=np.float64)
+    known = (columns[:, 0] >= 0) & (columns[:, 1] >= 0)
+    columns = columns[known]
+    return columns[:, 0].astype(np.int64), columns[:, 1].astype(np.int64), columns[:, 2], columns[:, 3], columns[:, 4]
+
+class FlowCounters:
+    """
+    Per-(datapath, source, destination) flow counter table turning the cumulative counters of flow statistics
+    replies into traffic per polling epoch.
+
+    Counters are kept in preallocated NumPy arrays of shape (datapaths, size, size), grown when new datapaths
+    connect. Each reply is compared with the previous one of the same datapath: the increase of the byte and
+    packet counters is accumulated into the current epoch. A counter going backwards, or a flow younger than at
+    the previous reply, means the flow expired and was reinstalled: its counters restarted from zero. Flows seen
+    for the first time only count if they were installed during the epoch, otherwise their counters only serve
+    as the baseline of the next epoch.
+
+    A flow crosses every switch on its path, so every switch reports it. Each flow is only measured at the ingress
+    switch of its source host when known (see set_ingress): replies of other switches are dropped before any
+    processing. Flows of hosts with an unknown ingress switch keep the largest volume any switch reported.
+
+    Attributes
+    ----------
+    size : int
+        Number of hosts, i.e. the size of the traffic matrices.
+    expiry : float
+        Time in seconds after which a flow missing from the replies is forgotten.
+    epoch_start : float
+        Time the current epoch started at.
+    ingress : NDArray
+        Datapath id of the ingress switch of every source host, -1 if unknown.
+    completeness : dict
+        Completeness of the last emitted epoch: fraction of the ingress switches that replied ('datapaths')
+        and fraction of the off-diagonal flows measured ('flows').
+
+    Methods
+    -------
+    set_ingress(ingress)
+        Set the measurement point of every source host.
+
+    update(dpid, src, dst, byte_count, packet_count, duration, now)
+        Account the flows of a statistics reply and return its churn.
+
+    emit(now)
+        Close the current epoch and return its traffic.
+    """
+
+    def __init__(self, size, num_datapaths = 8, expiry = 300, now = None) -> None:
+        self.size = size
+        self.expiry = expiry
+        self.slots = {}
+        self.epoch_start = time.time() if now is None else now
+        self.ingress = np.full(size, -1, dtype=np.int64)
+        self.replied = set()
+        self.reply_times = {}
+        self.completeness = {'datapaths': 0., 'flows': 0.}
+        self._allocate(num_datapaths)
+
+    def _allocate(self, num_datapaths):
+        shape = (num_datapaths, self.size, self.size)
+        arrays = {
+            'bytes': np.zeros(shape), 'packets': np.zeros(shape), 'duration': np.zeros(shape), 'last_seen': np.zeros(shape),
+            'seen': np.zeros(shape, dtype=bool), 'epoch_bytes': np.zeros(shape), 'epoch_packets': np.zeros(shape),
+            'epoch_seen': np.zeros(shape, dtype=bool),
+        }
+        for name, array in arrays.items():
+            if hasattr(self, name):
+                previous = getattr(self, name)
+                array[:len(previous)] = previous
+            setattr(self, name, array)
+
+    def slot(self, dpid):
+        """Row of a datapath in the counter arrays, allocated on first use."""
+        if dpid not in self.slots:
+            if len(self.slots) == len(self.bytes):
+                self._allocate(2 * len(self.bytes))
+            self.slots[dpid] = len(self.slots)
+        return self.slots[dpid]
+
+    def set_ingress(self, ingress):
+        """
+        Set the measurement point of every source host.
+
+        Parameters
+        ----------
+        ingress : NDArray
+            datapath id of the ingress switch of every host, -1 for hosts measured at every switch.
+        """
+        self.ingress = np.asarray(ingress, dtype=np.int64)
+
+    def update(self, dpid, src, dst, byte_count, packet_count, duration, now = None):
+        """
+        Account the flows of a statistics reply of a datapath.
+
+        Parameters
+        ----------
+        dpid : int
+            datapath id.
+        src : NDArray
+            matrix index of the source host of every flow.
+        dst : NDArray
+            matrix index of the destination host of every flow.
+        byte_count : NDArray
+            cumulative byte counter of every flow.
+        packet_count : NDArray
+            cumulative packet counter of every flow.
+        duration : NDArray
+            time in seconds every flow has been installed for.
+        now : float
+            time of the reply, defaults to the current time.
+
+        Returns
+        -------
+        tuple
+            a tuple (flows, changed): number of flows measured in the reply, and number of them installed or
+            reinstalled since the previous reply of the datapath (the churn of its flow table).
+        """
+        now = time.time() if now is None else now
+        self.replied.add(dpid)
+        slot = self.slot(dpid)
+        previous = self.reply_times.get(dpid, self.epoch_start)
+        self.reply_times[dpid] = now
+        src = np.asarray(src, dtype=np.int64)
+        ingress = self.ingress[src]
+        # Flows are only measured at the ingress switch of their source
+        keep = (ingress < 0) | (ingress == dpid)
+        flat = src[keep] * self.size + np.asarray(dst, dtype=np.int64)[keep]
+        if len(flat) == 0:
+            return 0, 0
+        byte_count, packet_count, duration = [np.asarray(values, dtype=np.float64)[keep] for values in (byte_count, packet_count, duration)]
+        # Several flows of a switch may carry the same pair (e.g. one per input port), their counters are summed
+        pairs, inverse = np.unique(flat, return_inverse=True)
+        byte_count = np.bincount(inverse, weights=byte_count, minlength=len(pairs))
+        packet_count = np.bincount(inverse, weights=packet_count, minlength=len(pairs))
+        youngest = np.full(len(pairs), np.inf)
+        np.minimum.at(youngest, inverse, duration)
+
+        last_bytes = self.bytes[slot].reshape(-1)
+        last_packets = self.packets[slot].reshape(-1)
+        last_duration = self.duration[slot].reshape(-1)
+        seen = self.seen[slot].reshape(-1)
+        reset = seen[pairs] & ((byte_count < last_bytes[pairs]) | (youngest < last_duration[pairs]))
+        new = ~seen[pairs] | reset
+        # New flows installed during the epoch only carry traffic of the epoch
+        fresh = new & (youngest <= now - self.epoch_start)
+        valid = ~new | fresh
+        delta_bytes = np.where(new, byte_count, byte_count - last_bytes[pairs])
+        delta_packets = np.where(new, packet_count, packet_count - last_packets[pairs])
+        self.epoch_bytes[slot].reshape(-1)[pairs] += np.where(valid, delta_bytes, 0)
+        self.epoch_packets[slot].reshape(-1)[pairs] += np.where(valid, delta_packets, 0)
+        self.epoch_seen[slot].reshape(-1)[pairs] |= valid
+
+        last_bytes[pairs] = byte_count
+        last_packets[pairs] = packet_count
+        last_duration[pairs] = youngest
+        seen[pairs] = True
+        self.last_seen[slot].reshape(-1)[pairs] = now
+        return len(pairs), int(np.count_nonzero(new & (youngest <= now - previous)))
+
+    def emit(self, now = None):
+        """
+        Close the current epoch and start a new one.
+
+        Flows measured by several datapaths (hosts with an unknown ingress switch) are counted once,
+        with the largest volume any of them reported. The completeness of the epoch is recorded in completeness.
+
+        Parameters
+        ----------
+        now : float
+            end time of the epoch, defaults to the current time.
+
+        Returns
+        -------
+        tuple
+            a tuple (volumes, rates, observed) of (size, size) arrays: bytes transferred during the epoch,
+            rates in bytes per second, and whether each flow was measured during the epoch.
+        """
+        now = time.time() if now is None else now
+        count = len(self.slots)
+        observed = self.epoch_seen[:count].any(axis=0)
+        volumes = self.epoch_bytes[:count].max(axis=0, initial=0)
+        rates = volumes / max(now - self.epoch_start, 1e-9)
+        expected = set(self.ingress[self.ingress >= 0].tolist())
+        off_diagonal = ~np.eye(self.size, dtype=bool)
+        self.completeness = {
+            'datapaths': len(self.replied & expected) / len(expected) if expected else float(bool(self.replied)),
+            'flows': float(observed[off_diagonal].mean()) if self.size > 1 else 1.,
+        }
+        self.replied = set()
+        self.epoch_bytes[:count] = 0
+        self.epoch_packets[:count] = 0
+        self.epoch_seen[:count] = False
+        # Flows absent from the replies for too long are forgotten, a reinstalled flow restarts from a new baseline
+        self.seen[:count] &= now - self.last_seen[:count] <= self.expiry
+        self.epoch_start = now
+        return volumes, rates, observed
@@ -3,6 +3,8 @@ import numpy as np
 import time
 from mininet.cli import CLI
 import random
+from injection import inject_round, replay_trace
+import sys
 
 class Generator:
     """
@@ -10,10 +12,13 @@ class Generator:
     from each host terminal to start iperf communication.
     """
 
-    def __init__(self, hosts, duration=10):
+    def __init__(self, hosts, duration=10, interval=5, concurrent=True):
         self.hosts = hosts
         self.duration = duration
+        self.interval = interval # Time between the starts of two rounds
+        self.concurrent = concurrent # Start the flows of a round in parallel rather than one by one
         self.demand = self.initialize_demand()
+        self.start_times = [] # Launch time of the flows of every source host, per round
 
     def initialize_demand(self):
         # Create a 10 x 10 demand matrix.
@@ -46,18 +51,28 @@ class Generator:
 
     def inject_traffic(self):
 
-        for i, src in enumerate(self.hosts):
-            for j, dst in enumerate(self.hosts):
-                if i != j:
-                    volume = self.demand[i][j]  # in bits
-                    if volume > 0:
-                        bandwidth_mbps = volume  # renaming for test sake
-
-                        # Use iperf to generate traffic
-                        src.cmd(f"iperf -c {dst.IP()} -t {self.duration} -b {bandwidth_mbps}M &")
+        start = time.time()
+        # Use iperf to generate traffic, demand values are bandwidths in Mbps
+        start_times = inject_round(self.hosts, self.demand, self.duration, self.concurrent)
+        self.start_times.append(start_times)
 
         self.update_demand()
-        time.sleep(5)
+        # Keep rounds self.interval apart whatever the time spent launching the flows
+        time.sleep(max(0, self.interval - (time.time() - start)))
+
+    def replay(self, path, time_compression=1, scale=1, start=0, stop=None):
+        # Inject a stored demand trace (TensorStore or .npy) round by round instead of the random walk.
+        # Returns the trace index of every round, to match the controller's matrices with their ground truth.
+        indices = []
+        for index, start_times in replay_trace(self.hosts, path, self.interval, time_compression, None, scale, start, stop, self.concurrent):
+            indices.append(index)
+            self.start_times.append(start_times)
+            print(f'trace matrix {index} injected')
+        return indices
+
+    def start_spread(self):
+        # Time between the first and the last flow launch of every round
+        return [np.nanmax(times) - np.nanmin(times) if not np.all(np.isnan(times)) else 0.0 for times in self.start_times]
 
 # Driver code
 if __name__ == '__main__':
@@ -67,12 +82,16 @@ if __name__ == '__main__':
     traffic_gen = Generator(net.hosts)
     print(len(traffic_gen.hosts))
     
-    # Perform 100 experiment
     traffic_gen.start_iperf()
-    for i in range(100):
-        traffic_gen.inject_traffic()
-        print(f'traffic {i} injected')
-    
+    if len(sys.argv) > 1:
+        # Replay a stored trace: python generateRandomTraffic.py <trace path> [time compression]
+        traffic_gen.replay(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    else:
+        # Perform 100 experiment
+        for i in range(100):
+            traffic_gen.inject_traffic()
+            print(f'traffic {i} injected, flows started within {traffic_gen.start_spread()[-1]:.3f}s')
+
     traffic_gen.stop_iperf()
     print("*** Running CLI")
     CLI(net)
@@ -2,6 +2,8 @@ from net_4_hosts import net
 import numpy as np
 import time
 from mininet.cli import CLI
+from injection import inject_round, replay_trace
+import sys
 
 class Generator:
     """
@@ -9,11 +11,13 @@ class Generator:
     from each host terminal to start iperf communication.
     """
 
-    def __init__(self, hosts, demand, duration=10):
+    def __init__(self, hosts, demand, duration=10, concurrent=True):
 
         self.hosts = hosts
         self.demand = demand
         self.duration = duration
+        self.concurrent = concurrent # Start the flows in parallel rather than one by one
+        self.start_times = None # Launch time of the flows of every source host
 
     def start_iperf(self):
         
@@ -34,44 +38,45 @@ class Generator:
         # Small delay to ensure servers are up
         time.sleep(2)
 
-        for i, src in enumerate(self.hosts):
-            for j, dst in enumerate(self.hosts):
-                if i != j:
-                    volume = self.demand[i][j] # in bits
-                    if volume > 0:
-                        """
-                        # Convert volume to bandwidth over given duration
-                        bandwidth = int(volume / self.duration) # in bits per second
-                        # Convert bandwidth to Mbps for iperf 
-                        bandwidth_mbps = bandwidth / (10**6)
-                        """
-                        bandwidth_mbps = volume # renaming for test sake
-
-                        # Use iperf to generate traffic
-                        src.cmd(f"iperf -c {dst.IP()} -t {self.duration} -b {bandwidth_mbps}M &")
-        
+        # Use iperf to generate traffic, demand values are bandwidths in Mbps
+        self.start_times = inject_round(self.hosts, self.demand, self.duration, self.concurrent)
+
         time.sleep(self.duration + 5)
 
         # Stop iperf servers
         self.stop_iperf()
 
+    def replay(self, path, interval=5, time_compression=1, scale=1, start=0, stop=None):
+        # Inject a stored demand trace (TensorStore or .npy, e.g. Geant.npy) round by round, streaming it from disk.
+        # Returns the trace index of every round, to match the controller's matrices with their ground truth.
+        self.start_iperf()
+        time.sleep(2)
+        indices = []
+        for index, start_times in replay_trace(self.hosts, path, interval, time_compression, None, scale, start, stop, self.concurrent):
+            self.start_times = start_times
+            indices.append(index)
+            print(f'trace matrix {index} injected')
+        time.sleep(self.duration)
+        self.stop_iperf()
+        return indices
+
 # Driver code
 if __name__ == '__main__':
 
     print("*** Starting network")
     net.start()
 
-    #traffic_data = np.load('Geant.npy')
-    #demands = traffic_data[0]
-    #""""
     demands = [[0.0, 0.0, 12.0, 0.0],
                [0.0, 0.0, 0.0, 9.0],
                [10.0, 0.0, 0.0, 0.0],
                [0.0, 4.0, 0.0, 0.0]]
-    #"""
-    
+
     traffic_gen = Generator(net.hosts, demands)
-    traffic_gen.inject_traffic() # Adding traffic
+    if len(sys.argv) > 1:
+        # Replay a stored trace: python generateTraffic.py Geant.npy [time compression]
+        traffic_gen.replay(sys.argv[1], time_compression=float(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    else:
+        traffic_gen.inject_traffic() # Adding traffic
 
     print("*** Running CLI")
     CLI(net)
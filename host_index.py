@@ -0,0 +1,115 @@
+import json
+import os
+import numpy as np
+
+def host_mac(index):
+    '''
+    MAC address of the host of a given matrix index: the index + 1 in hexadecimal over the 6 bytes
+    (00:00:00:00:00:01 for index 0), unique for up to 2**48 - 1 hosts.
+
+    Parameters
+    ----------
+    index : int
+        0-based index of the host in the traffic matrices.
+
+    Returns
+    -------
+    str
+        the MAC address.
+    '''
+    value = index + 1
+    return ':'.join(f'{(value >> shift) & 0xff:02x}' for shift in range(40, -8, -8))
+
+def host_ip(index, prefix = 8):
+    '''
+    IP address of the host of a given matrix index in 10.0.0.0/8 (10.0.0.1 for index 0).
+
+    Parameters
+    ----------
+    index : int
+        0-based index of the host in the traffic matrices.
+    prefix : int
+        prefix length appended to the address, None for the bare address.
+
+    Returns
+    -------
+    str
+        the IP address.
+    '''
+    value = index + 1
+    address = f'10.{(value >> 16) & 0xff}.{(value >> 8) & 0xff}.{value & 0xff}'
+    return address if prefix is None else f'{address}/{prefix}'
+
+class HostIndex:
+    """
+    Mapping between hosts and traffic matrix indices, shared by the topology builder, the generators and the controller.
+
+    Attributes
+    ----------
+    name : str
+        Name of the topology.
+    hosts : list
+        Host descriptions of the plan (name, index, mac, ip, switch and port), in index order.
+    mac_to_index : dict
+        Matrix index keyed by host MAC address.
+    size : int
+        Number of hosts, i.e. the size of the traffic matrices.
+    ingress : NDArray
+        Datapath id of the switch every host is attached to, -1 when the topology is unknown.
+
+    Methods
+    -------
+    from_plan(plan)
+        Index of a topology plan (see topology.py).
+
+    load(path)
+        Index of a plan saved as JSON.
+
+    legacy(num_hosts)
+        Index of the hand-written topologies, whose MACs hold the host number in decimal.
+    """
+
+    def __init__(self, name, hosts, switches = None) -> None:
+        self.name = name
+        self.hosts = sorted(hosts, key=lambda host: host['index'])
+        self.mac_to_index = {host['mac']: host['index'] for host in self.hosts}
+        self.size = len(self.hosts)
+        dpids = {switch['name']: switch['dpid'] for switch in switches or []}
+        self.ingress = np.array([dpids.get(host.get('switch'), -1) for host in self.hosts], dtype=np.int64)
+
+    @classmethod
+    def from_plan(cls, plan):
+        """Index of a topology plan (see topology.py)."""
+        return cls(plan['name'], plan['hosts'], plan['switches'])
+
+    @classmethod
+    def load(cls, path):
+        """Index of a plan saved as JSON with topology.save_plan."""
+        with open(path) as f:
+            return cls.from_plan(json.load(f))
+
+    @classmethod
+    def legacy(cls, num_hosts = 10, name = 'net_10_hosts'):
+        """Index of the hand-written topologies (e.g. net_10_hosts), whose MACs hold the host number in decimal."""
+        hosts = [{'name': f'h{i+1}', 'index': i, 'mac': f'00:00:00:00:00:{i+1:02}', 'ip': f'10.0.0.{i+1}'} for i in range(num_hosts)]
+        return cls(name, hosts)
+
+def load_host_index(path = 'output/topology.json', num_hosts = 10):
+    '''
+    Host index of the topology plan published at path, or the legacy 10-host index if no plan was published.
+
+    Parameters
+    ----------
+    path : str
+        path of the plan JSON.
+    num_hosts : int
+        number of hosts of the legacy index.
+
+    Returns
+    -------
+    HostIndex
+        the host index.
+    '''
+    if os.path.exists(path):
+        return HostIndex.load(path)
+    return HostIndex.legacy(num_hosts)
@@ -0,0 +1,317 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.stats
+
+def sort_coordinates(matrix_avg_imp):
+    '''
+    Sort the coordinates of an importance matrix from least to most important, as returned by CNN.lime.
+
+    Parameters
+    ----------
+    matrix_avg_imp : NDArray
+        (n, m) matrix of average feature importances.
+
+    Returns
+    -------
+    NDArray
+        (n*m, 2) array of coordinates, from least to most important.
+    '''
+    i = np.absolute(matrix_avg_imp).argsort(axis=None, kind='mergesort')
+    j = np.unravel_index(i, matrix_avg_imp.shape)
+    return np.vstack(j).T
+
+def rank_agreement(importances_a, importances_b):
+    '''
+    Spearman rank correlation between two importance vectors or matrices.
+
+    Parameters
+    ----------
+    importances_a : NDArray
+        first importances.
+    importances_b : NDArray
+        second importances, same shape as the first.
+
+    Returns
+    -------
+    float
+        rank correlation in [-1, 1].
+    '''
+    ranks_a = np.abs(np.ravel(importances_a)).argsort(kind='mergesort').argsort()
+    ranks_b = np.abs(np.ravel(importances_b)).argsort(kind='mergesort').argsort()
+    if np.all(ranks_a == ranks_b):
+        return 1.0
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+def occlusion_importances(predict_fn, test_X, fill = -1., max_rows = 2**20):
+    '''
+    Average absolute change of the prediction when each feature is replaced by fill, for every sample and feature.
+    Occluded copies of the samples are built and evaluated a group of features at a time.
+
+    Parameters
+    ----------
+    predict_fn : callable
+        function mapping a (k, F) array to k predictions.
+    test_X : NDArray
+        (k, F) array of samples.
+    fill : float
+        value replacing each occluded feature.
+    max_rows : int
+        maximum number of occluded rows materialized at once.
+
+    Returns
+    -------
+    NDArray
+        (F,) array of average importances.
+    '''
+    test_X = np.asarray(test_X, dtype=np.float32)
+    k, num_features = test_X.shape
+    reference = np.reshape(predict_fn(test_X), -1)
+    importances = np.zeros(num_features)
+    group = max(1, max_rows // k)
+    for first in range(0, num_features, group):
+        features = np.arange(first, min(first + group, num_features))
+        occluded = np.repeat(test_X[None, :, :], len(features), axis=0)
+        occluded[np.arange(len(features)), :, features] = fill
+        predictions = np.reshape(predict_fn(occluded.reshape(-1, num_features)), (len(features), k))
+        importances[features] = np.abs(predictions - reference[None, :]).mean(axis=1)
+    return importances
+
+class QuartileSampler:
+    """
+    Perturbation sampler reproducing the default behaviour of lime.lime_tabular.LimeTabularExplainer
+    (quartile discretization, bins drawn from their training frequencies, values drawn from a truncated normal
+    within the bin). Since the perturbations do not depend on the explained instance, one set of samples is
+    shared by a whole block of instances, so the model only evaluates it once per block.
+
+    Methods
+    -------
+    discretize(data)
+        Quartile bin index of every value.
+
+    sample(num_samples, random_state)
+        Draw perturbation bins and values.
+    """
+
+    def __init__(self, train_X) -> None:
+        train_X = np.asarray(train_X, dtype=float)
+        num_features = train_X.shape[1]
+        # Up to 3 unique quartile borders per feature, padded with +inf so that every feature has 4 bins
+        self.borders = np.full((num_features, 3), np.inf)
+        for feature in range(num_features):
+            qts = np.unique(np.percentile(train_X[:, feature], [25, 50, 75]))
+            self.borders[feature, :len(qts)] = qts
+        discretized = self.discretize(train_X)
+        self.means = np.zeros((num_features, 4))
+        self.stds = np.full((num_features, 4), 1e-11)
+        frequencies = np.zeros((num_features, 4))
+        for b in range(4):
+            selected = discretized == b
+            counts = selected.sum(axis=0)
+            frequencies[:, b] = counts
+            safe_counts = np.maximum(counts, 1)
+            mean = np.where(selected, train_X, 0).sum(axis=0) / safe_counts
+            variance = np.where(selected, (train_X - mean) ** 2, 0).sum(axis=0) / safe_counts
+            self.means[:, b] = np.where(counts > 0, mean, 0)
+            self.stds[:, b] += np.where(counts > 0, np.sqrt(variance), 0)
+        self.cumulative = np.cumsum(frequencies / frequencies.sum(axis=1, keepdims=True), axis=1)
+        self.mins = np.concatenate([train_X.min(axis=0)[:, None], self.borders], axis=1)
+        self.maxs = np.concatenate([self.borders, train_X.max(axis=0)[:, None]], axis=1)
+        # Scaling of the discretized data used by LIME for distances and the local regression
+        self.bin_mean = discretized.mean(axis=0)
+        self.bin_scale = discretized.std(axis=0)
+        self.bin_scale[self.bin_scale == 0] = 1
+
+    def discretize(self, data):
+        """Quartile bin index of every value of a (k, F) array."""
+        data = np.asarray(data, dtype=float)
+        return (data[:, :, None] > self.borders[None, :, :]).sum(axis=2)
+
+    def sample(self, num_samples, random_state, max_elements = 2**18):
+        """
+        Draw perturbation bins and the corresponding values, max_elements values at a time.
+
+        Parameters
+        ----------
+        num_samples : int
+            number of perturbations.
+        random_state : numpy.random.Generator
+            source of randomness.
+        max_elements : int
+            maximum number of values drawn at once, bounding the temporary arrays of the truncated normal.
+
+        Returns
+        -------
+        tuple
+            (bins, values), two (num_samples, F) arrays.
+        """
+        num_features = len(self.borders)
+        bins = np.empty((num_samples, num_features), dtype=np.int64)
+        values = np.empty((num_samples, num_features))
+        features = np.arange(num_features)[None, :]
+        chunk = max(1, max_elements // num_features)
+        for first in range(0, num_samples, chunk):
+            last = min(first + chunk, num_samples)
+            u = random_state.random((last - first, num_features))
+            chunk_bins = np.minimum((u[:, :, None] > self.cumulative[None, :, :]).sum(axis=2), 3)
+            means = self.means[features, chunk_bins]
+            stds = self.stds[features, chunk_bins]
+            lower = (self.mins[features, chunk_bins] - means) / stds
+            upper = (self.maxs[features, chunk_bins] - means) / stds
+            chunk_values = means.copy()
+            unequal = np.isfinite(lower) & np.isfinite(upper) & (lower < upper)
+            chunk_values[unequal] = scipy.stats.truncnorm.rvs(lower[unequal], upper[unequal], loc=means[unequal], scale=stds[unequal], random_state=random_state)
+            bins[first:last] = chunk_bins
+            values[first:last] = chunk_values
+        return bins, values
+
+def explain_block(predict_fn, sampler, instances, num_samples = 5000, random_state = None, kernel_width = None, alpha = 1.0, max_elements = 2**20):
+    '''
+    LIME explanation of a block of instances with one shared set of perturbations and a single batched model evaluation.
+    The local regressions accumulate their weighted statistics over chunks of perturbations, so that at most
+    max_elements values of the local representation are materialized at once.
+
+    Parameters
+    ----------
+    predict_fn : callable
+        function mapping a (k, F) array to k predictions.
+    sampler : QuartileSampler
+        perturbation sampler fitted on the training data.
+    instances : NDArray
+        (k, F) array of instances to explain.
+    num_samples : int
+        number of perturbations, as in LimeTabularExplainer.explain_instance.
+    random_state : numpy.random.Generator
+        source of randomness.
+    kernel_width : float
+        width of the exponential kernel. Defaults to 0.75 * sqrt(F) as in LIME.
+    alpha : float
+        regularization strength of the local ridge regression.
+    max_elements : int
+        maximum number of (instance, perturbation, feature) values materialized at once.
+
+    Returns
+    -------
+    NDArray
+        (k, F) array of local regression coefficients.
+    '''
+    random_state = np.random.default_rng(random_state)
+    instances = np.asarray(instances, dtype=float)
+    k, num_features = instances.shape
+    if kernel_width is None:
+        kernel_width = np.sqrt(num_features) * .75
+    bins, values = sampler.sample(num_samples - 1, random_state)
+    predictions = np.reshape(predict_fn(np.concatenate([instances, values]).astype(np.float32)), -1)
+    del values
+    instance_predictions, sample_predictions = predictions[:k], predictions[k:]
+    instance_bins = sampler.discretize(instances)
+    # Weighted sums of the ridge regression with intercept, for all instances at once
+    weight_sum = np.zeros(k)
+    x_sum = np.zeros((k, num_features))
+    y_sum = np.zeros(k)
+    xx_sum = np.zeros((k, num_features, num_features))
+    xy_sum = np.zeros((k, num_features))
+    chunk = max(1, max_elements // (k * num_features))
+    for first in range(0, num_samples, chunk):
+        rows = np.arange(first, min(first + chunk, num_samples))
+        perturbed = rows > 0
+        # Local representation: 1 where a perturbation falls in the instance's bin, row 0 is the instance itself
+        binary = np.ones((k, len(rows), num_features))
+        binary[:, perturbed] = bins[rows[perturbed] - 1][None, :, :] == instance_bins[:, None, :]
+        labels = np.where(perturbed[None, :], sample_predictions[np.maximum(rows - 1, 0)][None, :], instance_predictions[:, None])
+        scaled = (binary - sampler.bin_mean) / sampler.bin_scale
+        distances = np.sqrt((((1 - binary) / sampler.bin_scale) ** 2).sum(axis=2))
+        del binary
+        weights = np.sqrt(np.exp(-(distances ** 2) / kernel_width ** 2))
+        weighted = scaled * weights[:, :, None]
+        weight_sum += weights.sum(axis=1)
+        x_sum += weighted.sum(axis=1)
+        y_sum += (weights * labels).sum(axis=1)
+        xx_sum += np.matmul(scaled.transpose(0, 2, 1), weighted)
+        xy_sum += np.matmul(weighted.transpose(0, 2, 1), labels[:, :, None])[:, :, 0]
+    # Centering around the weighted means: sum w (x - x_mean)(x - x_mean)^T = sum w x x^T - x_sum x_sum^T / sum w
+    gram = xx_sum - x_sum[:, :, None] * x_sum[:, None, :] / weight_sum[:, None, None] + alpha * np.eye(num_features)
+    rhs = xy_sum - x_sum * (y_sum / weight_sum)[:, None]
+    return np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+
+_worker_predict = None
+
+def _init_worker(model_path):
+    global _worker_predict
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path)
+    _worker_predict = lambda x: model(x, training=False).numpy()
+
+def _explain_worker(sampler, instances, num_samples, seed):
+    return np.abs(explain_block(_worker_predict, sampler, instances, num_samples, seed)).sum(axis=0)
+
+def lime_importances(predict_fn, train_X, test_X, num_instances = 500, num_samples = 5000, block_size = 10, tolerance = 0.999, patience = 3, n_jobs = 1, model_path = None, seed = None):
+    '''
+    Average absolute LIME importance of every feature over random test instances, explained in blocks.
+    Stops early once the importance ranking has been stable for patience consecutive blocks.
+
+    Parameters
+    ----------
+    predict_fn : callable
+        function mapping a (k, F) array to k predictions, used when n_jobs is 1.
+    train_X : NDArray
+        training dataset, used to fit the perturbation sampler.
+    test_X : NDArray
+        test dataset to sample for feature relevance computation.
+    num_instances : int
+        maximum number of test instances to explain.
+    num_samples : int
+        number of perturbations per block.
+    block_size : int
+        number of instances explained together.
+    tolerance : float
+        Spearman correlation between consecutive rankings above which the ranking is considered stable.
+        Values above 1 disable early stopping.
+    patience : int
+        number of consecutive stable blocks required to stop.
+    n_jobs : int
+        number of worker processes. Workers load the model from model_path.
+    model_path : str
+        path of the saved Keras model, required when n_jobs > 1.
+    seed : int
+        seed of the instance selection and perturbations.
+
+    Returns
+    -------
+    tuple
+        (importance_averages, num_explained), the (F,) average importances and the number of explained instances.
+    '''
+    random_state = np.random.default_rng(seed)
+    test_X = np.asarray(test_X)
+    sampler = QuartileSampler(train_X)
+    indices = random_state.choice(len(test_X), min(num_instances, len(test_X)), replace=False)
+    blocks = [test_X[indices[i:i + block_size]] for i in range(0, len(indices), block_size)]
+    seeds = random_state.integers(2**32, size=len(blocks))
+    if n_jobs > 1:
+        if model_path is None:
+            raise ValueError('A saved model path is required to explain with more than one process.')
+        # Workers are spawned, forking a parent that already loaded TensorFlow can deadlock
+        executor = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker, initargs=(model_path,))
+        results = (future.result() for future in [executor.submit(_explain_worker, sampler, block, num_samples, s) for block, s in zip(blocks, seeds)])
+    else:
+        executor = None
+        results = (np.abs(explain_block(predict_fn, sampler, block, num_samples, s)).sum(axis=0) for block, s in zip(blocks, seeds))
+    importance_sums = np.zeros(test_X.shape[1])
+    count = 0
+    previous = None
+    stable = 0
+    try:
+        for block, block_sums in zip(blocks, results):
+            importance_sums += block_sums
+            count += len(block)
+            if previous is not None and rank_agreement(previous, importance_sums) >= tolerance:
+                stable += 1
+                if stable >= patience:
+                    break
+            else:
+                stable = 0
+            previous = importance_sums.copy()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return importance_sums / count, count
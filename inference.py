@@ -0,0 +1,203 @@
+import itertools
+import time
+from collections import deque
+from preprocessing import *
+from registry import model_key
+
+class CompletionService:
+    """
+    Online estimation of the missing flows of live traffic matrices.
+
+    A model only estimates the coordinates it was trained for: missing coordinates are estimated by the model of
+    their own coordinate, loaded from a published manifest or from the model registry, and left missing (NaN)
+    when no such model exists. Each model is fed inputs holed like its training samples (see trainer.train_snapshot):
+    its target and every other unmeasured flow are missing (-1). The missing coordinates of a model are estimated
+    in a single prediction: their samples are stacked, or a single matrix is fed to a multi-output model (MultiCNN)
+    estimating all of them at once.
+    The model of every coordinate is looked up once, when the service is created and whenever a new version is
+    published, and kept in memory: completing a matrix never reads the registry nor loads a model.
+    Their NumPy export is used when available, so serving predictions does not require importing TensorFlow.
+
+    Attributes
+    ----------
+    manifests : dict
+        Manifest of the loaded model version of every coordinate.
+    registry : ModelRegistry
+        Optional registry the models of the other coordinates are looked up in.
+    topology : str
+        Name of the topology, part of the registry keys.
+    shape : tuple
+        Shape of the completed matrices, taken from the first loaded manifest when not given.
+    latencies : deque
+        Wall time in seconds of the most recent completions.
+
+    Methods
+    -------
+    load(manifest)
+        Load the model version described by manifest, unless it is already loaded.
+
+    refresh()
+        Look up the newest registered model of every coordinate without a published model.
+
+    complete(matrix, missing_coordinates)
+        Estimate the missing values of a raw traffic matrix that have a model.
+
+    latency_percentiles(percentiles)
+        Completion latency percentiles over the most recent requests.
+    """
+
+    def __init__(self, manifest = None, latency_window = 1000, registry = None, topology = 'default', shape = None) -> None:
+        self.manifests = {}
+        # (model, scaler, output column) of every coordinate with a model, the column is None for single-output models
+        self.models = {}
+        self.entries = {}
+        self.registry = registry
+        self.topology = topology
+        self.shape = None if shape is None else tuple(shape)
+        self.scalers = {}
+        self.latencies = deque(maxlen=latency_window)
+        if manifest is None or not self.load(manifest):
+            self.refresh()
+
+    @property
+    def ready(self):
+        """Whether a model of at least one coordinate is loaded."""
+        return bool(self.models)
+
+    def _scaler(self, path):
+        if path not in self.scalers:
+            self.scalers[path] = load_scaler(path)
+        return self.scalers[path]
+
+    def load(self, manifest):
+        """
+        Load the model version described by manifest, unless it is already loaded.
+
+        Parameters
+        ----------
+        manifest : dict
+            manifest of a model version, as published by trainer.TrainingScheduler.
+
+        Returns
+        -------
+        bool
+            whether a new model was loaded.
+        """
+        if manifest is None:
+            return False
+        # Multi-output manifests list their target coordinates, the others have a single one
+        multi = 'target_coordinates' in manifest
+        coordinates = [tuple(coordinate) for coordinate in manifest['target_coordinates']] if multi else [tuple(manifest['target_coordinate'])]
+        if all(self.manifests.get(coordinate, {}).get('version') == manifest['version'] for coordinate in coordinates):
+            return False
+        if self.shape is None:
+            self.shape = tuple(manifest['input_shape'][:2])
+        if 'lite_model' in manifest:
+            from lite_model import load_model
+            model = load_model(manifest['lite_model'])
+        elif multi:
+            from CNN import MultiCNN
+            model = MultiCNN.load(manifest['model'], self.shape + (1,), coordinates)
+        else:
+            # Models published without a lite artifact need TensorFlow, only imported in that case
+            from CNN import CNN
+            model = CNN.load(manifest['model'], coordinates[0])
+        scaler = self._scaler(manifest['scaler'])
+        for column, coordinate in enumerate(coordinates):
+            self.models[coordinate] = (model, scaler, column if multi else None)
+            self.manifests[coordinate] = manifest
+        # New versions of the other coordinates may have been registered meanwhile
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """
+        Look up the newest registered model of every coordinate without a published model, and load the ones
+        that changed since the previous lookup. Reads every registry entry once: meant to run when a model is
+        published, never per completion.
+
+        Returns
+        -------
+        int
+            number of coordinates with a model.
+        """
+        if self.registry is None or self.shape is None:
+            return len(self.models)
+        for coordinate in itertools.product(range(self.shape[0]), range(self.shape[1])):
+            if coordinate in self.manifests:
+                continue
+            entry = self.registry.find(model_key(self.topology, self.shape + (1,), coordinate))
+            if entry is None or self.entries.get(coordinate) == entry['created']:
+                continue
+            model = self.registry.get(entry['key'])
+            self.models[coordinate] = (model, self._scaler(entry['artifacts']['scaler']), None)
+            self.entries[coordinate] = entry['created']
+        return len(self.models)
+
+    def complete(self, matrix, missing_coordinates):
+        """
+        Estimate the missing values of a raw (unscaled) traffic matrix, for the coordinates that have a model.
+
+        Parameters
+        ----------
+        matrix : NDArray
+            raw (n, m) traffic matrix.
+        missing_coordinates : list
+            list of coordinates (tuples) of the unmeasured flows, all of them are estimated when they have a model.
+
+        Returns
+        -------
+        NDArray
+            copy of matrix with the missing values replaced by their estimation, or by NaN for the coordinates
+            without a model. None if no model is available.
+        """
+        if not self.ready:
+            return None
+        start = time.perf_counter()
+        completed = np.array(matrix, dtype=float)
+        shape = completed.shape
+        missing_coordinates = [(int(i), int(j)) for i, j in missing_coordinates]
+        # Missing coordinates are grouped by model, every model predicts once
+        groups = {}
+        for coordinate in missing_coordinates:
+            found = self.models.get(coordinate)
+            if found is None:
+                completed[coordinate] = np.nan
+                continue
+            groups.setdefault(id(found[0]), (found[0], found[1], found[2] is not None, []))[3].append((coordinate, found[2]))
+        scaled = {}
+        for model, scaler, multi, targets in groups.values():
+            # Models sharing a scaler share the scaled matrix
+            if id(scaler) not in scaled:
+                scaled[id(scaler)] = scale_data(scaler, np.expand_dims(np.asarray(matrix, dtype=float), 0))[0]
+            coordinates = [coordinate for coordinate, _ in targets]
+            positions = flat_positions(shape, coordinates)
+            if multi:
+                # Multi-output models take the whole matrix, every missing flow holed (see process_data_masked)
+                samples = scaled[id(scaler)].reshape(1, -1).copy()
+                samples[:, flat_positions(shape, missing_coordinates)] = -1
+                predictions = np.reshape(model.predict(samples), (1, -1))[0, [column for _, column in targets]]
+            else:
+                samples = np.concatenate([build_inference_samples(scaled[id(scaler)], coordinate, missing_coordinates) for coordinate in coordinates])
+                predictions = np.reshape(model.predict(samples), (len(samples), -1))[:, 0]
+            completed.reshape(-1)[positions] = (predictions - scaler.min_[positions]) / scaler.scale_[positions]
+        self.latencies.append(time.perf_counter() - start)
+        return completed
+
+    def latency_percentiles(self, percentiles = (50, 95, 99)):
+        """
+        Completion latency percentiles over the most recent requests.
+
+        Parameters
+        ----------
+        percentiles : tuple
+            percentiles to compute.
+
+        Returns
+        -------
+        dict
+            latency in seconds keyed by percentile, empty if no completion was served yet.
+        """
+        if not self.latencies:
+            return {}
+        return dict(zip(percentiles, np.percentile(self.latencies, percentiles)))
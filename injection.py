@@ -0,0 +1,176 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from tensor_store import TensorStore
+
+def iperf_commands(hosts, demand, i, duration):
+    '''
+    iperf client commands of the flows sent by host i for one round of a demand matrix.
+
+    Parameters
+    ----------
+    hosts : list
+        list of Mininet hosts, in demand matrix order.
+    demand : NDArray
+        demand matrix in Mbps.
+    i : int
+        index of the source host.
+    duration : int
+        duration of the flows in seconds.
+
+    Returns
+    -------
+    list
+        list of background iperf commands, one per flow with a positive demand.
+    '''
+    return [f"iperf -c {dst.IP()} -t {duration} -b {demand[i][j]}M &" for j, dst in enumerate(hosts) if i != j and demand[i][j] > 0]
+
+def launch_host_flows(src, commands):
+    '''
+    Start all the flows of a source host with a single round trip to its shell.
+
+    Parameters
+    ----------
+    src : object
+        Mininet host.
+    commands : list
+        background iperf commands, see iperf_commands.
+
+    Returns
+    -------
+    float
+        time the flows were launched at, as reported by the host shell.
+    '''
+    output = src.cmd('date +%s.%N; ' + ' '.join(commands))
+    # The shell may also print job control notices of the background flows
+    for token in output.split():
+        try:
+            return float(token)
+        except ValueError:
+            continue
+    return time.time()
+
+def inject_round(hosts, demand, duration, concurrent = True):
+    '''
+    Start the flows of one round of a demand matrix.
+
+    In concurrent mode the flows of every source host are batched in one shell invocation and the hosts are
+    driven in parallel by a thread pool, so that all the flows of a round start within a tight window. Otherwise
+    every flow is started by its own blocking host.cmd call, one after another.
+
+    Parameters
+    ----------
+    hosts : list
+        list of Mininet hosts, in demand matrix order.
+    demand : NDArray
+        demand matrix in Mbps.
+    duration : int
+        duration of the flows in seconds.
+    concurrent : bool
+        whether to start the flows concurrently.
+
+    Returns
+    -------
+    NDArray
+        launch time of the flows of every source host, NaN for hosts without flows.
+    '''
+    commands = [iperf_commands(hosts, demand, i, duration) for i in range(len(hosts))]
+    start_times = np.full(len(hosts), np.nan)
+    senders = [i for i in range(len(hosts)) if commands[i]]
+    if concurrent:
+        # Every Mininet host has its own shell, so different hosts can be driven from different threads
+        with ThreadPoolExecutor(max_workers=max(1, len(senders))) as executor:
+            for i, start in zip(senders, executor.map(lambda i: launch_host_flows(hosts[i], commands[i]), senders)):
+                start_times[i] = start
+    else:
+        for i in senders:
+            start_times[i] = time.time()
+            for command in commands[i]:
+                hosts[i].cmd(command)
+    return start_times
+
+def iter_trace(path, start = 0, stop = None):
+    '''
+    Stream the demand matrices of a stored trace one at a time, without loading the trace in memory.
+
+    Parameters
+    ----------
+    path : str
+        path of a TensorStore directory or of a .npy file (e.g. Geant.npy) of shape (k, n, n).
+    start : int
+        index of the first matrix.
+    stop : int
+        index after the last matrix. If None, stream up to the last matrix.
+
+    Yields
+    ------
+    tuple
+        a tuple (index, matrix, timestamp) per matrix, timestamp being None for .npy traces.
+    '''
+    if os.path.isdir(path):
+        store = TensorStore(path, mode='r')
+        first = max(0, start)
+        for chunk in store.iter_chunks(start, stop):
+            timestamps = store.timestamps(first, first + len(chunk))
+            for k in range(len(chunk)):
+                yield first + k, chunk[k], float(timestamps[k])
+            first += len(chunk)
+    else:
+        trace = np.load(path, mmap_mode='r')
+        stop = len(trace) if stop is None else min(stop, len(trace))
+        for index in range(max(0, start), stop):
+            yield index, trace[index], None
+
+def replay_trace(hosts, path, interval = 5, time_compression = 1, duration = None, scale = 1, start = 0, stop = None, concurrent = True):
+    '''
+    Replay a stored demand trace round by round, one matrix per round.
+
+    Rounds follow the recorded timestamps of TensorStore traces (interval apart for .npy traces), divided by
+    time_compression. Flows last until the next round unless duration is set.
+
+    Parameters
+    ----------
+    hosts : list
+        list of Mininet hosts, in demand matrix order. Larger traces are truncated to the first len(hosts) hosts.
+    path : str
+        path of a TensorStore directory or of a .npy file.
+    interval : float
+        time in seconds between matrices of traces without timestamps.
+    time_compression : float
+        factor the trace time is accelerated by.
+    duration : int
+        duration of the flows in seconds, None for the time until the next round.
+    scale : float
+        factor converting the trace values to Mbps.
+    start : int
+        index of the first matrix to replay.
+    stop : int
+        index after the last matrix to replay.
+    concurrent : bool
+        whether to start the flows of a round concurrently, see inject_round.
+
+    Yields
+    ------
+    tuple
+        a tuple (index, start_times) per round once its flows are started, index being the position of the
+        replayed matrix in the trace (the ground truth of the round) and start_times the launch times of inject_round.
+    '''
+    n = len(hosts)
+    rounds = iter_trace(path, start, stop)
+    current = next(rounds, None)
+    while current is not None:
+        index, matrix, timestamp = current
+        upcoming = next(rounds, None)
+        if timestamp is None or upcoming is None or upcoming[2] is None:
+            gap = interval
+        else:
+            gap = upcoming[2] - timestamp
+        gap /= time_compression
+        round_duration = duration if duration is not None else max(1, math.ceil(gap))
+        round_start = time.time()
+        demand = np.asarray(matrix[:n, :n], dtype=np.float64) * scale
+        yield index, inject_round(hosts, demand, round_duration, concurrent)
+        time.sleep(max(0, gap - (time.time() - round_start)))
+        current = upcoming
@@ -0,0 +1,182 @@
+import json
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+class LiteModel:
+    """
+    Pure NumPy inference of a completion CNN exported with CNN.export, for processes that must not import TensorFlow.
+
+    The exported artifact is a single .npz file holding the weights and a JSON description of the layer stack.
+    Batch normalization is folded into the preceding convolution at export time, so the forward pass only
+    runs convolutions, ReLUs, max-pooling and dense layers.
+
+    Attributes
+    ----------
+    input_shape : tuple
+        The shape of the input matrices extended by a 1-valued position (e.g (10, 10, 1) for 10 x 10 matrices).
+    nbytes : int
+        Memory used by the weights.
+
+    Methods
+    -------
+    predict(data_X)
+        Make a prediction on a batch of traffic matrices.
+    """
+
+    def __init__(self, path) -> None:
+        """
+        Load an exported model.
+
+        Parameters
+        ----------
+        path : str
+            path of the .npz file written by CNN.export.
+        """
+        with np.load(path) as artifact:
+            self.ops = json.loads(str(artifact['ops']))
+            self.weights = {name: artifact[name] for name in artifact.files if name != 'ops'}
+        self.input_shape = tuple(self.ops[0]['shape'])
+        self.nbytes = sum(weight.nbytes for weight in self.weights.values())
+        self.path = path
+
+    def _conv2d(self, x, op):
+        kernel = self.weights[op['kernel']].astype(np.float32)
+        kh, kw, channels, filters = kernel.shape
+        if op['padding'] == 'same':
+            # Same padding as TensorFlow: the extra row/column goes to the bottom/right
+            x = np.pad(x, ((0, 0), ((kh - 1) // 2, kh // 2), ((kw - 1) // 2, kw // 2), (0, 0)))
+        windows = sliding_window_view(x, (kh, kw), axis=(1, 2))
+        batch, height, width = windows.shape[:3]
+        windows = windows.transpose(0, 1, 2, 4, 5, 3).reshape(batch * height * width, kh * kw * channels)
+        out = windows @ kernel.reshape(kh * kw * channels, filters) + self.weights[op['bias']]
+        return out.reshape(batch, height, width, filters)
+
+    def _maxpool(self, x, op):
+        ph, pw = op['pool_size']
+        batch, height, width, channels = x.shape
+        height, width = height // ph, width // pw
+        x = x[:, :height * ph, :width * pw]
+        return x.reshape(batch, height, ph, width, pw, channels).max(axis=(2, 4))
+
+    def predict(self, data_X):
+        """
+        Make a prediction on a batch of traffic matrices.
+
+        Parameters
+        ----------
+        data_X : NDArray
+            A numpy array of incomplete traffic matrices of shape (k, N*M), or a single matrix of shape (N*M,).
+
+        Returns
+        -------
+        NDArray
+            array of predictions of shape (k, outputs).
+        """
+        x = np.asarray(data_X, dtype=np.float32)
+        if x.ndim == 1:
+            x = np.expand_dims(x, 0)
+        for op in self.ops:
+            kind = op['op']
+            if kind == 'reshape':
+                x = x.reshape((len(x),) + tuple(op['shape']))
+            elif kind == 'conv2d':
+                x = self._conv2d(x, op)
+            elif kind == 'maxpool':
+                x = self._maxpool(x, op)
+            elif kind == 'flatten':
+                x = x.reshape(len(x), -1)
+            elif kind == 'dense':
+                x = x @ self.weights[op['kernel']].astype(np.float32) + self.weights[op['bias']]
+            if op.get('activation') == 'relu':
+                x = np.maximum(x, 0)
+        return x
+
+def _tflite_interpreter():
+    # Prefer the standalone runtimes, which do not pull TensorFlow in
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+class TFLiteModel:
+    """
+    Inference of a quantized completion CNN exported with CNN.quantize, through the TFLite interpreter.
+
+    Attributes
+    ----------
+    nbytes : int
+        Size of the model file.
+
+    Methods
+    -------
+    predict(data_X)
+        Make a prediction on a batch of traffic matrices.
+    """
+
+    def __init__(self, path, num_threads = None) -> None:
+        """
+        Load a .tflite model.
+
+        Parameters
+        ----------
+        path : str
+            path of the .tflite file written by CNN.quantize.
+        num_threads : int
+            number of interpreter threads, None for the runtime default.
+        """
+        self.interpreter = _tflite_interpreter()(model_path=path, num_threads=num_threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.interpreter.allocate_tensors()
+        self.batch_size = int(self.input['shape'][0])
+        self.nbytes = os.path.getsize(path)
+        self.path = path
+
+    def predict(self, data_X):
+        """
+        Make a prediction on a batch of traffic matrices.
+
+        Parameters
+        ----------
+        data_X : NDArray
+            A numpy array of incomplete traffic matrices of shape (k, N*M), or a single matrix of shape (N*M,).
+
+        Returns
+        -------
+        NDArray
+            array of predictions of shape (k, outputs).
+        """
+        x = np.asarray(data_X, dtype=np.float32)
+        if x.ndim == 1:
+            x = np.expand_dims(x, 0)
+        if len(x) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input['index'], [len(x), x.shape[1]])
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(x)
+        self.interpreter.set_tensor(self.input['index'], x)
+        self.interpreter.invoke()
+        return np.array(self.interpreter.get_tensor(self.output['index']))
+
+def load_model(path):
+    """
+    Load an exported completion model without TensorFlow: .tflite files with TFLiteModel, .npz files with LiteModel.
+
+    Parameters
+    ----------
+    path : str
+        path of the exported model.
+
+    Returns
+    -------
+    LiteModel or TFLiteModel
+        the loaded model.
+    """
+    if path.endswith('.tflite'):
+        return TFLiteModel(path)
+    return LiteModel(path)
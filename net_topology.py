@@ -0,0 +1,63 @@
+"""
+Parameterized topologies: linear, tree, fat-tree, edge list or GraphML networks of any size,
+built from a plan of topology.py. The plan is published for the controller, which sizes the
+traffic matrices and maps MAC addresses to matrix indices from it.
+
+	sudo python net_topology.py linear 30
+	sudo python net_topology.py tree 3 2
+	sudo python net_topology.py fat_tree 4
+	sudo python net_topology.py graphml Geant2012.graphml
+"""
+
+import sys
+from mininet.topo import Topo
+from mininet.net import Mininet
+from mininet.node import RemoteController
+from mininet.log import setLogLevel
+from mininet.cli import CLI
+from topology import *
+
+class PlanTopo( Topo ):
+	"Topology built from a plan of topology.py."
+
+	def build( self, plan ):
+		for switch in plan['switches']:
+			self.addSwitch( switch['name'], dpid='%016x' % switch['dpid'], protocols='OpenFlow13' )
+		for host in plan['hosts']:
+			self.addHost( host['name'], mac=host['mac'], ip=host['ip'] + '/8' )
+		# Explicit port numbers keep the ports of the published plan
+		for link in plan['links']:
+			self.addLink( link['node1'], link['node2'], port1=link['port1'], port2=link['port2'] )
+
+def make_plan( kind, *args ):
+	"Plan of a topology kind (linear, tree, fat_tree, edge_list or graphml) and its arguments."
+	if kind == 'linear':
+		return linear_plan( *[int(arg) for arg in args] )
+	if kind == 'tree':
+		return tree_plan( *[int(arg) for arg in args] )
+	if kind == 'fat_tree':
+		return fat_tree_plan( int(args[0]) )
+	if kind == 'edge_list':
+		with open( args[0] ) as f:
+			edges = [line.split()[:2] for line in f if line.strip() and not line.startswith('#')]
+		return edge_list_plan( edges, *[int(arg) for arg in args[1:]] )
+	if kind == 'graphml':
+		return graphml_plan( args[0], *[int(arg) for arg in args[1:]] )
+	raise ValueError( f'Unknown topology {kind}, expected one of linear, tree, fat_tree, edge_list, graphml.' )
+
+TOPOS = {'plan': ( lambda kind, *args: PlanTopo( plan=make_plan( kind, *args ) ) ) }
+
+# Drive code
+if __name__ == '__main__':
+
+	setLogLevel('info')
+	plan = make_plan( *sys.argv[1:] ) if len(sys.argv) > 1 else linear_plan( 5, 2 )
+	save_plan( plan )
+	print( f"*** {plan['name']}: {len(plan['hosts'])} hosts, {len(plan['switches'])} switches, plan published in output/topology.json" )
+	net = Mininet( topo=PlanTopo( plan=plan ),
+                  controller=RemoteController( 'c0',
+                                              ip='127.0.0.1',
+                                              port=6653 ) )
+	net.start()
+	CLI( net )
+	net.stop()
@@ -0,0 +1,139 @@
+import os
+import numpy as np
+import tensorflow as tf
+from preprocessing import *
+from tensor_store import TensorStore
+
+def iter_source_chunks(source, start = 0, stop = None, chunk_size = 1024):
+    '''
+    Iterate over a source of traffic matrices one chunk at a time.
+
+    Parameters
+    ----------
+    source : TensorStore, str, NDArray or callable
+        a TensorStore, the path of a TensorStore or .npy file, an array of matrices, or a callable returning
+        an iterable of (k, n, m) chunks (e.g. a generator function).
+    start : int
+        index of the first matrix. Ignored for callables.
+    stop : int
+        index after the last matrix. Ignored for callables.
+    chunk_size : int
+        number of matrices per chunk for array sources.
+
+    Yields
+    ------
+    NDArray
+        chunks of shape (k, n, m).
+    '''
+    if callable(source):
+        yield from source()
+        return
+    if isinstance(source, str):
+        source = TensorStore(source, mode='r') if os.path.isdir(source) else np.load(source, mmap_mode='r')
+    if isinstance(source, TensorStore):
+        yield from source.iter_chunks(start, stop)
+        return
+    stop = len(source) if stop is None else min(stop, len(source))
+    for first in range(start, stop, chunk_size):
+        yield source[first:min(first + chunk_size, stop)]
+
+def matrix_dataset(source, shape, y_coordinate, missing_values_coordinates, start = 0, stop = None, scaler = None, batch_size = 64, shuffle_buffer = 4096, cache = None, seed = None):
+    '''
+    Build a tf.data pipeline of (x, y) batches from a streaming source of traffic matrices, with the same
+    hole-digging and recentering as process_data. Chunks are read lazily, transformed in parallel,
+    optionally cached, shuffled within a buffer and prefetched, so the whole dataset never has to fit in memory.
+
+    Parameters
+    ----------
+    source : TensorStore, str, NDArray or callable
+        source of traffic matrices, see iter_source_chunks.
+    shape : tuple
+        shape (n, m) of the traffic matrices.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    missing_values_coordinates: list
+        list of coordinates missing value measurement. Should always include y_coordinate.
+    start : int
+        index of the first matrix to use.
+    stop : int
+        index after the last matrix to use.
+    scaler : object
+        optional fitted scaler applied to the raw matrices, as scale_data does.
+    batch_size : int
+        number of samples per batch.
+    shuffle_buffer : int
+        size of the shuffling buffer. 0 disables shuffling.
+    cache : str
+        None to disable caching, '' to cache transformed samples in memory, or a file path to cache them on disk.
+    seed : int
+        seed of the shuffling buffer.
+
+    Returns
+    -------
+    tf.data.Dataset
+        dataset of (x, y) batches, x of shape (batch, n*m) and y of shape (batch,).
+    '''
+    size = shape[0]*shape[1]
+    indices = tf.constant(recenter_indices(shape, y_coordinate))
+    holes = tf.constant(np.isin(recenter_indices(shape, y_coordinate), flat_positions(shape, missing_values_coordinates)))
+    target = int(flat_positions(shape, [y_coordinate])[0])
+    scale = tf.constant(scaler.scale_ if scaler is not None else np.ones(size), tf.float32)
+    offset = tf.constant(scaler.min_ if scaler is not None else np.zeros(size), tf.float32)
+
+    def transform(chunk):
+        flat = tf.reshape(chunk, (-1, size)) * scale + offset
+        x = tf.gather(flat, indices, axis=1)
+        x = tf.where(holes, tf.constant(-1., tf.float32), x)
+        return x, flat[:, target]
+
+    dataset = tf.data.Dataset.from_generator(
+        lambda: (np.asarray(chunk, dtype=np.float32) for chunk in iter_source_chunks(source, start, stop)),
+        output_signature=tf.TensorSpec(shape=(None,) + tuple(shape), dtype=tf.float32))
+    dataset = dataset.map(transform, num_parallel_calls=tf.data.AUTOTUNE).unbatch()
+    if cache is not None:
+        dataset = dataset.cache(cache)
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def split_datasets(source, shape, y_coordinate, missing_values_coordinates, train_test_split = 0.2, scaler = None, batch_size = 64, shuffle_buffer = 4096, cache = None, seed = None):
+    '''
+    Build training and test pipelines over a TensorStore, path or array, the last train_test_split portion of the
+    matrices (in collection order) being used for testing.
+
+    Parameters
+    ----------
+    source : TensorStore, str or NDArray
+        source of traffic matrices with a known length.
+    shape : tuple
+        shape (n, m) of the traffic matrices.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    missing_values_coordinates: list
+        list of coordinates missing value measurement. Should always include y_coordinate.
+    train_test_split : float
+        portion of data dedicated to testing purposes.
+    scaler : object
+        optional fitted scaler applied to the raw matrices.
+    batch_size : int
+        number of samples per batch.
+    shuffle_buffer : int
+        size of the shuffling buffer of the training pipeline.
+    cache : str
+        None to disable caching, '' to cache in memory, or a file path prefix to cache on disk.
+    seed : int
+        seed of the shuffling buffer.
+
+    Returns
+    -------
+    tuple
+        a tuple (train_dataset, test_dataset) ready for CNN.train.
+    '''
+    if isinstance(source, str):
+        source = TensorStore(source, mode='r') if os.path.isdir(source) else np.load(source, mmap_mode='r')
+    size = int(len(source) * (1-train_test_split))
+    train_cache = None if cache is None else (cache and cache + '_train')
+    test_cache = None if cache is None else (cache and cache + '_test')
+    train = matrix_dataset(source, shape, y_coordinate, missing_values_coordinates, 0, size, scaler, batch_size, shuffle_buffer, train_cache, seed)
+    test = matrix_dataset(source, shape, y_coordinate, missing_values_coordinates, size, None, scaler, batch_size, 0, test_cache)
+    return train, test
@@ -0,0 +1,204 @@
+import time
+from collections import deque
+import numpy as np
+
+# Phase offsets of successive datapaths follow the golden ratio sequence, evenly spread whatever their number
+GOLDEN_RATIO = (5 ** 0.5 - 1) / 2
+
+class PollingScheduler:
+    """
+    Schedule of the flow statistics requests of many datapaths.
+
+    Requests are staggered: every datapath gets its own phase within the polling interval, so that replies
+    arrive spread over the interval instead of in one burst. The polling period of every datapath adapts to the
+    churn of its flows, i.e. the fraction of flows installed or reinstalled since the previous reply: it is
+    halved (down to min_interval) when churn is high and grown back (up to interval) when churn is low.
+    The time between every request and its (last) reply is recorded per datapath.
+
+    Attributes
+    ----------
+    interval : float
+        Longest polling period in seconds.
+    min_interval : float
+        Shortest polling period in seconds.
+    high_churn : float
+        Churn above which the polling period of a datapath is halved.
+    low_churn : float
+        Churn below which the polling period of a datapath is grown by half.
+    periods : dict
+        Current polling period of every datapath.
+
+    Methods
+    -------
+    add(dpid, now)
+        Schedule a datapath.
+
+    remove(dpid)
+        Stop polling a datapath.
+
+    due(now)
+        Datapaths to poll now.
+
+    wait(now)
+        Time until the next due request.
+
+    record_request(dpid, xid, now)
+        Record a sent request.
+
+    record_reply(dpid, xid, flows, changed, more, now)
+        Record a (part of a) reply and adapt the polling period of its datapath.
+
+    latency(dpid)
+        Request-to-reply latency percentiles of a datapath.
+    """
+
+    def __init__(self, interval = 30, min_interval = 5, high_churn = 0.1, low_churn = 0.01, history = 100) -> None:
+        self.interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.high_churn = high_churn
+        self.low_churn = low_churn
+        self.history = history
+        self.periods = {}
+        self.next_poll = {}
+        self.pending = {}
+        self.replies = {}
+        self.latencies = {}
+        self.timeouts = {}
+        self.added = 0
+
+    def add(self, dpid, now = None):
+        """Schedule a datapath, its first request being offset from the others within the interval."""
+        now = time.time() if now is None else now
+        if dpid in self.periods:
+            return
+        self.periods[dpid] = self.interval
+        self.next_poll[dpid] = now + (self.added * GOLDEN_RATIO % 1) * self.interval
+        self.latencies[dpid] = deque(maxlen=self.history)
+        self.timeouts[dpid] = 0
+        self.added += 1
+
+    def remove(self, dpid):
+        """Stop polling a datapath (e.g. on disconnection)."""
+        for table in (self.periods, self.next_poll, self.pending, self.replies, self.latencies, self.timeouts):
+            table.pop(dpid, None)
+
+    def due(self, now = None):
+        """
+        Datapaths whose request is due, their next request being scheduled one period later.
+
+        Parameters
+        ----------
+        now : float
+            current time, defaults to the current time.
+
+        Returns
+        -------
+        list
+            datapath ids to poll, the most overdue first.
+        """
+        now = time.time() if now is None else now
+        due = sorted((poll, dpid) for dpid, poll in self.next_poll.items() if poll <= now)
+        for poll, dpid in due:
+            # A datapath late by more than a period is not polled twice to catch up, its phase is kept
+            self.next_poll[dpid] = poll + self.periods[dpid] * (np.floor((now - poll) / self.periods[dpid]) + 1)
+        return [dpid for _, dpid in due]
+
+    def wait(self, now = None):
+        """Time in seconds until the next due request, interval if no datapath is scheduled."""
+        now = time.time() if now is None else now
+        if not self.next_poll:
+            return self.interval
+        return max(0., min(self.next_poll.values()) - now)
+
+    def record_request(self, dpid, xid, now = None):
+        """
+        Record a request sent to a datapath. A request still unanswered is counted as timed out.
+
+        Parameters
+        ----------
+        dpid : int
+            datapath id.
+        xid : int
+            transaction id of the request.
+        now : float
+            time the request was sent at, defaults to the current time.
+        """
+        now = time.time() if now is None else now
+        if dpid not in self.periods:
+            return
+        if dpid in self.pending:
+            self.timeouts[dpid] += 1
+        self.pending[dpid] = (xid, now)
+        self.replies[dpid] = [0, 0]
+
+    def record_reply(self, dpid, xid, flows, changed, more = False, now = None):
+        """
+        Record a reply of a datapath. Replies split over several messages are only complete with the last one,
+        which sets the latency of the request and the churn adapting the polling period.
+
+        Parameters
+        ----------
+        dpid : int
+            datapath id.
+        xid : int
+            transaction id of the reply.
+        flows : int
+            number of flows in the reply.
+        changed : int
+            number of flows installed or reinstalled since the previous reply.
+        more : bool
+            whether more parts of the reply follow.
+        now : float
+            time the reply was received at, defaults to the current time.
+
+        Returns
+        -------
+        float
+            latency of the request in seconds once the reply is complete, None otherwise (or for unknown requests).
+        """
+        now = time.time() if now is None else now
+        request = self.pending.get(dpid)
+        if request is None or request[0] != xid:
+            return None
+        counts = self.replies[dpid]
+        counts[0] += flows
+        counts[1] += changed
+        if more:
+            return None
+        del self.pending[dpid]
+        latency = now - request[1]
+        self.latencies[dpid].append(latency)
+
+        churn = counts[1] / counts[0] if counts[0] else 0.
+        period = self.periods[dpid]
+        if churn > self.high_churn:
+            period = max(self.min_interval, period / 2)
+        elif churn < self.low_churn:
+            period = min(self.interval, period * 1.5)
+        self.periods[dpid] = period
+        # A shorter period applies from the next request on
+        self.next_poll[dpid] = min(self.next_poll[dpid], request[1] + period)
+        return latency
+
+    def latency(self, dpid):
+        """
+        Request-to-reply latency percentiles of a datapath over its latest replies.
+
+        Parameters
+        ----------
+        dpid : int
+            datapath id.
+
+        Returns
+        -------
+        dict
+            a dictionary with p50, p95 and max latencies in seconds (NaN without replies), the number of timed out
+            requests and the current polling period.
+        """
+        latencies = np.array(self.latencies.get(dpid, ()))
+        if len(latencies):
+            p50, p95 = np.percentile(latencies, [50, 95])
+            highest = latencies.max()
+        else:
+            p50 = p95 = highest = np.nan
+        return {'p50': p50, 'p95': p95, 'max': highest, 'timeouts': self.timeouts.get(dpid, 0), 'period': self.periods.get(dpid)}
@@ -1,5 +1,6 @@
+import os
 import numpy as np
-from sklearn import preprocessing
+from tensor_store import TensorStore
 
 def dig_holes(matrix, positions, center):
     '''
@@ -72,6 +73,221 @@ def get_matrix_subset(matrix, y_coordinate, subset_coordinates):
     x = [matrix[coordinate[0]][coordinate[1]] for coordinate in subset_coordinates]
     return y, x
 
+def recenter_indices(shape, center):
+    '''
+    Precompute the flat gather indices equivalent to roll_around_coordinate for a given matrix shape.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape (n, m) of the traffic matrices.
+    center : tuple
+        position to center matrices around.
+
+    Returns
+    -------
+    NDArray
+        flat indices such that matrix.reshape(-1)[indices] equals roll_around_coordinate(matrix, center).reshape(-1).
+    '''
+    n, m = shape
+    shift_y = (n//2 - center[0])
+    shift_x = (m//2 - center[1])
+    rows = (np.arange(n) - shift_y) % n
+    cols = (np.arange(m) - shift_x) % m
+    return (rows[:, None] * m + cols[None, :]).reshape(-1)
+
+def flat_positions(shape, positions):
+    '''
+    Convert a list of (i,j) positions into flat indices of a matrix of the given shape.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape (n, m) of the traffic matrices.
+    positions : list or NDArray
+        list of tuples (or (k, 2) array) of coordinates.
+
+    Returns
+    -------
+    NDArray
+        flat indices, one per position.
+    '''
+    positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+    return (positions[:, 0] % shape[0]) * shape[1] + (positions[:, 1] % shape[1])
+
+def load_tensor(path, start = 0, stop = None):
+    '''
+    Load a slice of traffic matrices from a chunked tensor store or from a .npy file, without reading the rest from disk.
+
+    Parameters
+    ----------
+    path : str
+        path of a TensorStore directory or of a .npy file.
+    start : int
+        index of the first matrix to load.
+    stop : int
+        index after the last matrix to load. If None, load up to the last matrix.
+
+    Returns
+    -------
+    NDArray
+        numpy array of traffic matrices.
+    '''
+    if os.path.isdir(path):
+        return TensorStore(path, mode='r').read(start, stop)
+    return np.array(np.load(path, mmap_mode='r')[start:stop])
+
+def sample_tensor(path, size, start = 0, stop = None, seed = None):
+    '''
+    Load a uniform random sample of traffic matrices from a chunked tensor store or from a .npy file,
+    reading only the sampled matrices from disk.
+
+    Parameters
+    ----------
+    path : str
+        path of a TensorStore directory or of a .npy file.
+    size : int
+        number of matrices to sample. The whole range is returned if it holds fewer matrices.
+    start : int
+        index of the first matrix of the sampled range.
+    stop : int
+        index after the last matrix of the sampled range. If None, sample up to the last matrix.
+    seed : int
+        seed of the sampling.
+
+    Returns
+    -------
+    NDArray
+        numpy array of sampled traffic matrices, in collection order.
+    '''
+    if os.path.isdir(path):
+        source = TensorStore(path, mode='r')
+        chunks = source.iter_chunks(start, stop)
+        stop = len(source) if stop is None else min(stop, len(source))
+    else:
+        source = np.load(path, mmap_mode='r')
+        stop = len(source) if stop is None else min(stop, len(source))
+        chunks = [source[start:stop]]
+    count = max(0, stop - start)
+    rows = np.sort(np.random.default_rng(seed).choice(count, min(size, count), replace=False))
+    samples = []
+    offset = 0
+    for chunk in chunks:
+        selected = rows[(rows >= offset) & (rows < offset + len(chunk))] - offset
+        samples.append(np.array(chunk[selected]))
+        offset += len(chunk)
+    return np.concatenate(samples) if samples else np.empty((0,) + source.shape[1:])
+
+def loss_mask_path(path):
+    '''Path of the loss mask stored next to a tensor, see load_loss_mask.'''
+    return path[:-len('.npy')] + '_mask.npy' if path.endswith('.npy') else path + '_mask'
+
+def load_loss_mask(path, start = 0, stop = None):
+    '''
+    Load a slice of the loss mask stored next to a tensor, True marking the flows whose measurement is missing:
+    the TensorStore `<path>_mask` written by the controller and synthetic.write_traffic, or the file
+    `<path without .npy>_mask.npy` of a .npy tensor.
+
+    Parameters
+    ----------
+    path : str
+        path of the TensorStore directory or .npy file of the traffic matrices.
+    start : int
+        index of the first mask to load.
+    stop : int
+        index after the last mask to load. If None, load up to the last mask.
+
+    Returns
+    -------
+    NDArray
+        boolean array of masks, None if no mask is stored next to the tensor.
+    '''
+    mask_path = loss_mask_path(path)
+    if not os.path.exists(mask_path):
+        return None
+    return np.asarray(load_tensor(mask_path, start, stop), dtype=bool)
+
+def mask_unobserved(data, observed, y_coordinate):
+    '''
+    Mark the unmeasured flows of scaled traffic matrices as missing (-1, the value of the holes of process_data)
+    and drop the matrices whose target flow was not measured, so that no unmeasured value is trained on.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of scaled traffic matrices.
+    observed : NDArray
+        boolean array of the same shape, True for the measured flows. If None data is returned unchanged.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+
+    Returns
+    -------
+    NDArray
+        the masked matrices whose target flow was measured.
+    '''
+    if observed is None:
+        return data
+    observed = np.asarray(observed, dtype=bool)
+    return np.where(observed, data, -1)[observed[:, y_coordinate[0], y_coordinate[1]]]
+
+def _observed_moments(data, observed):
+    # Per-coordinate mean and standard deviation over the measured values only, NaN where nothing was measured
+    data = np.asarray(data, dtype=np.float64)
+    if observed is None:
+        return data.mean(axis=0), data.std(axis=0)
+    observed = np.asarray(observed, dtype=bool)
+    counts = observed.sum(axis=0)
+    safe_counts = np.maximum(counts, 1)
+    mean = np.where(observed, data, 0).sum(axis=0) / safe_counts
+    variance = np.where(observed, (data - mean) ** 2, 0).sum(axis=0) / safe_counts
+    return np.where(counts > 0, mean, np.nan), np.where(counts > 0, np.sqrt(variance), np.nan)
+
+def window_statistics(data, observed = None):
+    '''
+    Per-coordinate mean and standard deviation of a window of traffic matrices, the reference of drift_score.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of traffic matrices.
+    observed : NDArray
+        optional boolean array of the same shape, True for the measured flows. Unmeasured values are ignored.
+
+    Returns
+    -------
+    tuple
+        a tuple (mean, std) of arrays of shape (n, m), NaN for the coordinates that were never measured.
+    '''
+    return _observed_moments(data, observed)
+
+def drift_score(mean, std, data, observed = None):
+    '''
+    Largest shift of the per-coordinate mean of a window of traffic matrices with respect to reference statistics,
+    in reference standard deviations. Small scores mean a model trained on the reference data still fits the window.
+    Coordinates unmeasured in the reference or in the window are ignored.
+
+    Parameters
+    ----------
+    mean : NDArray
+        reference per-coordinate mean, see window_statistics.
+    std : NDArray
+        reference per-coordinate standard deviation, see window_statistics.
+    data : NDArray
+        numpy array of new traffic matrices.
+    observed : NDArray
+        optional boolean array of the same shape, True for the measured flows.
+
+    Returns
+    -------
+    float
+        the drift score.
+    '''
+    shift = np.abs(_observed_moments(data, observed)[0] - mean)
+    # Constant reference flows only drift if their value actually changes
+    scores = shift / np.maximum(std, 1e-12 + 1e-6 * np.abs(mean))
+    return float(scores[np.isfinite(scores)].max(initial=0.))
+
 def fit_scaler(data):
     '''
     Fit a scaler to scale matrix data down to (1,10) range.
@@ -86,11 +302,63 @@ def fit_scaler(data):
     object
         fitted scaler.
     '''
+    from sklearn import preprocessing
     transformer = preprocessing.MinMaxScaler(feature_range=(1,10))
     nsamples, nx, ny = data.shape
     return transformer.fit(data.reshape(nsamples, nx * ny))  
 
-def scale_data(scaler, data):
+def partial_fit_scaler(data, scaler = None, observed = None):
+    '''
+    Incrementally fit a (1,10) range scaler on a chunk of matrices, so that scaling statistics can be
+    updated as new matrices arrive instead of refitting on the full history.
+
+    Parameters
+    ----------
+    data: NDArray
+        chunk of matrix data of shape (k, n, m), or a single (n, m) matrix.
+    scaler: object
+        scaler to update, as returned by fit_scaler or partial_fit_scaler. If None a new one is created.
+    observed: NDArray
+        optional boolean array of the shape of data, True for the measured flows. Unmeasured values are replaced
+        by the current minimum of their coordinate (0, the lowest rate, for a new scaler) so they never widen its range.
+
+    Returns
+    -------
+    object
+        updated scaler.
+    '''
+    data = np.asarray(data)
+    if data.ndim == 2:
+        data = np.expand_dims(data, 0)
+    nsamples, nx, ny = data.shape
+    if observed is not None:
+        fill = 0. if scaler is None else scaler.data_min_.reshape(nx, ny)
+        data = np.where(np.reshape(observed, data.shape), data, fill)
+    if scaler is None:
+        from sklearn import preprocessing
+        scaler = preprocessing.MinMaxScaler(feature_range=(1,10))
+    return scaler.partial_fit(data.reshape(nsamples, nx * ny))
+
+def fit_scaler_chunked(chunks):
+    '''
+    Fit a (1,10) range scaler over an iterable of matrix chunks (e.g. TensorStore.iter_chunks()), one chunk in memory at a time.
+
+    Parameters
+    ----------
+    chunks: iterable
+        iterable of NDArrays of shape (k, n, m).
+
+    Returns
+    -------
+    object
+        fitted scaler.
+    '''
+    scaler = None
+    for chunk in chunks:
+        scaler = partial_fit_scaler(chunk, scaler)
+    return scaler
+
+def scale_data(scaler, data, inplace = False):
     '''
     Scale data down to (1,10) range
 
@@ -100,6 +368,9 @@ def scale_data(scaler, data):
         sklearn preprocessing Scaler
     data: NDArray
         matrix data to scale down.
+    inplace: bool
+        whether to overwrite data (e.g. a writable memory mapped chunk) instead of returning a scaled copy.
+        Requires a floating point, C-contiguous array.
 
     Returns
     -------
@@ -107,8 +378,85 @@ def scale_data(scaler, data):
         scaled data.
     '''
     nsamples, nx, ny = data.shape
+    if inplace:
+        if not data.flags['C_CONTIGUOUS']:
+            raise ValueError('In-place scaling requires a C-contiguous array.')
+        flat = data.reshape(nsamples, nx * ny)
+        flat *= scaler.scale_
+        flat += scaler.min_
+        return data
     return scaler.transform(data.reshape(nsamples, nx * ny)).reshape((nsamples, nx, ny))  
 
+def iter_scaled(scaler, chunks, inplace = False):
+    '''
+    Scale an iterable of matrix chunks (e.g. TensorStore.iter_chunks()) down to (1,10) range, one chunk at a time.
+
+    Parameters
+    ----------
+    scaler: object
+        sklearn preprocessing Scaler
+    chunks: iterable
+        iterable of NDArrays of shape (k, n, m).
+    inplace: bool
+        whether to overwrite the chunks instead of yielding scaled copies. Memory mapped chunks are flushed to disk.
+
+    Yields
+    ------
+    NDArray
+        scaled chunk.
+    '''
+    for chunk in chunks:
+        scaled = scale_data(scaler, chunk, inplace)
+        if inplace and isinstance(chunk, np.memmap):
+            chunk.flush()
+        yield scaled
+
+def save_scaler(scaler, path):
+    '''
+    Serialize a fitted (1,10) range scaler to a .npz file, e.g. next to the model it was trained with.
+    The file is replaced atomically, so that an interrupted write never leaves a truncated scaler behind.
+
+    Parameters
+    ----------
+    scaler: object
+        fitted sklearn MinMaxScaler.
+    path: str
+        destination file, the .npz extension is appended if missing (as np.savez does).
+    '''
+    if not path.endswith('.npz'):
+        path += '.npz'
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, feature_range=np.array(scaler.feature_range), data_min=scaler.data_min_, data_max=scaler.data_max_, n_samples_seen=scaler.n_samples_seen_)
+    os.replace(tmp_path, path)
+
+def load_scaler(path):
+    '''
+    Load a scaler serialized with save_scaler. The returned scaler can keep being updated with partial_fit_scaler.
+
+    Parameters
+    ----------
+    path: str
+        .npz file written by save_scaler.
+
+    Returns
+    -------
+    object
+        fitted sklearn MinMaxScaler.
+    '''
+    params = np.load(path)
+    feature_range = tuple(params['feature_range'])
+    from sklearn import preprocessing
+    scaler = preprocessing.MinMaxScaler(feature_range=feature_range)
+    scaler.data_min_ = params['data_min']
+    scaler.data_max_ = params['data_max']
+    scaler.data_range_ = scaler.data_max_ - scaler.data_min_
+    scaler.scale_ = (feature_range[1] - feature_range[0]) / np.where(scaler.data_range_ == 0, 1, scaler.data_range_)
+    scaler.min_ = feature_range[0] - scaler.data_min_ * scaler.scale_
+    scaler.n_samples_seen_ = int(params['n_samples_seen'])
+    scaler.n_features_in_ = len(scaler.data_min_)
+    return scaler
+
 def process_data(data, y_coordinate, missing_values_coordinates, train_test_split = 0.2, shuffle = True):
     '''
     Preprocess the list of traffic matrices, by extracting the value in the coordinate to predict, and centering the matrices around it. 
@@ -194,4 +542,234 @@ def process_data_reduced(data, y_coordinate, most_relevant_coordinates, train_te
     train_Y = data_Y[0:size]
     test_X = data_X[size:len(data_X)]
     test_Y = data_Y[size:len(data_Y)]
-    return (train_X, train_Y, test_X, test_Y)
\ No newline at end of file
+    return (train_X, train_Y, test_X, test_Y)
+
+def _recentered_samples(flat, shape, y_coordinate, missing_values_coordinates, permutation = None):
+    '''
+    Gather the holed and recentered samples for one target coordinate out of a flattened tensor.
+
+    Parameters
+    ----------
+    flat : NDArray
+        traffic matrices flattened to shape (N, n*m).
+    shape : tuple
+        shape (n, m) of each traffic matrix.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    missing_values_coordinates : list
+        list of coordinates to replace with -1.
+    permutation : NDArray
+        optional order of the samples, None keeps the original order.
+
+    Returns
+    -------
+    tuple
+        a tuple (data_X, data_Y) of shapes (N, n*m) and (N,).
+    '''
+    indices = recenter_indices(shape, y_coordinate)
+    holes = np.isin(indices, flat_positions(shape, missing_values_coordinates))
+    target = flat_positions(shape, [y_coordinate])[0]
+    if permutation is None:
+        data_X = flat[:, indices]
+        data_Y = flat[:, target]
+    else:
+        data_X = flat[np.ix_(permutation, indices)]
+        data_Y = flat[permutation, target]
+    data_X[:, holes] = -1
+    return data_X, data_Y
+
+def build_inference_samples(matrix, y_coordinate, missing_values_coordinates = None):
+    '''
+    Model input estimating y_coordinate from a single traffic matrix, holed and recentered exactly as the training
+    samples of y_coordinate built by process_data_vectorized with the same missing_values_coordinates.
+
+    Parameters
+    ----------
+    matrix : NDArray
+        single (n, m) traffic matrix.
+    y_coordinate : tuple
+        coordinate to estimate.
+    missing_values_coordinates : list
+        list of coordinates replaced with -1, as in the training samples: y_coordinate and the unmeasured flows
+        for the models of trainer.train_snapshot (see mask_unobserved). Defaults to [y_coordinate].
+
+    Returns
+    -------
+    NDArray
+        array of shape (1, n*m), laid out as the X returned by process_data.
+    '''
+    matrix = np.asarray(matrix)
+    if missing_values_coordinates is None:
+        missing_values_coordinates = [y_coordinate]
+    samples, _ = _recentered_samples(matrix.reshape(1, -1), matrix.shape, y_coordinate, missing_values_coordinates)
+    return samples
+
+def process_data_vectorized(data, y_coordinate, missing_values_coordinates, train_test_split = 0.2, shuffle = True):
+    '''
+    Vectorized equivalent of process_data. Holes, recentering and shuffling are applied to the whole tensor
+    with a single precomputed index gather instead of a per-matrix loop. Given the same random state the outputs
+    are identical to those of process_data.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of traffic matrices.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    missing_values_coordinates: list
+        list of coordinates missing value measurement. Should always include y_coordinate.
+    train_test_split : float
+        portion of data dedicated to testing purposes.
+    shuffle : bool
+        whether to shuffle the data or not.
+
+    Returns
+    -------
+    tuple
+        a 4-tuple of numpy arrays in the form of (train_X, train_Y, test_X, test_Y).
+    '''
+    for position in missing_values_coordinates:
+        if position[0] >= data.shape[1] or position[1] >= data.shape[2]:
+            raise ValueError(f'Specified position {y_coordinate} is out of bounds (matrix_shape = {data.shape}).')
+    flat = data.reshape(data.shape[0], data.shape[1]*data.shape[2])
+    permutation = np.random.permutation(len(data)) if shuffle == True else None
+    data_X, data_Y = _recentered_samples(flat, data.shape[1:], y_coordinate, missing_values_coordinates, permutation)
+    size = int(len(data_X) * (1-train_test_split))
+    train_X = np.squeeze(data_X[0:size])
+    train_Y = np.squeeze(data_Y[0:size])
+    test_X = np.squeeze(data_X[size:len(data_X)])
+    test_Y = np.squeeze(data_Y[size:len(data_Y)])
+    return (train_X, train_Y, test_X, test_Y)
+
+def process_data_reduced_vectorized(data, y_coordinate, most_relevant_coordinates, train_test_split = 0.2, shuffle = True):
+    '''
+    Vectorized equivalent of process_data_reduced. The subset of coordinates is extracted from the whole tensor
+    with a single index gather. Given the same random state the outputs are identical to those of process_data_reduced.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of traffic matrices.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    most_relevant_coordinates: list
+        list of coordinates (tuples) to include in the reduced matrices.
+    train_test_split : float
+        portion of data dedicated to testing purposes.
+    shuffle : bool
+        whether to shuffle the data or not.
+
+    Returns
+    -------
+    tuple
+        a 4-tuple of numpy arrays in the form of (train_X, train_Y, test_X, test_Y).
+    '''
+    for position in most_relevant_coordinates:
+        if position[0] >= data.shape[1] or position[1] >= data.shape[2]:
+            raise ValueError(f'Specified position {y_coordinate} is out of bounds (matrix_shape = {data.shape}).')
+    shape = data.shape[1:]
+    flat = data.reshape(data.shape[0], shape[0]*shape[1])
+    indices = flat_positions(shape, most_relevant_coordinates)
+    target = flat_positions(shape, [y_coordinate])[0]
+    if shuffle == True:
+        permutation = np.random.permutation(len(data))
+        data_X = flat[np.ix_(permutation, indices)]
+        data_Y = flat[permutation, target]
+    else:
+        data_X = flat[:, indices]
+        data_Y = flat[:, target]
+    size = int(len(data_X) * (1-train_test_split))
+    train_X = data_X[0:size]
+    train_Y = data_Y[0:size]
+    test_X = data_X[size:len(data_X)]
+    test_Y = data_Y[size:len(data_Y)]
+    return (train_X, train_Y, test_X, test_Y)
+
+def process_data_targets(data, y_coordinates = None, missing_values_coordinates = None, train_test_split = 0.2, shuffle = True):
+    '''
+    Lazily preprocess the list of traffic matrices for several coordinates to predict in one pass.
+    The shuffle permutation is drawn once and shared by every target, so the i-th sample of every split
+    refers to the same traffic matrix. Only the arrays of the target being yielded are held in memory.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of traffic matrices.
+    y_coordinates : list
+        list of coordinates (tuples) of the values to predict. If None every coordinate of the matrix is used.
+    missing_values_coordinates: list
+        list of coordinates missing value measurement in every sample, in addition to the target itself.
+    train_test_split : float
+        portion of data dedicated to testing purposes.
+    shuffle : bool
+        whether to shuffle the data or not.
+
+    Yields
+    ------
+    tuple
+        a tuple (y_coordinate, (train_X, train_Y, test_X, test_Y)) per target, with the same layout as process_data.
+    '''
+    shape = data.shape[1:]
+    if y_coordinates is None:
+        y_coordinates = [(i, j) for i in range(shape[0]) for j in range(shape[1])]
+    if missing_values_coordinates is None:
+        missing_values_coordinates = []
+    for position in list(y_coordinates) + list(missing_values_coordinates):
+        if position[0] >= shape[0] or position[1] >= shape[1]:
+            raise ValueError(f'Specified position {position} is out of bounds (matrix_shape = {data.shape}).')
+    flat = data.reshape(data.shape[0], shape[0]*shape[1])
+    permutation = np.random.permutation(len(data)) if shuffle == True else None
+    size = int(len(data) * (1-train_test_split))
+    for y_coordinate in y_coordinates:
+        y_coordinate = tuple(y_coordinate)
+        data_X, data_Y = _recentered_samples(flat, shape, y_coordinate, [y_coordinate] + list(missing_values_coordinates), permutation)
+        yield y_coordinate, (np.squeeze(data_X[0:size]), np.squeeze(data_Y[0:size]), np.squeeze(data_X[size:]), np.squeeze(data_Y[size:]))
+
+def process_data_masked(data, y_coordinates = None, missing_rate = 0.2, missing_values_coordinates = None, train_test_split = 0.2, shuffle = True):
+    '''
+    Preprocess the list of traffic matrices for multi-output completion: every sample keeps its original layout (no recentering),
+    each target coordinate is independently replaced by -1 with probability missing_rate, and the truth values of all targets are returned.
+
+    Parameters
+    ----------
+    data : NDArray
+        numpy array of traffic matrices.
+    y_coordinates : list
+        list of coordinates (tuples) of the values to predict. If None every coordinate of the matrix is used.
+    missing_rate : float
+        probability of each target coordinate to be missing in a sample. At least one target is missing in every sample.
+    missing_values_coordinates: list
+        list of coordinates missing value measurement in every sample.
+    train_test_split : float
+        portion of data dedicated to testing purposes.
+    shuffle : bool
+        whether to shuffle the data or not.
+
+    Returns
+    -------
+    tuple
+        a 4-tuple of numpy arrays in the form of (train_X, train_Y, test_X, test_Y), X of shape (N, n*m) with -1 at the
+        missing positions, Y of shape (N, len(y_coordinates)).
+    '''
+    shape = data.shape[1:]
+    if y_coordinates is None:
+        y_coordinates = [(i, j) for i in range(shape[0]) for j in range(shape[1])]
+    if missing_values_coordinates is None:
+        missing_values_coordinates = []
+    for position in list(y_coordinates) + list(missing_values_coordinates):
+        if position[0] >= shape[0] or position[1] >= shape[1]:
+            raise ValueError(f'Specified position {position} is out of bounds (matrix_shape = {data.shape}).')
+    flat = data.reshape(data.shape[0], shape[0]*shape[1])
+    if shuffle == True:
+        flat = flat[np.random.permutation(len(data))]
+    else:
+        flat = flat.copy()
+    targets = flat_positions(shape, y_coordinates)
+    data_Y = flat[:, targets]
+    holes = np.random.random((len(flat), len(targets))) < missing_rate
+    holes[np.arange(len(flat)), np.random.randint(len(targets), size=len(flat))] = True
+    flat[:, targets] = np.where(holes, -1, data_Y)
+    if len(missing_values_coordinates) > 0:
+        flat[:, flat_positions(shape, missing_values_coordinates)] = -1
+    size = int(len(flat) * (1-train_test_split))
+    return (flat[0:size], data_Y[0:size], flat[size:], data_Y[size:])
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+import numpy as np
+
+def scaler_fingerprint(scaler):
+    '''
+    Short fingerprint of the data a scaler was fitted on (per-coordinate minimum and maximum).
+
+    Parameters
+    ----------
+    scaler : object
+        fitted MinMaxScaler.
+
+    Returns
+    -------
+    str
+        hexadecimal fingerprint.
+    '''
+    digest = hashlib.sha1()
+    digest.update(np.asarray(scaler.data_min_, dtype=np.float64).tobytes())
+    digest.update(np.asarray(scaler.data_max_, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+def model_key(topology, input_shape, target_coordinate, coordinates = None, fingerprint = None):
+    '''
+    Canonical registry key of a completion model.
+
+    Parameters
+    ----------
+    topology : str
+        name of the network topology the data was collected on.
+    input_shape : tuple
+        shape of the model input matrices (e.g. (10, 10, 1)).
+    target_coordinate : tuple
+        coordinate predicted by the model.
+    coordinates : list
+        reduced coordinate set the model takes as input, None for full matrices.
+    fingerprint : str
+        fingerprint of the scaler/data the model was trained on, see scaler_fingerprint. None matches any data.
+
+    Returns
+    -------
+    dict
+        the key.
+    '''
+    return {
+        'topology': topology,
+        'input_shape': [int(v) for v in input_shape],
+        'target_coordinate': [int(v) for v in target_coordinate],
+        'coordinates': None if coordinates is None else np.asarray(coordinates, dtype=int).tolist(),
+        'fingerprint': fingerprint,
+    }
+
+def _key_id(key, with_fingerprint = True):
+    if not with_fingerprint:
+        key = dict(key, fingerprint=None)
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:20]
+
+class ModelRegistry:
+    """
+    On-disk registry of trained completion models, keyed by topology, input shape, target coordinate,
+    reduced coordinate set and data fingerprint, with an in-process LRU cache of loaded models.
+
+    Every registered model lives in its own directory `<root>/<base id>/<fingerprint>/` holding its artifacts and
+    an `entry.json` with the key, the artifact paths and the data range of its scaler. Models that share a key
+    except for the fingerprint are versions of the same model trained on different data: the newest one
+    is reused as long as the data has not drifted beyond a tolerance.
+
+    Attributes
+    ----------
+    root : str
+        Directory of the registry.
+    memory_budget : int
+        Maximum number of bytes of loaded models kept in the cache.
+
+    Methods
+    -------
+    put(key, artifacts, scaler)
+        Register a model, copying its artifacts into the registry.
+
+    find(key)
+        Entry of a key, or of the newest version of it when the fingerprint is None.
+
+    needs_retrain(key, scaler, tolerance)
+        Whether no registered version of key was trained on data close enough to the scaler's.
+
+    get(key)
+        Loaded model of a key, through the LRU cache.
+    """
+
+    def __init__(self, root, memory_budget = 256 * 2**20) -> None:
+        self.root = root
+        self.memory_budget = memory_budget
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+    def _directory(self, key):
+        return os.path.join(self.root, _key_id(key, with_fingerprint=False), key['fingerprint'])
+
+    def put(self, key, artifacts, scaler):
+        """
+        Register a model, copying its artifacts into the registry.
+
+        Parameters
+        ----------
+        key : dict
+            key built with model_key, its fingerprint must be set.
+        artifacts : dict
+            paths of the model files keyed by kind: 'model' (Keras), 'lite_model' (.npz or .tflite export), 'scaler', ...
+        scaler : object
+            scaler the model was trained with.
+
+        Returns
+        -------
+        dict
+            the registry entry, with artifact paths inside the registry.
+        """
+        if key['fingerprint'] is None:
+            raise ValueError('Registered models require a data fingerprint.')
+        directory = self._directory(key)
+        os.makedirs(directory, exist_ok=True)
+        stored = {}
+        for kind, path in artifacts.items():
+            stored[kind] = os.path.join(directory, os.path.basename(path))
+            if os.path.isdir(path):
+                shutil.copytree(path, stored[kind], dirs_exist_ok=True)
+            else:
+                shutil.copy2(path, stored[kind])
+        entry = {'key': key, 'artifacts': stored, 'data_min': np.asarray(scaler.data_min_).tolist(), 'data_max': np.asarray(scaler.data_max_).tolist(), 'created': time.time()}
+        entry_path = os.path.join(directory, 'entry.json')
+        with open(entry_path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(entry_path + '.tmp', entry_path)
+        return entry
+
+    def versions(self, key):
+        """
+        Entries of every registered version of key, whatever their fingerprint, newest first.
+
+        Parameters
+        ----------
+        key : dict
+            key built with model_key.
+
+        Returns
+        -------
+        list
+            list of entries.
+        """
+        base = os.path.join(self.root, _key_id(key, with_fingerprint=False))
+        if not os.path.isdir(base):
+            return []
+        entries = []
+        for fingerprint in os.listdir(base):
+            entry_path = os.path.join(base, fingerprint, 'entry.json')
+            if os.path.exists(entry_path):
+                with open(entry_path) as f:
+                    entries.append(json.load(f))
+        return sorted(entries, key=lambda entry: entry['created'], reverse=True)
+
+    def find(self, key):
+        """
+        Entry of key, or of its newest version when the key's fingerprint is None.
+
+        Parameters
+        ----------
+        key : dict
+            key built with model_key.
+
+        Returns
+        -------
+        dict
+            the entry, None if no model is registered for key.
+        """
+        for entry in self.versions(key):
+            if key['fingerprint'] is None or entry['key']['fingerprint'] == key['fingerprint']:
+                return entry
+        return None
+
+    def needs_retrain(self, key, scaler, tolerance = 0.1):
+        """
+        Whether the newest registered version of key was trained on data whose per-coordinate range differs from the
+        scaler's by more than tolerance (relative to the scaler's range), or no version is registered at all.
+
+        Parameters
+        ----------
+        key : dict
+            key built with model_key, the fingerprint is ignored.
+        scaler : object
+            scaler fitted on the current data.
+        tolerance : float
+            maximum relative drift of the per-coordinate minimum and maximum.
+
+        Returns
+        -------
+        bool
+            whether the model has to be (re)trained.
+        """
+        entry = self.find(dict(key, fingerprint=None))
+        if entry is None:
+            return True
+        data_range = np.maximum(np.asarray(scaler.data_max_) - np.asarray(scaler.data_min_), 1e-12)
+        drift = np.maximum(np.abs(np.asarray(entry['data_min']) - scaler.data_min_), np.abs(np.asarray(entry['data_max']) - scaler.data_max_)) / data_range
+        return bool(drift.max() > tolerance)
+
+    def _load(self, entry):
+        artifacts = entry['artifacts']
+        if 'lite_model' in artifacts:
+            from lite_model import load_model
+            return load_model(artifacts['lite_model'])
+        from CNN import CNN
+        return CNN.load(artifacts['model'], tuple(entry['key']['target_coordinate']))
+
+    @staticmethod
+    def _nbytes(model):
+        if hasattr(model, 'nbytes'):
+            return model.nbytes
+        return sum(int(np.prod(w.shape)) * w.dtype.size for w in model.model.weights)
+
+    def get(self, key):
+        """
+        Loaded model of key (its newest version when the fingerprint is None), through the LRU cache.
+        Least recently used models are evicted once the cached models exceed the memory budget.
+
+        Parameters
+        ----------
+        key : dict
+            key built with model_key.
+
+        Returns
+        -------
+        object
+            the loaded model (LiteModel, TFLiteModel or CNN), None if no model is registered for key.
+        """
+        entry = self.find(key)
+        if entry is None:
+            return None
+        cache_id = _key_id(entry['key'])
+        if cache_id in self._cache:
+            self._cache.move_to_end(cache_id)
+            return self._cache[cache_id][0]
+        model = self._load(entry)
+        nbytes = self._nbytes(model)
+        self._cache[cache_id] = (model, nbytes)
+        self._cache_bytes += nbytes
+        while self._cache_bytes > self.memory_budget and len(self._cache) > 1:
+            _, (_, evicted_bytes) = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted_bytes
+        return model
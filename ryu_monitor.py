@@ -1,13 +1,37 @@
 from ryu.app import simple_switch_13
 from ryu.controller import ofp_event
 from ryu.ofproto import ofproto_v1_3
-from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.lib import hub
+from ryu import cfg
+from ryu.lib.packet import packet, ethernet, arp
+from ryu.lib.packet import ether_types
+import logging
 import numpy as np
 import os
-from CNN import CNN
+import time
 from preprocessing import *
+from tensor_store import TensorStore
+from trainer import TrainingScheduler
+from inference import CompletionService
+from registry import ModelRegistry
+from host_index import load_host_index
+from topology import load_plan, host_routes
+from flow_counters import FlowCounters, learned_ingress, parse_flow_stats
+from polling import PollingScheduler
+
+# Options of the [monitor] section of the ryu-manager configuration file (--config-file)
+cfg.CONF.register_opts([
+    cfg.BoolOpt('proactive', default=False,
+                help='Install a flow per host pair from the topology plan when switches connect, '
+                     'instead of learning them from packet-ins'),
+    cfg.StrOpt('plan', default='output/topology.json',
+               help='Topology plan published by net_topology.py'),
+], 'monitor')
+
+# Cookie of the host flows (priority 1) learned by the switch, statistics requests only return these flows
+HOST_FLOW_COOKIE = 0x1
 
 class SimpleMonitor13(simple_switch_13.SimpleSwitch13):
 
@@ -16,11 +40,52 @@ class SimpleMonitor13(simple_switch_13.SimpleSwitch13):
         self.datapaths = {}
         self.monitor_thread = hub.spawn(self._monitor)
 
-        # Initializa a 100 record of 10x10 matrix
-        self.index = 0 # Initialize the matrix index
-        self.n = 100 # Intialize num of rows
-        self.matrix = [np.zeros((10, 10)) for _ in range(self.n)]
-        self.save_dataset = False
+        # Hosts and their matrix indices come from the published topology plan, or the legacy 10-host network
+        self.plan_path = self.CONF.monitor.plan
+        self.hosts = load_host_index(self.plan_path)
+        self.size = self.hosts.size
+        # In proactive mode a flow per host pair is installed on every switch of its path when the switch connects:
+        # data-plane traffic never reaches the controller, which answers ARP requests from the plan
+        self.proactive = self.CONF.monitor.proactive
+        if self.proactive and not os.path.exists(self.plan_path):
+            raise ValueError(f'Proactive mode requires a topology plan, {self.plan_path} does not exist.')
+        self.routes = host_routes(load_plan(self.plan_path)) if self.proactive else {}
+        self.ip_to_mac = {host['ip']: host['mac'] for host in self.hosts.hosts}
+
+        # Cumulative flow counters of the replies are turned into traffic per polling epoch
+        self.interval = 30 # Epoch length in seconds, one matrix is emitted per epoch
+        self.counters = FlowCounters(self.size)
+        # Requests are staggered over the epoch, switches with a high flow churn are polled more often
+        self.poller = PollingScheduler(self.interval, min_interval=5)
+        # The flow table of one reply in every flow_log_every is logged, at debug level only
+        self.flow_log_every = 100
+        self.replies = 0
+
+        # Epoch matrices of size x size flow rates are appended to an on-disk store as they are emitted
+        self.store_path = 'output/tensor'
+        self.store = TensorStore(self.store_path, shape=(self.size, self.size))
+        self.index = len(self.store) # Initialize the matrix index, resuming a previous collection
+        # The loss mask of every matrix (True for the flows not measured during its epoch) is stored alongside it
+        self.mask_store = TensorStore(loss_mask_path(self.store_path), shape=(self.size, self.size), dtype='bool')
+        if len(self.mask_store) < self.index:
+            # Matrices collected before masks were recorded count as fully measured
+            missing = self.index - len(self.mask_store)
+            self.mask_store.extend(np.zeros((missing, self.size, self.size), dtype=bool), self.store.timestamps(len(self.mask_store), self.index))
+        self.n = 100 # Num of matrices needed before training
+        self.matrix = np.zeros((self.size, self.size)) # Flow rates (bytes/s) of the latest epoch
+        self.save_dataset = self.index >= self.n
+        # Scaler statistics are updated incrementally with every stored matrix
+        self.scaler_path = 'output/scaler.npz'
+        self.scaler = load_scaler(self.scaler_path) if os.path.exists(self.scaler_path) else None
+        # Training runs in a worker process, at most once every self.n new matrices
+        # Trained models are kept in a registry and only retrained when the data drifts
+        self.registry = ModelRegistry('models')
+        self.trainer = TrainingScheduler(self.store_path, 'snippets', window=self.n, y_coordinate=(4,3), registry=self.registry, topology=self.hosts.name, drift_threshold=0.5)
+        # Missing flows of every completed matrix are only estimated by a model of their own coordinate, published or registered,
+        # looked up once here and whenever a new model is published
+        self.completion = CompletionService(self.trainer.latest, registry=self.registry, topology=self.hosts.name, shape=(self.size, self.size))
+        self.observed = np.zeros((self.size, self.size), dtype=bool) # Cells of self.matrix measured during the epoch
+        self.completed_matrix = None # Latest completed matrix with missing flows estimated
 
     @set_ev_cls(ofp_event.EventOFPStateChange,
                 [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -30,119 +95,196 @@ class SimpleMonitor13(simple_switch_13.SimpleSwitch13):
             if datapath.id not in self.datapaths:
                 #self.logger.debug('register datapath: %016x', datapath.id)
                 self.datapaths[datapath.id] = datapath
+                self.poller.add(datapath.id)
         elif ev.state == DEAD_DISPATCHER:
             if datapath.id in self.datapaths:
                 #self.logger.debug('unregister datapath: %016x', datapath.id)
                 del self.datapaths[datapath.id]
+                self.poller.remove(datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def _install_routes(self, ev):
+        datapath = ev.msg.datapath
+        parser = datapath.ofproto_parser
+        routes = self.routes.get(ev.msg.datapath_id, [])
+        # Host flows match on the MAC pair only, so that the statistics of a flow are those of its pair
+        for src, dst, port in routes:
+            match = parser.OFPMatch(eth_src=src, eth_dst=dst)
+            self.add_flow(datapath, 1, match, [parser.OFPActionOutput(port)])
+        if routes:
+            self.logger.info('installed %d host flows on datapath %016x', len(routes), ev.msg.datapath_id)
 
     def _monitor(self):
+        epoch_end = time.time() + self.interval
         while True:
-            for dp in self.datapaths.values():
-                self._request_stats(dp)
-            hub.sleep(30)
+            now = time.time()
+            if now >= epoch_end:
+                self._close_epoch()
+                self._schedule_training()
+                epoch_end += self.interval
+            # Only the datapaths whose turn has come are polled, their replies are spread over the epoch
+            for dpid in self.poller.due(now):
+                if dpid in self.datapaths:
+                    self._request_stats(self.datapaths[dpid])
+            hub.sleep(max(0, min(self.poller.wait(), epoch_end - time.time())))
+
+    def _update_ingress(self):
+        # Every flow is measured at the switch its source host is attached to: known from the topology plan,
+        # or guessed from the MAC learning tables for the legacy network
+        ingress = self.hosts.ingress.copy()
+        unknown = ingress < 0
+        if unknown.any():
+            ingress[unknown] = learned_ingress(self.mac_to_port, self.hosts.mac_to_index, self.size)[unknown]
+        self.counters.set_ingress(ingress)
+
+    def _close_epoch(self):
+        # Emit one matrix per polling epoch, whatever the number of flows measured during it
+        _, rates, observed = self.counters.emit()
+        self._update_ingress()
+        completeness = self.counters.completeness
+        self.logger.info('epoch %d: %.0f%% of ingress switches replied, %.0f%% of flows measured',
+                         self.index, 100 * completeness['datapaths'], 100 * completeness['flows'])
+        for dpid in self.datapaths:
+            latency = self.poller.latency(dpid)
+            self.logger.debug('datapath %016x: polled every %.1f s, reply latency p50 %.1f ms p95 %.1f ms, %d timeouts',
+                              dpid, latency['period'], 1000 * latency['p50'], 1000 * latency['p95'], latency['timeouts'])
+        self.matrix = rates
+        # A host sends nothing to itself: the diagonal is a measured zero, in the stored mask (hence the training
+        # samples, see preprocessing.mask_unobserved) as in the inputs of the completion
+        self.observed = observed | np.eye(self.size, dtype=bool)
+        # Epochs without any measurement are stored too, entirely masked, to keep one matrix per epoch
+        timestamp = time.time()
+        self.store.append(self.matrix, timestamp)
+        self.mask_store.append(~self.observed, timestamp)
+        if observed.any():
+            # Unmeasured flows are not zero traffic, they never update the scaler
+            self.scaler = partial_fit_scaler(self.matrix, self.scaler, self.observed)
+            save_scaler(self.scaler, self.scaler_path)
+        self._complete_matrix()
+        self.index += 1
+
+        # Once enough matrices have been collected, enable training
+        if self.index >= self.n and not self.save_dataset:
+            self.save_dataset = True
+
+    def _schedule_training(self):
+        # Never blocks: collects finished jobs and submits a new one when a new data window is available
+        try:
+            manifest = self.trainer.poll()
+            if manifest is not None:
+                self.logger.info('published model version %d trained on %d matrices', manifest['version'], manifest['count'])
+                self.completion.load(manifest)
+        except Exception:
+            self.logger.exception('model training failed')
+        if self.save_dataset and self.trainer.maybe_submit(self.index, self.scaler):
+            self.logger.info('training model version %d on %d matrices', self.trainer.version, self.index)
 
     def _request_stats(self, datapath):
         #self.logger.debug('send stats request: %016x', datapath.id)
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
-        req = parser.OFPFlowStatsRequest(datapath)
+        # Only the host flows of table 0 are requested, the table-miss and other flows are filtered by the switch
+        req = parser.OFPFlowStatsRequest(datapath, 0, 0, ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                         HOST_FLOW_COOKIE, 0xffffffffffffffff, parser.OFPMatch())
+        self.poller.record_request(datapath.id, datapath.set_xid(req))
         datapath.send_msg(req)
 
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+        # Same as simple_switch_13, with host flows tagged by their cookie
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        cookie = HOST_FLOW_COOKIE if priority == 1 else 0
+
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                             actions)]
+        if buffer_id:
+            mod = parser.OFPFlowMod(datapath=datapath, cookie=cookie, buffer_id=buffer_id,
+                                    priority=priority, match=match,
+                                    instructions=inst)
+        else:
+            mod = parser.OFPFlowMod(datapath=datapath, cookie=cookie, priority=priority,
+                                    match=match, instructions=inst)
+        datapath.send_msg(mod)
+
     
     @set_ev_cls(ofp_event.EventOFPPacketIn, 
                 MAIN_DISPATCHER)
-    def packet_in_handler(self, ev):
-        msg = ev.msg
+    def _packet_in_handler(self, ev):
+        # Single packet-in handler: without proactive routes the learning switch of simple_switch_13 handles it
+        if not self.proactive:
+            super(SimpleMonitor13, self)._packet_in_handler(ev)
+            return
+
+        # With proactive routes, ARP requests for hosts of the plan are answered, every other packet is dropped:
+        # broadcast and multicast frames (IPv6 ND, DHCP, ARP for unknown IPs) match no host flow, flooding them
+        # would bring them back from every loop of the topology
+        self._reply_arp(ev.msg)
+
+    def _reply_arp(self, msg):
+        # Answers an ARP request for a host of the plan, returns whether the packet was handled
         dp = msg.datapath
         ofp = dp.ofproto
         ofp_parser = dp.ofproto_parser
+        pkt = packet.Packet(msg.data)
+        request = pkt.get_protocol(arp.arp)
+        if request is None or request.opcode != arp.ARP_REQUEST or request.dst_ip not in self.ip_to_mac:
+            return False
+        mac = self.ip_to_mac[request.dst_ip]
+        reply = packet.Packet()
+        reply.add_protocol(ethernet.ethernet(ethertype=ether_types.ETH_TYPE_ARP,
+                                             dst=request.src_mac, src=mac))
+        reply.add_protocol(arp.arp(opcode=arp.ARP_REPLY, src_mac=mac, src_ip=request.dst_ip,
+                                   dst_mac=request.src_mac, dst_ip=request.src_ip))
+        reply.serialize()
 
-        # Determine the in_port based on the OpenFlow version
-        if ev.msg.version == ofproto_v1_3.OFP_VERSION:
-            in_port = ev.msg.match['in_port']
-        else:
-            in_port = ev.msg.in_port
-
-        actions = [ofp_parser.OFPActionOutput(ofp.OFPP_FLOOD)]
-
-        data = None
-        if msg.buffer_id == ofp.OFP_NO_BUFFER:
-            data = msg.data
-
+        actions = [ofp_parser.OFPActionOutput(msg.match['in_port'])]
         out = ofp_parser.OFPPacketOut(
-            datapath=dp, buffer_id=msg.buffer_id, in_port=in_port,
-            actions=actions, data=data
+            datapath=dp, buffer_id=ofp.OFP_NO_BUFFER, in_port=ofp.OFPP_CONTROLLER,
+            actions=actions, data=reply.data
         )
-
         dp.send_msg(out)
+        return True
 
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def _flow_stats_reply_handler(self, ev):
         
         body = ev.msg.body
+        dpid = ev.msg.datapath.id
+        self.replies += 1
+        if self.logger.isEnabledFor(logging.DEBUG) and self.replies % self.flow_log_every == 0:
+            self._log_flows(dpid, body)
 
-        self.logger.info('-------FLOW STATS------')
-        self.logger.info('datapath         '
+        # Host flows are parsed into columns and accounted in one vectorized update
+        src, dst, byte_count, packet_count, duration = parse_flow_stats(body, self.hosts.mac_to_index)
+        measured, changed = self.counters.update(dpid, src, dst, byte_count, packet_count, duration)
+        # Large replies are split over several messages, the request is answered with the last one
+        more = bool(ev.msg.flags & ev.msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        self.poller.record_reply(dpid, ev.msg.xid, measured, changed, more)
+
+    def _log_flows(self, dpid, body):
+        self.logger.debug('-------FLOW STATS------')
+        self.logger.debug('datapath         '
                         'in-port  eth-dst           '
                         'out-port packets  bytes     ')
-        self.logger.info('---------------- '
+        self.logger.debug('---------------- '
                         '-------- ----------------- '
                         '-------- -------- --------')
-
-        # MAC to index mapping
-        mac_to_index = {}
-        base_mac = '00:00:00:00:00'
-        for i in range(10):
-            mac_to_index[base_mac + f':{i+1:02}'] = i
-
+        # Proactive host flows match any input port, shown as 0
         for stat in sorted([flow for flow in body if flow.priority == 1],
-                        key=lambda flow: (flow.match['in_port'])):
-          
-            self.logger.info('%016x %8x %17s %8x %8d %8d',
-                            ev.msg.datapath.id,
-                            stat.match['in_port'], stat.match['eth_dst'],
+                        key=lambda flow: (flow.match.get('in_port', 0))):
+            self.logger.debug('%016x %8x %17s %8x %8d %8d',
+                            dpid,
+                            stat.match.get('in_port', 0), stat.match['eth_dst'],
                             stat.instructions[0].actions[0].port,
                             stat.packet_count, stat.byte_count)
-            
-            src = stat.match.get('eth_src')
-            dst = stat.match.get('eth_dst')
-            if src in mac_to_index and dst in mac_to_index:
-                # Keeping the index atmost n
-                if self.index < self.n:
-                    self.matrix[self.index][mac_to_index[src], mac_to_index[dst]] = stat.byte_count
-     
-        # Check if each row of the current matrix has at least one non-zero value
-        all_rows_have_nonzero = all(np.any(row) for row in self.matrix[self.index])
-
-        if all_rows_have_nonzero:
-            # Increment the index
-            self.index += 1
-
-        # If all matrices have been filled (at least partially), save the tensor
-        if self.index == self.n and not self.save_dataset:
-            if not os.path.exists('output'):
-                os.makedirs('output')
-            np.save('output/tensor.npy', self.matrix)
-
-            # Memory management
-            self.matrix = None
-            import gc
-            gc.collect()
-
-            self.save_dataset = True
 
-        # ML integration and data processing
-        if self.save_dataset:
-            samples = np.load('output/tensor.npy')
-            sc = fit_scaler(samples)
-            samples = scale_data(sc, samples)
-            x, y, tx, ty = process_data(samples, (4,3), [(4,3)])
-
-            cnn = CNN((10,10,1), (4,3))
-            cnn.train(x,y,tx,ty, 'snippets/test_model')
-            sorted_coordinates = cnn.lime(x,tx,'snippets/imp.npy')
-            cnnr = CNN((5,5,1), [(4,3)])
-            selected_coordinates = sorted_coordinates[-25:]
-            xr, yr, txr, tyr = process_data_reduced(samples, (4,3), selected_coordinates)
-            cnnr.train(xr,yr,txr,tyr, 'snippet/test_model_r')
\ No newline at end of file
+    def _complete_matrix(self):
+        # Estimate the unmeasured flows that have a model, the others stay missing (NaN)
+        if not self.completion.ready:
+            return
+        missing = np.argwhere(~self.observed)
+        self.completed_matrix = self.completion.complete(self.matrix, missing)
+        unestimated = int(np.isnan(self.completed_matrix).sum())
+        self.logger.info('estimated %d of %d missing flows in %.2f ms', len(missing) - unestimated, len(missing),
+                         self.completion.latencies[-1] * 1000)
@@ -0,0 +1,359 @@
+import os
+import shutil
+import numpy as np
+from tensor_store import TensorStore
+
+def initialize_demand(num_hosts, low = 1, high = 9, rng = None):
+    '''
+    Initial demand matrix of generateRandomTraffic.Generator: uniform values rounded to 4 decimals, zero diagonal.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts.
+    low : float
+        lower bound of the initial demands.
+    high : float
+        upper bound of the initial demands.
+    rng : numpy.random.Generator
+        random generator, a fresh one if None.
+
+    Returns
+    -------
+    NDArray
+        (num_hosts, num_hosts) demand matrix.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    demand = np.round(rng.uniform(low, high, (num_hosts, num_hosts)), 4)
+    np.fill_diagonal(demand, 0)
+    return demand
+
+def random_walk(demand, count, noise = 2.5, rng = None):
+    '''
+    Next count demand matrices of the bounded random walk of generateRandomTraffic.Generator.update_demand,
+    d_t = max(0, d_t-1 + e_t) with e_t uniform in [-noise, noise] rounded to 4 decimals, for all steps at once.
+
+    The reflection at 0 is a Lindley recursion, whose closed form d_t = d_0 + S_t - min(0, min_k<=t (d_0 + S_k)),
+    S_t being the cumulative sum of the noise, only needs cumulative sums and minimums along the time axis.
+
+    Parameters
+    ----------
+    demand : NDArray
+        (n, n) demand matrix the walk starts from (not included in the output).
+    count : int
+        number of steps.
+    noise : float
+        bound of the uniform noise added at every step.
+    rng : numpy.random.Generator
+        random generator, a fresh one if None.
+
+    Returns
+    -------
+    NDArray
+        (count, n, n) demand matrices, the diagonal stays 0.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    steps = np.round(rng.uniform(-noise, noise, (count,) + demand.shape), 4)
+    np.cumsum(steps, axis=0, out=steps)
+    steps += demand
+    floor = np.minimum.accumulate(steps, axis=0)
+    np.minimum(floor, 0, out=floor)
+    steps -= floor
+    diagonal = np.arange(demand.shape[0])
+    steps[:, diagonal, diagonal] = 0
+    return steps
+
+def iter_random_walk(num_hosts, num_matrices, chunk_size = 4096, low = 1, high = 9, noise = 2.5, seed = None):
+    '''
+    Stream the demand matrices of generateRandomTraffic.Generator (initial demand followed by its random walk)
+    one chunk at a time, so that tensors larger than memory can be generated.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts.
+    num_matrices : int
+        total number of matrices.
+    chunk_size : int
+        number of matrices per chunk.
+    low : float
+        lower bound of the initial demands.
+    high : float
+        upper bound of the initial demands.
+    noise : float
+        bound of the random walk noise.
+    seed : int
+        seed of the generator.
+
+    Yields
+    ------
+    NDArray
+        chunks of shape (k, num_hosts, num_hosts).
+    '''
+    rng = np.random.default_rng(seed)
+    demand = initialize_demand(num_hosts, low, high, rng)
+    generated = 0
+    while generated < num_matrices:
+        size = min(chunk_size, num_matrices - generated)
+        if generated == 0:
+            chunk = np.concatenate([demand[None], random_walk(demand, size - 1, noise, rng)])
+        else:
+            chunk = random_walk(demand, size, noise, rng)
+        demand = chunk[-1].copy()
+        generated += size
+        yield chunk
+
+def random_walk_tensor(num_hosts, num_matrices, low = 1, high = 9, noise = 2.5, seed = None):
+    '''
+    Tensor of num_matrices demand matrices of generateRandomTraffic.Generator, see iter_random_walk.
+
+    Returns
+    -------
+    NDArray
+        (num_matrices, num_hosts, num_hosts) tensor.
+    '''
+    return np.concatenate(list(iter_random_walk(num_hosts, num_matrices, low=low, high=high, noise=noise, seed=seed)))
+
+def gravity_demand(num_hosts, mean_demand = 5, rng = None):
+    '''
+    Mean demand matrix of a gravity model: the demand from host i to host j is proportional to the product of
+    the (exponentially distributed) outgoing mass of i and incoming mass of j.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts.
+    mean_demand : float
+        average off-diagonal demand.
+    rng : numpy.random.Generator
+        random generator, a fresh one if None.
+
+    Returns
+    -------
+    NDArray
+        (num_hosts, num_hosts) demand matrix with zero diagonal.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    demand = np.outer(rng.exponential(1, num_hosts), rng.exponential(1, num_hosts))
+    np.fill_diagonal(demand, 0)
+    return demand * mean_demand * num_hosts * (num_hosts - 1) / demand.sum()
+
+def diurnal_profile(start, count, period = 288, amplitude = 0.5, phase = 0.):
+    '''
+    Daily variation factor 1 + amplitude * sin(2 pi t / period + phase) of steps start to start + count.
+
+    Parameters
+    ----------
+    start : int
+        index of the first step.
+    count : int
+        number of steps.
+    period : int
+        number of steps per day (288 for a matrix every 5 minutes).
+    amplitude : float
+        relative amplitude of the variation, below 1 to keep demands non-negative.
+    phase : float
+        phase of the profile in radians.
+
+    Returns
+    -------
+    NDArray
+        array of count factors.
+    '''
+    return 1 + amplitude * np.sin(2 * np.pi * np.arange(start, start + count) / period + phase)
+
+def loss_mask(count, num_hosts, pattern = 'uniform', rate = 0.1, burst_length = 10, rng = None, remaining = None):
+    '''
+    Measurement loss pattern of count matrices, True marking the flows whose measurement is missing.
+
+    Parameters
+    ----------
+    count : int
+        number of matrices.
+    num_hosts : int
+        number of hosts.
+    pattern : str
+        'uniform' for independent losses of every flow, 'host' for the loss of all flows of a source host
+        (e.g. an unanswered switch statistics request), 'burst' for losses of individual flows lasting
+        burst_length steps on average.
+    rate : float
+        fraction of missing measurements.
+    burst_length : float
+        average number of consecutive steps a flow stays missing, for the 'burst' pattern.
+    rng : numpy.random.Generator
+        random generator, a fresh one if None.
+    remaining : NDArray
+        optional (num_hosts, num_hosts) integer array of the steps left in the bursts of the previous steps, for the
+        'burst' pattern. It is updated in place with the steps left at the end of these count steps, so that
+        consecutive calls draw the same masks whatever the number of steps of each call.
+
+    Returns
+    -------
+    NDArray
+        (count, num_hosts, num_hosts) boolean mask, the diagonal is never missing.
+    '''
+    rng = np.random.default_rng() if rng is None else rng
+    shape = (count, num_hosts, num_hosts)
+    if pattern == 'uniform':
+        mask = rng.random(shape) < rate
+    elif pattern == 'host':
+        mask = np.repeat(rng.random((count, num_hosts, 1)) < rate, num_hosts, axis=2)
+    elif pattern == 'burst':
+        # Bursts start with probability rate / burst_length and last burst_length steps on average (geometric lengths).
+        # Start and length of every step and flow come from one pair of uniforms, consumed in step order
+        u = rng.random(shape + (2,))
+        starts = u[..., 0] < rate / burst_length
+        lengths = 1 + np.floor(np.log1p(-u[..., 1]) / np.log1p(-1 / burst_length)).astype(np.int64)
+        ends = np.zeros((count + 1, num_hosts, num_hosts), dtype=np.int64)
+        steps, rows, columns = np.nonzero(starts)
+        burst_ends = steps + lengths[starts]
+        np.add.at(ends, (np.minimum(burst_ends, count), rows, columns), 1)
+        active = np.cumsum(starts, axis=0) - np.cumsum(ends[:-1], axis=0)
+        carried = np.zeros(shape[1:], dtype=np.int64) if remaining is None else remaining
+        mask = (active > 0) | (np.arange(count)[:, None, None] < carried)
+        if remaining is not None:
+            # Bursts still active after the last step carry over to the next call
+            tail = np.zeros(shape[1:], dtype=np.int64)
+            np.maximum.at(tail, (rows, columns), burst_ends - count)
+            remaining[...] = np.maximum(np.maximum(carried - count, tail), 0)
+    else:
+        raise ValueError(f'Unknown loss pattern {pattern}, expected one of uniform, host, burst.')
+    diagonal = np.arange(num_hosts)
+    mask[:, diagonal, diagonal] = False
+    return mask
+
+def iter_traffic(num_hosts, num_matrices, model = 'random_walk', chunk_size = 4096, noise = 2.5, mean_demand = 5, sigma = 0.2, diurnal_period = None, diurnal_amplitude = 0.5, seed = None):
+    '''
+    Stream synthetic demand matrices one chunk at a time.
+
+    Parameters
+    ----------
+    num_hosts : int
+        number of hosts.
+    num_matrices : int
+        total number of matrices.
+    model : str
+        'random_walk' for the demand model of generateRandomTraffic.Generator (see iter_random_walk), 'gravity' for
+        a fixed gravity model mean (see gravity_demand) with independent lognormal fluctuations of every flow.
+    chunk_size : int
+        number of matrices per chunk.
+    noise : float
+        bound of the random walk noise.
+    mean_demand : float
+        average demand of the gravity model.
+    sigma : float
+        standard deviation of the log of the gravity model fluctuations.
+    diurnal_period : int
+        if set, demands are multiplied by a diurnal_profile of this period.
+    diurnal_amplitude : float
+        relative amplitude of the diurnal profile.
+    seed : int
+        seed of the generator.
+
+    Yields
+    ------
+    NDArray
+        chunks of shape (k, num_hosts, num_hosts).
+    '''
+    if model == 'random_walk':
+        chunks = iter_random_walk(num_hosts, num_matrices, chunk_size, noise=noise, seed=seed)
+    elif model == 'gravity':
+        rng = np.random.default_rng(seed)
+        mean = gravity_demand(num_hosts, mean_demand, rng)
+        # Lognormal fluctuations of unit mean keep the gravity matrix as the expected demand
+        chunks = (mean * rng.lognormal(-sigma**2 / 2, sigma, (min(chunk_size, num_matrices - first), num_hosts, num_hosts)) for first in range(0, num_matrices, chunk_size))
+    else:
+        raise ValueError(f'Unknown traffic model {model}, expected one of random_walk, gravity.')
+    first = 0
+    for chunk in chunks:
+        if diurnal_period is not None:
+            chunk = chunk * diurnal_profile(first, len(chunk), diurnal_period, diurnal_amplitude)[:, None, None]
+        first += len(chunk)
+        yield chunk
+
+def _remove_output(path):
+    # Outputs of a previous run are overwritten, never appended to
+    if os.path.isdir(path):
+        if not os.path.exists(os.path.join(path, TensorStore.HEADER)):
+            raise ValueError(f'{path} exists and is not a tensor store.')
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def write_traffic(path, num_hosts, num_matrices, loss = None, loss_rate = 0.1, burst_length = 10, interval = 5., chunk_size = 4096, seed = None, **model):
+    '''
+    Generate synthetic demand matrices straight into a TensorStore directory or a .npy file readable by
+    preprocessing.load_tensor, together with an optional measurement loss mask.
+    Matrices and masks previously written at path are replaced, whether it is a TensorStore or a .npy file.
+
+    Parameters
+    ----------
+    path : str
+        destination TensorStore directory, or .npy file.
+    num_hosts : int
+        number of hosts.
+    num_matrices : int
+        number of matrices.
+    loss : str
+        optional loss pattern (see loss_mask). The mask is stored next to the matrices, in a TensorStore
+        `<path>_mask` or a file `<path without .npy>_mask.npy`, the matrices themselves are kept complete.
+    loss_rate : float
+        fraction of missing measurements.
+    burst_length : float
+        average length of the loss bursts.
+    interval : float
+        time in seconds between matrices, for the TensorStore timestamps.
+    chunk_size : int
+        number of matrices generated at a time.
+    seed : int
+        seed of the generator.
+    model : dict
+        traffic model options of iter_traffic.
+
+    Returns
+    -------
+    str
+        path of the loss mask, None if no loss pattern was requested.
+    '''
+    rng = np.random.default_rng(None if seed is None else seed + 1)
+    shape = (num_hosts, num_hosts)
+    mask_path = None
+    stored_mask_path = path[:-len('.npy')] + '_mask.npy' if path.endswith('.npy') else path + '_mask'
+    # A stale mask would be loaded with the new matrices, it is removed even without a loss pattern
+    _remove_output(path)
+    _remove_output(stored_mask_path)
+    if path.endswith('.npy'):
+        matrices = np.lib.format.open_memmap(path, mode='w+', dtype='float64', shape=(num_matrices,) + shape)
+        if loss is not None:
+            mask_path = stored_mask_path
+            masks = np.lib.format.open_memmap(mask_path, mode='w+', dtype='bool', shape=(num_matrices,) + shape)
+    else:
+        matrices = TensorStore(path, shape=shape, chunk_size=chunk_size)
+        if loss is not None:
+            mask_path = stored_mask_path
+            masks = TensorStore(mask_path, shape=shape, dtype='bool', chunk_size=chunk_size)
+    first = 0
+    remaining = np.zeros(shape, dtype=np.int64)
+    for chunk in iter_traffic(num_hosts, num_matrices, chunk_size=chunk_size, seed=seed, **model):
+        timestamps = interval * np.arange(first, first + len(chunk))
+        if isinstance(matrices, TensorStore):
+            matrices.extend(chunk, timestamps)
+        else:
+            matrices[first:first + len(chunk)] = chunk
+        if loss is not None:
+            mask = loss_mask(len(chunk), num_hosts, loss, loss_rate, burst_length, rng, remaining)
+            if isinstance(masks, TensorStore):
+                masks.extend(mask, timestamps)
+            else:
+                masks[first:first + len(chunk)] = mask
+        first += len(chunk)
+    if not isinstance(matrices, TensorStore):
+        matrices.flush()
+        if loss is not None:
+            masks.flush()
+    return mask_path
+
+# Driver code
+if __name__ == '__main__':
+    mask_path = write_traffic('output/synthetic', 10, 100000, loss='uniform', seed=0)
+    print(f'100000 matrices written to output/synthetic, loss mask in {mask_path}')
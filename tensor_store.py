@@ -0,0 +1,247 @@
+import json
+import os
+import time
+import numpy as np
+
+class TensorStore:
+    """
+    Append-only, chunked and memory-mappable on-disk store of traffic matrices.
+
+    The store is a directory holding a small `header.json` (matrix shape, dtype, chunk size, number of stored
+    matrices) and, for every chunk, a `chunk_XXXXX.npy` file of shape (chunk_size, n, m) together with a
+    `timestamps_XXXXX.npy` file of shape (chunk_size,). Chunks are preallocated .npy files opened as memory maps,
+    so appending a matrix writes only that matrix and reading a slice only touches the chunks it spans.
+    The header is rewritten atomically after each flushed append, so a crash never exposes partially written matrices.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the store.
+    matrix_shape : tuple
+        Shape (n, m) of each stored traffic matrix.
+    dtype : numpy.dtype
+        Data type of the stored values.
+    chunk_size : int
+        Number of matrices per chunk file.
+
+    Methods
+    -------
+    append(matrix, timestamp)
+        Append a single traffic matrix.
+
+    extend(matrices, timestamps)
+        Append a batch of traffic matrices.
+
+    read(start, stop)
+        Read a slice of matrices into memory.
+
+    timestamps(start, stop)
+        Read the timestamps of a slice of matrices.
+
+    iter_chunks(start, stop)
+        Iterate over memory mapped slices of the store, one chunk at a time.
+    """
+
+    HEADER = 'header.json'
+
+    def __init__(self, path, shape = None, dtype = 'float64', chunk_size = 1024, mode = 'a') -> None:
+        """
+        Open an existing store or create a new one.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the store.
+        shape : tuple
+            Shape (n, m) of the traffic matrices. Only needed when creating a new store.
+        dtype : str
+            Data type of the stored values. Only used when creating a new store.
+        chunk_size : int
+            Number of matrices per chunk file. Only used when creating a new store.
+        mode : str
+            'r' for read-only access, 'r+' to also modify stored matrices in place, 'a' to append (creating the store if needed).
+        """
+        if mode not in ('r', 'r+', 'a'):
+            raise ValueError(f'Unsupported mode {mode}, expected one of r, r+, a.')
+        self.path = path
+        self.mode = mode
+        self._chunks = {}
+        self._timestamps = {}
+        header_path = os.path.join(path, self.HEADER)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+            if shape is not None and tuple(shape) != tuple(header['shape']):
+                raise ValueError(f'Store at {path} holds matrices of shape {tuple(header["shape"])}, not {tuple(shape)}.')
+        elif mode == 'a':
+            if shape is None:
+                raise ValueError(f'A matrix shape is required to create a new store at {path}.')
+            os.makedirs(path, exist_ok=True)
+            header = {'shape': list(shape), 'dtype': np.dtype(dtype).str, 'chunk_size': int(chunk_size), 'count': 0, 'created': time.time()}
+            self._write_header(header)
+        else:
+            raise FileNotFoundError(f'No tensor store found at {path}.')
+        self.matrix_shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.chunk_size = header['chunk_size']
+        self._header = header
+
+    def __len__(self):
+        return self._header['count']
+
+    @property
+    def shape(self):
+        """Shape (N, n, m) of the stored tensor."""
+        return (len(self),) + self.matrix_shape
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.read(start, stop)[::step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(f'Index {key} is out of bounds for store of {len(self)} matrices.')
+        return self.read(key, key + 1)[0]
+
+    def _write_header(self, header):
+        header_path = os.path.join(self.path, self.HEADER)
+        tmp_path = header_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(header, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, header_path)
+
+    def _chunk(self, index, create = False):
+        if index not in self._chunks:
+            chunk_path = os.path.join(self.path, f'chunk_{index:05d}.npy')
+            timestamps_path = os.path.join(self.path, f'timestamps_{index:05d}.npy')
+            if create and not os.path.exists(chunk_path):
+                self._chunks[index] = np.lib.format.open_memmap(chunk_path, mode='w+', dtype=self.dtype, shape=(self.chunk_size,) + self.matrix_shape)
+                self._timestamps[index] = np.lib.format.open_memmap(timestamps_path, mode='w+', dtype='float64', shape=(self.chunk_size,))
+            else:
+                memmap_mode = 'r' if self.mode == 'r' else 'r+'
+                self._chunks[index] = np.load(chunk_path, mmap_mode=memmap_mode)
+                self._timestamps[index] = np.load(timestamps_path, mmap_mode=memmap_mode)
+        return self._chunks[index], self._timestamps[index]
+
+    def _slices(self, start, stop):
+        # (chunk index, first row, last row, position in the output) for every chunk spanned by [start, stop)
+        position = start
+        while position < stop:
+            index = position // self.chunk_size
+            first = position - index * self.chunk_size
+            last = min(self.chunk_size, stop - index * self.chunk_size)
+            yield index, first, last, position - start
+            position += last - first
+
+    def _bounds(self, start, stop):
+        count = len(self)
+        stop = count if stop is None else min(stop, count)
+        return max(0, start), max(0, stop)
+
+    def extend(self, matrices, timestamps = None):
+        """
+        Append a batch of traffic matrices to the store and flush them to disk.
+
+        Parameters
+        ----------
+        matrices : NDArray
+            array of shape (k, n, m) of traffic matrices.
+        timestamps : NDArray
+            optional array of k timestamps. Defaults to the current time.
+        """
+        if self.mode != 'a':
+            raise IOError(f'Store at {self.path} is not open for appending.')
+        matrices = np.asarray(matrices)
+        if matrices.shape[1:] != self.matrix_shape:
+            raise ValueError(f'Provided matrices of shape {matrices.shape[1:]} do not match store shape {self.matrix_shape}.')
+        if timestamps is None:
+            timestamps = np.full(len(matrices), time.time())
+        start = len(self)
+        for index, first, last, offset in self._slices(start, start + len(matrices)):
+            chunk, chunk_timestamps = self._chunk(index, create=True)
+            chunk[first:last] = matrices[offset:offset + last - first]
+            chunk_timestamps[first:last] = timestamps[offset:offset + last - first]
+            chunk.flush()
+            chunk_timestamps.flush()
+        self._header['count'] = start + len(matrices)
+        self._write_header(self._header)
+
+    def append(self, matrix, timestamp = None):
+        """
+        Append a single traffic matrix to the store and flush it to disk.
+
+        Parameters
+        ----------
+        matrix : NDArray
+            traffic matrix of shape (n, m).
+        timestamp : float
+            time the matrix was collected at. Defaults to the current time.
+        """
+        self.extend(np.expand_dims(matrix, 0), None if timestamp is None else [timestamp])
+
+    def read(self, start = 0, stop = None):
+        """
+        Read a slice of matrices into memory.
+
+        Parameters
+        ----------
+        start : int
+            index of the first matrix to read.
+        stop : int
+            index after the last matrix to read. Defaults to the end of the store.
+
+        Returns
+        -------
+        NDArray
+            array of shape (stop - start, n, m).
+        """
+        start, stop = self._bounds(start, stop)
+        data = np.empty((max(0, stop - start),) + self.matrix_shape, dtype=self.dtype)
+        for index, first, last, offset in self._slices(start, stop):
+            data[offset:offset + last - first] = self._chunk(index)[0][first:last]
+        return data
+
+    def timestamps(self, start = 0, stop = None):
+        """
+        Read the timestamps of a slice of matrices.
+
+        Parameters
+        ----------
+        start : int
+            index of the first matrix.
+        stop : int
+            index after the last matrix. Defaults to the end of the store.
+
+        Returns
+        -------
+        NDArray
+            array of shape (stop - start,) of timestamps.
+        """
+        start, stop = self._bounds(start, stop)
+        data = np.empty(max(0, stop - start))
+        for index, first, last, offset in self._slices(start, stop):
+            data[offset:offset + last - first] = self._chunk(index)[1][first:last]
+        return data
+
+    def iter_chunks(self, start = 0, stop = None):
+        """
+        Iterate over the store one chunk at a time without copying.
+
+        Parameters
+        ----------
+        start : int
+            index of the first matrix.
+        stop : int
+            index after the last matrix. Defaults to the end of the store.
+
+        Yields
+        ------
+        NDArray
+            memory mapped views of shape (k, n, m), writable if the store was opened with mode 'r+' or 'a'.
+        """
+        start, stop = self._bounds(start, stop)
+        for index, first, last, _ in self._slices(start, stop):
+            yield self._chunk(index)[0][first:last]
@@ -0,0 +1,296 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+from collections import deque
+from host_index import host_mac, host_ip
+
+class PlanBuilder:
+    """
+    Incremental construction of a topology plan: switches, hosts with their MAC/IP addresses and links with
+    explicit port numbers, so that the Mininet network, the traffic generators and the controller agree on
+    every address and port.
+
+    Hosts are numbered in creation order, which is also their index in the traffic matrices.
+
+    Methods
+    -------
+    add_switch()
+        Add a switch and return its name.
+
+    add_host(switch)
+        Add a host attached to switch and return its name.
+
+    add_link(node1, node2)
+        Link two nodes on their next free ports.
+
+    plan()
+        The plan as a JSON-serializable dictionary.
+    """
+
+    def __init__(self, name) -> None:
+        self.name = name
+        self.switches = []
+        self.hosts = []
+        self.links = []
+        self.ports = {}
+
+    def add_switch(self):
+        name = f's{len(self.switches) + 1}'
+        self.switches.append({'name': name, 'dpid': len(self.switches) + 1})
+        self.ports[name] = 0
+        return name
+
+    def add_host(self, switch):
+        index = len(self.hosts)
+        name = f'h{index + 1}'
+        # Hosts use a single interface, eth0
+        self.ports[name] = -1
+        port = self.add_link(switch, name)[0]
+        self.hosts.append({'name': name, 'index': index, 'mac': host_mac(index), 'ip': host_ip(index, None), 'switch': switch, 'port': port})
+        return name
+
+    def add_link(self, node1, node2):
+        # Switch ports are numbered from 1 in link order, as Mininet does
+        self.ports[node1] += 1
+        self.ports[node2] += 1
+        self.links.append({'node1': node1, 'node2': node2, 'port1': self.ports[node1], 'port2': self.ports[node2]})
+        return self.ports[node1], self.ports[node2]
+
+    def plan(self):
+        return {'name': self.name, 'switches': self.switches, 'hosts': self.hosts, 'links': self.links}
+
+def linear_plan(num_switches, hosts_per_switch = 1):
+    '''
+    Plan of a chain of switches with the same number of hosts on each.
+
+    Parameters
+    ----------
+    num_switches : int
+        number of switches.
+    hosts_per_switch : int
+        number of hosts attached to each switch.
+
+    Returns
+    -------
+    dict
+        the topology plan.
+    '''
+    builder = PlanBuilder(f'linear_{num_switches}_{hosts_per_switch}')
+    switches = [builder.add_switch() for _ in range(num_switches)]
+    for switch in switches:
+        for _ in range(hosts_per_switch):
+            builder.add_host(switch)
+    for switch1, switch2 in zip(switches, switches[1:]):
+        builder.add_link(switch1, switch2)
+    return builder.plan()
+
+def tree_plan(depth, fanout):
+    '''
+    Plan of a tree of switches with fanout hosts on every leaf switch (fanout ** depth hosts).
+
+    Parameters
+    ----------
+    depth : int
+        number of switch levels.
+    fanout : int
+        number of children of every switch.
+
+    Returns
+    -------
+    dict
+        the topology plan.
+    '''
+    builder = PlanBuilder(f'tree_{depth}_{fanout}')
+    level = [builder.add_switch()]
+    for _ in range(depth - 1):
+        children = []
+        for parent in level:
+            for _ in range(fanout):
+                child = builder.add_switch()
+                builder.add_link(parent, child)
+                children.append(child)
+        level = children
+    for leaf in level:
+        for _ in range(fanout):
+            builder.add_host(leaf)
+    return builder.plan()
+
+def fat_tree_plan(k):
+    '''
+    Plan of a k-ary fat-tree: k pods of k/2 edge and k/2 aggregation switches, (k/2)**2 core switches and
+    k/2 hosts per edge switch (k**3 / 4 hosts). The topology has loops, flooding-based forwarding needs
+    proactive routes (or a spanning tree) to use it.
+
+    Parameters
+    ----------
+    k : int
+        even number of ports per switch.
+
+    Returns
+    -------
+    dict
+        the topology plan.
+    '''
+    if k % 2:
+        raise ValueError(f'Fat-tree arity must be even, got {k}.')
+    half = k // 2
+    builder = PlanBuilder(f'fat_tree_{k}')
+    cores = [builder.add_switch() for _ in range(half * half)]
+    for _ in range(k):
+        aggregations = [builder.add_switch() for _ in range(half)]
+        edges = [builder.add_switch() for _ in range(half)]
+        for a, aggregation in enumerate(aggregations):
+            for core in cores[a * half:(a + 1) * half]:
+                builder.add_link(core, aggregation)
+            for edge in edges:
+                builder.add_link(aggregation, edge)
+        for edge in edges:
+            for _ in range(half):
+                builder.add_host(edge)
+    return builder.plan()
+
+def edge_list_plan(edges, hosts_per_switch = 1, name = 'edge_list'):
+    '''
+    Plan of an arbitrary switch graph given as an edge list, with the same number of hosts on each switch.
+
+    Parameters
+    ----------
+    edges : list
+        list of (node, node) pairs of any hashable node identifiers. Switches are numbered in order of appearance.
+    hosts_per_switch : int
+        number of hosts attached to each switch.
+    name : str
+        name of the topology.
+
+    Returns
+    -------
+    dict
+        the topology plan.
+    '''
+    builder = PlanBuilder(name)
+    switches = {}
+    for edge in edges:
+        for node in edge:
+            if node not in switches:
+                switches[node] = builder.add_switch()
+    for switch in switches.values():
+        for _ in range(hosts_per_switch):
+            builder.add_host(switch)
+    seen = set()
+    for node1, node2 in edges:
+        pair = frozenset((node1, node2))
+        # Self loops and parallel edges of multigraphs are dropped
+        if node1 != node2 and pair not in seen:
+            seen.add(pair)
+            builder.add_link(switches[node1], switches[node2])
+    return builder.plan()
+
+def graphml_plan(path, hosts_per_switch = 1):
+    '''
+    Plan of a GraphML topology (e.g. from the Internet Topology Zoo), one switch per node.
+
+    Parameters
+    ----------
+    path : str
+        path of the GraphML file.
+    hosts_per_switch : int
+        number of hosts attached to each switch.
+
+    Returns
+    -------
+    dict
+        the topology plan, named after the file.
+    '''
+    # Tags are namespaced in standard GraphML files, e.g. {http://graphml.graphdrawing.org/xmlns}graph
+    graph = next(element for element in ET.parse(path).getroot() if element.tag.endswith('graph'))
+    namespace = graph.tag[:-len('graph')]
+    nodes = [node.get('id') for node in graph.iter(namespace + 'node')]
+    edges = [(edge.get('source'), edge.get('target')) for edge in graph.iter(namespace + 'edge')]
+    # Isolated nodes still get a switch, numbered in document order
+    edges = [(node, node) for node in nodes] + edges
+    name = os.path.splitext(os.path.basename(path))[0]
+    return edge_list_plan(edges, hosts_per_switch, name)
+
+def host_routes(plan):
+    '''
+    Forwarding entries of a per-(source, destination) route between every pair of hosts of a plan, along
+    shortest paths of the switch graph (in hops, ties broken by link order). The routes towards a switch
+    follow a tree, so they are loop-free whatever the loops of the topology.
+
+    Parameters
+    ----------
+    plan : dict
+        the topology plan.
+
+    Returns
+    -------
+    dict
+        list of (source MAC, destination MAC, output port) entries of every switch, keyed by datapath id.
+        Hosts of disconnected parts of the network get no route between them.
+    '''
+    dpids = {switch['name']: switch['dpid'] for switch in plan['switches']}
+    neighbours = {name: [] for name in dpids}
+    for link in plan['links']:
+        if link['node1'] in dpids and link['node2'] in dpids:
+            neighbours[link['node1']].append((link['node2'], link['port1']))
+            neighbours[link['node2']].append((link['node1'], link['port2']))
+    hosts_of = {name: [] for name in dpids}
+    for host in plan['hosts']:
+        hosts_of[host['switch']].append(host)
+    routes = {dpid: [] for dpid in dpids.values()}
+    for switch in dpids:
+        # Breadth-first tree towards the switch of the destinations: next hop of every switch and its output port
+        next_hop = {switch: None}
+        queue = deque([switch])
+        while queue:
+            node = queue.popleft()
+            for neighbour, _ in neighbours[node]:
+                if neighbour not in next_hop:
+                    next_hop[neighbour] = next((node, port) for peer, port in neighbours[neighbour] if peer == node)
+                    queue.append(neighbour)
+        for dst in hosts_of[switch]:
+            for src in plan['hosts']:
+                if src['index'] == dst['index'] or src['switch'] not in next_hop:
+                    continue
+                node = src['switch']
+                while node != switch:
+                    hop, port = next_hop[node]
+                    routes[dpids[node]].append((src['mac'], dst['mac'], port))
+                    node = hop
+                routes[dpids[switch]].append((src['mac'], dst['mac'], dst['port']))
+    return routes
+
+def save_plan(plan, path = 'output/topology.json'):
+    '''
+    Publish a topology plan as JSON, for the controller and the traffic generators (see host_index.load_host_index).
+
+    Parameters
+    ----------
+    plan : dict
+        the topology plan.
+    path : str
+        destination file.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(plan, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def load_plan(path = 'output/topology.json'):
+    '''
+    Load a topology plan published with save_plan.
+
+    Parameters
+    ----------
+    path : str
+        path of the plan JSON.
+
+    Returns
+    -------
+    dict
+        the topology plan.
+    '''
+    with open(path) as f:
+        return json.load(f)
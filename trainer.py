@@ -0,0 +1,338 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from preprocessing import *
+from registry import ModelRegistry, model_key, scaler_fingerprint
+from tensor_store import TensorStore
+
+def publish(output_dir, manifest):
+    '''
+    Atomically point output_dir/latest.json to a newly trained model version.
+
+    Parameters
+    ----------
+    output_dir : str
+        directory holding the model versions.
+    manifest : dict
+        description of the model version (paths, data window, target coordinate).
+    '''
+    latest_path = os.path.join(output_dir, 'latest.json')
+    tmp_path = latest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, latest_path)
+
+def load_latest(output_dir):
+    '''
+    Read the manifest of the latest published model version.
+
+    Parameters
+    ----------
+    output_dir : str
+        directory holding the model versions.
+
+    Returns
+    -------
+    dict
+        manifest of the latest model, None if no model has been published yet.
+    '''
+    latest_path = os.path.join(output_dir, 'latest.json')
+    if not os.path.exists(latest_path):
+        return None
+    with open(latest_path) as f:
+        return json.load(f)
+
+def train_snapshot(store_path, count, scaler, y_coordinate, reduced_size, output_dir, version, quantization = None, registry_root = None, topology = 'default', warm_start = None, replay_size = 1000):
+    '''
+    Train the full and reduced models on the first count matrices of the store and publish them.
+    Meant to run in a worker process: TensorFlow and LIME are only imported here.
+
+    Flows marked missing in the loss mask stored next to the matrices (see preprocessing.load_loss_mask) are never
+    trained on: matrices whose target flow is missing are dropped, and the other missing flows are holes (-1).
+
+    When warm_start is given, its models are fine-tuned on the matrices collected since it was trained, mixed with
+    a replay sample of the older ones, instead of being trained from random weights on the whole store.
+    Its reduced coordinate set is kept, which also skips the computation of the importances.
+
+    Parameters
+    ----------
+    store_path : str
+        path of the TensorStore (or .npy file) holding the collected matrices.
+    count : int
+        number of matrices in the snapshot.
+    scaler : object
+        fitted scaler, snapshotted by the controller at submission time.
+    y_coordinate : tuple
+        coordinate of the value to predict.
+    reduced_size : int
+        number of most relevant coordinates used by the reduced model.
+    output_dir : str
+        directory holding the model versions.
+    version : int
+        version number of the model to train.
+    quantization : str
+        optional quantization mode ('dynamic', 'float16' or 'int8') of the published inference model.
+        If None the float NumPy export is published.
+    registry_root : str
+        optional ModelRegistry directory to register the trained models in.
+    topology : str
+        name of the topology the matrices were collected on, part of the registry keys.
+    warm_start : dict
+        optional manifest of the previous model version to fine-tune.
+    replay_size : int
+        number of older matrices replayed when fine-tuning.
+
+    Returns
+    -------
+    dict
+        manifest of the published model version.
+    '''
+    from CNN import CNN
+    model_dir = os.path.join(output_dir, f'model_{version:06d}')
+    os.makedirs(model_dir, exist_ok=True)
+    save_scaler(scaler, os.path.join(model_dir, 'scaler.npz'))
+    start = 0 if warm_start is None else warm_start['count']
+    samples = load_tensor(store_path, start, count)
+    missing = load_loss_mask(store_path, start, count)
+    observed = None if missing is None else ~missing
+    if warm_start is not None:
+        # Only the new window is trained on, older matrices are replayed to avoid forgetting them
+        replay = scale_data(scaler, sample_tensor(store_path, replay_size, 0, start, seed=version), inplace=True)
+        if missing is not None:
+            # Same seed and range, hence the masks of the same matrices
+            replay = mask_unobserved(replay, ~sample_tensor(loss_mask_path(store_path), replay_size, 0, start, seed=version), y_coordinate)
+    mean, std = window_statistics(samples, observed)
+    np.savez(os.path.join(model_dir, 'statistics.npz'), mean=mean, std=std)
+    samples = mask_unobserved(scale_data(scaler, samples, inplace=True), observed, y_coordinate)
+    shape = samples.shape[1:]
+    x, y, tx, ty = process_data_vectorized(samples, y_coordinate, [y_coordinate])
+    if warm_start is not None:
+        rx, ry, _, _ = process_data_vectorized(replay, y_coordinate, [y_coordinate], 0)
+        cnn = CNN.load(warm_start['model'], y_coordinate)
+        cnn.fine_tune(x, y, tx, ty, os.path.join(model_dir, 'model.keras'), rx, ry)
+    else:
+        cnn = CNN(shape + (1,), y_coordinate)
+        cnn.train(x, y, tx, ty, os.path.join(model_dir, 'model.keras'))
+    if quantization is None:
+        lite_model = os.path.join(model_dir, 'model.npz')
+        cnn.export(lite_model)
+    else:
+        lite_model = os.path.join(model_dir, f'model_{quantization}.tflite')
+        cnn.quantize(lite_model, quantization, x)
+    side = int(reduced_size ** 0.5)
+    if warm_start is not None:
+        selected_coordinates = np.load(warm_start['coordinates_r'])
+        xr, yr, txr, tyr = process_data_reduced_vectorized(samples, y_coordinate, selected_coordinates)
+        rxr, ryr, _, _ = process_data_reduced_vectorized(replay, y_coordinate, selected_coordinates, 0)
+        cnnr = CNN.load(warm_start['model_r'], y_coordinate)
+        cnnr.fine_tune(xr, yr, txr, tyr, os.path.join(model_dir, 'model_r.keras'), rxr, ryr)
+    else:
+        sorted_coordinates = cnn.fast_lime(x, tx, os.path.join(model_dir, 'imp.npy'))
+        selected_coordinates = sorted_coordinates[-reduced_size:]
+        xr, yr, txr, tyr = process_data_reduced_vectorized(samples, y_coordinate, selected_coordinates)
+        cnnr = CNN((side, side, 1), y_coordinate)
+        cnnr.train(xr, yr, txr, tyr, os.path.join(model_dir, 'model_r.keras'))
+    np.save(os.path.join(model_dir, 'coordinates_r.npy'), selected_coordinates)
+    manifest = {
+        'version': version,
+        'count': count,
+        'input_shape': list(shape),
+        'target_coordinate': list(y_coordinate),
+        'model': os.path.join(model_dir, 'model.keras'),
+        'lite_model': lite_model,
+        'model_r': os.path.join(model_dir, 'model_r.keras'),
+        'coordinates_r': os.path.join(model_dir, 'coordinates_r.npy'),
+        'scaler': os.path.join(model_dir, 'scaler.npz'),
+        'statistics': os.path.join(model_dir, 'statistics.npz'),
+        'val_mae': cnn.evaluate(tx, ty)['mae'],
+        'warm_starts': warm_start.get('warm_starts', 0) + 1 if warm_start is not None else 0,
+    }
+    if registry_root is not None:
+        registry = ModelRegistry(registry_root)
+        fingerprint = scaler_fingerprint(scaler)
+        registry.put(model_key(topology, shape + (1,), y_coordinate, None, fingerprint), {'model': manifest['model'], 'lite_model': lite_model, 'scaler': manifest['scaler']}, scaler)
+        registry.put(model_key(topology, (side, side, 1), y_coordinate, selected_coordinates, fingerprint), {'model': manifest['model_r'], 'coordinates': manifest['coordinates_r'], 'scaler': manifest['scaler']}, scaler)
+        manifest['fingerprint'] = fingerprint
+    publish(output_dir, manifest)
+    return manifest
+
+def _window_drift(store_path, statistics_path, start, stop):
+    # Runs in the worker process, the window is read and reduced away from the controller event loop
+    missing = load_loss_mask(store_path, start, stop)
+    with np.load(statistics_path) as statistics:
+        return drift_score(statistics['mean'], statistics['std'], load_tensor(store_path, start, stop), None if missing is None else ~missing)
+
+class TrainingScheduler:
+    """
+    Schedules model training on snapshots of the tensor store in a separate process, so that the
+    controller event loop never blocks on TensorFlow.
+
+    At most one training job runs at a time, and a new one is only submitted once window new matrices
+    have been stored since the last trained snapshot. Finished models are published atomically through
+    `latest.json` in output_dir and handed back to the caller by poll.
+
+    Attributes
+    ----------
+    store_path : str
+        Path of the TensorStore holding the collected matrices.
+    output_dir : str
+        Directory holding the model versions.
+    window : int
+        Number of new matrices required before retraining.
+    y_coordinate : tuple
+        Coordinate of the value to predict.
+    reduced_size : int
+        Number of most relevant coordinates used by the reduced model.
+    quantization : str
+        Optional quantization mode of the published inference model.
+    registry : ModelRegistry
+        Optional registry the trained models are stored in. When set, the data range of the registered model
+        is compared with the scaler's (range check).
+    topology : str
+        Name of the topology the matrices are collected on.
+    drift_tolerance : float
+        Maximum relative drift of the data range for which the registered model is reused.
+    drift_threshold : float
+        If set, the drift_score of a new window with respect to the data the latest model was trained on is
+        compared with this threshold (drift check). The score is computed in the worker process.
+        With both checks enabled, a window triggers training when either of them detects drift,
+        and is skipped when neither does.
+    max_warm_starts : int
+        Number of consecutive fine-tunings of the latest model before training from scratch again, 0 disables warm starts.
+    replay_size : int
+        Number of older matrices replayed when fine-tuning.
+    latest : dict
+        Manifest of the latest published model, None if no model is available yet.
+
+    Methods
+    -------
+    maybe_submit(count, scaler)
+        Submit a training job if enough new data is available and no job is running.
+
+    poll()
+        Collect the result of a finished training job without blocking.
+
+    shutdown()
+        Stop the worker process.
+    """
+
+    def __init__(self, store_path, output_dir = 'snippets', window = 100, y_coordinate = (4,3), reduced_size = 25, quantization = None, registry = None, topology = 'default', drift_tolerance = 0.1, drift_threshold = None, max_warm_starts = 10, replay_size = 1000) -> None:
+        self.store_path = store_path
+        self.output_dir = output_dir
+        self.window = window
+        self.y_coordinate = y_coordinate
+        self.reduced_size = reduced_size
+        self.quantization = quantization
+        self.registry = registry
+        self.topology = topology
+        self.drift_tolerance = drift_tolerance
+        self.drift_threshold = drift_threshold
+        self.max_warm_starts = max_warm_starts
+        self.replay_size = replay_size
+        self.latest = load_latest(output_dir)
+        self.trained_count = self.latest['count'] if self.latest else 0
+        self.version = self.latest['version'] if self.latest else 0
+        self.future = None
+        self.drift_future = None
+        self.drift_stop = None
+        # spawn keeps the worker free of the controller's (monkey patched) state
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+    @property
+    def running(self):
+        """Whether a training job is in progress."""
+        return self.future is not None
+
+    def maybe_submit(self, count, scaler):
+        """
+        Submit a training job on the first count matrices if at least window new ones were stored
+        since the last trained snapshot and no job is already running. The job fine-tunes the latest model
+        unless it was already fine-tuned max_warm_starts times in a row.
+
+        When the range check passes and the drift check is enabled, the drift score of the window is first
+        computed in the worker process: the decision is taken by a later call, once the score is available.
+
+        Parameters
+        ----------
+        count : int
+            number of matrices currently in the store.
+        scaler : object
+            fitted scaler to snapshot for the job.
+
+        Returns
+        -------
+        bool
+            whether a job was submitted.
+        """
+        if self.running or scaler is None:
+            return False
+        if self.drift_future is not None:
+            if not self.drift_future.done():
+                return False
+            future, self.drift_future = self.drift_future, None
+            try:
+                score = future.result()
+            except Exception:
+                # A window whose drift cannot be measured is trained on
+                score = np.inf
+            if score <= self.drift_threshold:
+                # The window looks like the data the latest model was trained on, and its range did not drift
+                self.trained_count = self.drift_stop
+                return False
+            return self._submit(count, scaler)
+        if count - self.trained_count < self.window:
+            return False
+        range_drift = None
+        if self.registry is not None:
+            shape = TensorStore(self.store_path, mode='r').matrix_shape
+            key = model_key(self.topology, shape + (1,), self.y_coordinate)
+            range_drift = self.registry.needs_retrain(key, scaler, self.drift_tolerance)
+        if range_drift:
+            return self._submit(count, scaler)
+        if self.drift_threshold is not None and self.latest is not None and 'statistics' in self.latest:
+            # Reading and reducing the window is left to the idle worker, the caller's event loop never blocks on it
+            self.drift_stop = count
+            self.drift_future = self.executor.submit(_window_drift, self.store_path, self.latest['statistics'], self.trained_count, count)
+            return False
+        if range_drift is False:
+            # The registered model still fits the data, skip this window
+            self.trained_count = count
+            return False
+        return self._submit(count, scaler)
+
+    def _submit(self, count, scaler):
+        warm_start = None
+        if self.latest is not None and self.latest.get('warm_starts', 0) < self.max_warm_starts:
+            warm_start = self.latest
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.version += 1
+        self.future = self.executor.submit(train_snapshot, self.store_path, count, scaler, self.y_coordinate, self.reduced_size, self.output_dir, self.version, self.quantization, None if self.registry is None else self.registry.root, self.topology, warm_start, self.replay_size)
+        # trained_count only moves on once the job succeeds (see poll), a failed window is submitted again
+        return True
+
+    def poll(self):
+        """
+        Collect the result of a finished training job without blocking.
+        Exceptions raised by the job are re-raised here, and its window is trained on again by the next
+        maybe_submit call.
+
+        Returns
+        -------
+        dict
+            manifest of the newly published model, None if no job finished since the last call.
+        """
+        if self.future is None or not self.future.done():
+            return None
+        future, self.future = self.future, None
+        self.latest = future.result()
+        self.trained_count = self.latest['count']
+        return self.latest
+
+    def shutdown(self):
+        """
+        Stop the worker process, cancelling any pending job.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)